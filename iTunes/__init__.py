@@ -1,3 +1,9 @@
-from .library import Library, LibraryMerger
+from .artists import ArtistIndex, ArtistParser
+from .library import LazyLibrary, Library, LibraryDiff, LibraryMerger
 from .playlist import PlaylistAccessor
+from .profiler import Profiler
+from .search import SearchIndex
+from .synthetic import SyntheticLibrary
+from .tags import TagIndex
+from .tmm import TMMIndex
 from .utils import Utils
\ No newline at end of file
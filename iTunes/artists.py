@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import numpy as np
+import pandas as pd
+import re
+from typing import Iterable
+
+class ArtistIndex:
+    '''
+    The long-format table of the artists and their tracks. Each entry pairs a track position with an artist code, weighted by the number of artists of the track.
+    '''
+
+    def __init__(self: 'ArtistIndex', vocab: np.ndarray, rows: np.ndarray, codes: np.ndarray, counts: np.ndarray, length: int) -> None:
+        '''
+        Initiate an index from the artist dictionary, the track position and the artist code of each entry, the number of artists of the track of each entry, and the number of tracks.
+        '''
+
+        self.vocab = vocab
+        self.rows = rows
+        self.codes = codes
+        self.counts = counts
+        self.length = length
+
+    def __len__(self: 'ArtistIndex') -> int:
+        return len(self.codes)
+
+    def __repr__(self: 'ArtistIndex') -> str:
+        return f'iTunes Artist Index <{self.length} tracks, {len(self.vocab)} artists, {len(self.codes)} entries>'
+
+    __name__ = 'ArtistIndex'
+
+    @property
+    def weights(self: 'ArtistIndex') -> np.ndarray:
+        '''
+        The weight of each entry, i.e. `1 / len(artists)` of its track.
+        '''
+        return 1 / self.counts
+
+    @classmethod
+    def from_series(cls, s: pd.Series) -> 'ArtistIndex':
+        '''
+        Build an index from a series of artist lists or artist strings. Empty and missing values have no entries.
+        '''
+
+        def to_list(value) -> list[str]:
+            if isinstance(value, list):
+                return value
+            if isinstance(value, str) and value:
+                return [value]
+            return []
+
+        values = [to_list(x) for x in s.to_numpy(dtype = 'object')]
+        lengths = np.fromiter(map(len, values), dtype = 'int64', count = len(values))
+        artists = np.fromiter(chain.from_iterable(values), dtype = 'object', count = int(lengths.sum()))
+        codes, vocab = pd.factorize(artists)
+
+        return ArtistIndex(
+            np.asarray(vocab, dtype = 'object'),
+            np.repeat(np.arange(len(values), dtype = 'int64'), lengths),
+            codes.astype('int32'),
+            np.repeat(lengths, lengths),
+            len(values)
+        )
+
+    def chart(self: 'ArtistIndex', play_count: pd.Series, total_time: pd.Series) -> pd.DataFrame:
+        '''
+        Aggregate the weighted score and the occurance of each artist. Tracks missing the play count or the duration are left out of the score.
+        '''
+
+        # Weighted score = Σ_i^n (ArtistOccurance_i (=1 if present, =0 if not present) *  PlayCount_i * TotalTime_i / NumberOfArtists_i)
+        #                  where i is the index of the song in the dataframe, n is the number of songs.
+
+        play_count_values = pd.to_numeric(play_count).to_numpy(dtype = 'float64', na_value = np.nan)[self.rows]
+        seconds = pd.to_timedelta(total_time).dt.total_seconds().to_numpy(dtype = 'float64', na_value = np.nan)[self.rows]
+        valid = ~(np.isnan(play_count_values) | np.isnan(seconds))
+
+        valid_codes = self.codes[valid]
+        score = np.bincount(valid_codes, weights = (play_count_values * seconds / self.counts)[valid], minlength = len(self.vocab))
+        occurance = np.bincount(self.codes, minlength = len(self.vocab))
+
+        # Scored artists, in the order they first appear
+        scored, first = np.unique(valid_codes, return_index = True)
+        scored = scored[np.argsort(first, kind = 'stable')]
+
+        chart_df = pd.DataFrame({
+            'Artist': self.vocab[scored],
+            'Score': [round(x, 2) for x in score[scored].tolist()],
+            'Occurance': occurance[scored].astype('int64')
+        })
+        return chart_df.sort_values(['Score', 'Occurance'], ascending = False).reset_index(drop = True)
+
+    def mask(self: 'ArtistIndex', artists: Iterable[str]) -> np.ndarray:
+        '''
+        Whether each track features any of the artists.
+        '''
+
+        selected = pd.Index(self.vocab).isin(list(artists))
+        mask = np.zeros(self.length, dtype = 'bool')
+        mask[self.rows[selected[self.codes]]] = True
+        return mask
+
+    def to_series(self: 'ArtistIndex', name: str = 'Artist') -> pd.Series:
+        '''
+        The unique artists.
+        '''
+
+        return pd.Series(self.vocab, name = name, dtype = 'object').astype(str)
+
+class ArtistParser:
+    '''
+    The parser turning the artist field and the title of a track into its artist list. The patterns are compiled once, and each distinct (artist, title) pair is parsed once.
+    '''
+
+    non_artist = ('vip mix', 'vip remix', 'house remix', 'dance remix', 'night beat remix', 'remix', 'mix')
+    brackets = re.compile(r'[\[\(](.*?)[\]\)]')
+    feat_prefix = re.compile(r'^(feat\.?|with)\s+', flags = re.IGNORECASE)
+    feat_separator = re.compile(r',|&')
+    remix = re.compile(r'(.*?)\s+(?:' + '|'.join(non_artist) + r')', flags = re.IGNORECASE)
+
+    def __init__(self: 'ArtistParser', table: dict[str, str | list[str]] = {}, artists_with_comma: list[str] = [], detect_feat: bool = True) -> None:
+        '''
+        Initiate a parser from the artist mapping table, the artists whose names contain commas or ampersands, and whether to detect the featured artists in the titles.
+        '''
+
+        self.table = table
+        self.artists_with_comma = artists_with_comma
+        self.detect_feat = detect_feat
+        self.__splits__: dict[str, list[str]] = {}
+
+    def __repr__(self: 'ArtistParser') -> str:
+        return f'iTunes Artist Parser <{len(self.table)} mappings, {len(self.artists_with_comma)} protected artists>'
+
+    __name__ = 'ArtistParser'
+
+    def extract_feat_artist(self: 'ArtistParser', title: str) -> list[str]:
+        '''
+        Extract the featured and the remixing artists in the brackets of the title.
+        '''
+
+        feats = []
+        for match in self.brackets.finditer(title):
+            content = match.group(1)
+            check = content.lower().strip()
+            if 'feat' in check or 'with' in check:
+                cleaned = self.feat_prefix.sub('', content)
+                parts = self.feat_separator.split(cleaned)
+                feats.extend([p.strip() for p in parts if p.strip()])
+            elif any(word in check for word in self.non_artist):
+                remix_match = self.remix.match(content)
+                if remix_match:
+                    remix_artist = remix_match.group(1).strip()
+                    if remix_artist:
+                        feats.append(remix_artist)
+
+        return feats
+
+    def parse(self: 'ArtistParser', artist: str, title: str) -> list[str]:
+        '''
+        Parse the artist field and the title into the mapped, deduplicated artist list.
+        '''
+
+        main = self.split_artist(artist)
+        feat = self.extract_feat_artist(title) if self.detect_feat else []
+        mapped = []
+        for name in main + feat:
+            mapped_artist = self.table.get(name, name)
+            if isinstance(mapped_artist, list):
+                mapped.extend(mapped_artist)
+            else:
+                mapped.append(mapped_artist)
+
+        return list(dict.fromkeys(mapped))
+
+    def parse_pairs(self: 'ArtistParser', pairs: list[tuple[str, str]]) -> list[list[str]]:
+        '''
+        Parse the (artist, title) pairs.
+        '''
+
+        return [self.parse(artist, title) for artist, title in pairs]
+
+    def parse_series(self: 'ArtistParser', artists: pd.Series, titles: pd.Series, processes: int | None = None, chunksize: int = 10000) -> pd.Series:
+        '''
+        Parse the artist and the title columns. Fields that are already artist lists are kept. The distinct pairs are split into chunks among `processes` worker processes if specified.
+        '''
+
+        # The rows of each distinct pair
+        pending: dict[tuple[str, str], list[int]] = {}
+        result = np.empty(len(artists), dtype = 'object')
+        for i, (artist, title) in enumerate(zip(artists.to_numpy(dtype = 'object'), titles.to_numpy(dtype = 'object'))):
+            if isinstance(artist, str) and isinstance(title, str):
+                pending.setdefault((artist, title), []).append(i)
+            elif isinstance(artist, list):
+                result[i] = artist
+            else:
+                raise ValueError('The artist field must be strings or list of strings.')
+
+        pairs = list(pending)
+        if processes is not None and processes > 1 and len(pairs) > chunksize:
+            with ProcessPoolExecutor(processes) as pool:
+                parsed = list(chain.from_iterable(pool.map(self.parse_pairs, [pairs[i:i + chunksize] for i in range(0, len(pairs), chunksize)])))
+        else:
+            parsed = self.parse_pairs(pairs)
+
+        # Each row owns its list, as if parsed on its own
+        for artist_list, rows in zip(parsed, pending.values()):
+            for i in rows:
+                result[i] = list(artist_list)
+
+        return pd.Series(result, index = artists.index, name = artists.name, dtype = 'object')
+
+    def protect_comma(self: 'ArtistParser', artist: str) -> str:
+        '''
+        Mask the commas and the ampersands in the names of the protected artists.
+        '''
+
+        for case in self.artists_with_comma:
+            artist = artist.replace(case, case.replace('&', '<AMPERSAND>'))
+            artist = artist.replace(case, case.replace(',', '<COMMA>'))
+        return artist
+
+    def split_artist(self: 'ArtistParser', artist: str) -> list[str]:
+        '''
+        Split the artist field by commas and ampersands. Each distinct field is split once.
+        '''
+
+        if artist not in self.__splits__:
+            artist_str = self.protect_comma(artist).replace(' & ', ', ')
+            self.__splits__[artist] = [name.strip().replace('<AMPERSAND>', '&').replace('<COMMA>', ',') for name in artist_str.split(',')]
+        return list(self.__splits__[artist])
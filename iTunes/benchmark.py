@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+from .library import Library, LibraryDiff, LibraryMerger
+from .playlist import PlaylistAccessor
+from .synthetic import SyntheticLibrary
+from .tmm import TMMIndex
+from .utils import Utils
+import argparse
+import datetime
+import gc
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Iterable
+
+class Benchmark:
+    '''
+    The benchmark suite, timing and memory-profiling the public entry points on synthetic libraries. Each case also records the digest of its result, so a faster run giving a different answer is caught when compared with the baseline.
+
+    Run `python -m iTunes.benchmark --help` for the command line, which appends the results to a JSON Lines file and compares the labeled runs.
+    '''
+
+    cases = [
+        'Library.from_xml', 'Library.from_msgpack', 'Library.from_excel', 'Utils.clean_tagged_excel',
+        'Library.nested_artists', 'Library.merge', 'Library.merge_many', 'LibraryMerger.propose',
+        'Library.diff', 'Library.refresh', 'Library.search', 'Library.fuzzy_match', 'Library.artist_chart',
+        'TMMIndex.from_csv', 'Utils.match_tmm_data', 'Utils.apply_map', 'PlaylistAccessor.to_dataframe',
+        'Library.to_csv', 'Library.to_dataframe', 'Library.to_excel', 'Library.to_msgpack'
+    ]
+
+    # The cases reading the Microsoft Excel file, which takes a while to write for large libraries
+    excel_cases = ['Library.from_excel', 'Utils.clean_tagged_excel']
+
+    # The cases finding something at any size, so an empty result is a failure rather than a fast run
+    found_cases = ['Library.fuzzy_match', 'Library.search', 'LibraryMerger.propose']
+
+    def __init__(self: 'Benchmark',
+                 directory: str | os.PathLike[str],
+                 sizes: Iterable[int] = (10000,),
+                 seed: int = 0,
+                 repeat: int = 3,
+                 memory: bool = True,
+                 label: str | None = None,
+                 check: bool = True) -> None:
+        '''
+        Initiate a benchmark of the libraries of `sizes` tracks, whose files are generated once into `directory`. Each case takes the best time of `repeat` runs, and one more run traces the peak memory if `memory` is set. The result of each case is digested (see `digest`) if `check` is set. The results are labeled by `label`, the current commit by default.
+        '''
+
+        if repeat < 1:
+            raise ValueError('The `repeat` should be a positive integer.')
+
+        self.directory = os.fspath(directory)
+        self.sizes = list(sizes)
+        self.seed = seed
+        self.repeat = repeat
+        self.memory = memory
+        self.check = check
+        self.commit = self._commit()
+        self.label = label or self.commit or 'unknown'
+
+    def __repr__(self: 'Benchmark') -> str:
+        return f'iTunes Benchmark <{", ".join(map(str, self.sizes))} tracks, {self.repeat} runs>'
+
+    __name__ = 'Benchmark'
+
+    @classmethod
+    def compare(cls, results: pd.DataFrame, baseline: str, candidate: str) -> pd.DataFrame:
+        '''
+        Compare the seconds, the peak memory, and the result digests of two labeled runs for each size and case both runs have. The ratios above 1 are regressions, and `Same Result` is `False` where the candidate answers differently (missing where either run has no digest).
+        '''
+
+        for label in (baseline, candidate):
+            if label not in set(results['Label']):
+                raise ValueError(f'No results labeled `{label}`.')
+
+        # The latest result of a label wins
+        latest = results.drop_duplicates(['Label', 'Size', 'Case'], keep = 'last')
+        if 'Digest' not in latest.columns:
+            latest = latest.assign(Digest = None)
+        selected = latest[latest['Label'].isin([baseline, candidate])]
+        pivot = selected.pivot(index = ['Size', 'Case'], columns = 'Label', values = ['Seconds', 'Peak MB']).astype('float64')
+        digests = selected.pivot(index = ['Size', 'Case'], columns = 'Label', values = 'Digest').reindex(columns = [baseline, candidate])
+
+        known = digests[baseline].notna() & digests[candidate].notna()
+        same = pd.Series(pd.NA, index = digests.index, dtype = 'boolean')
+        same[known] = digests.loc[known, baseline] == digests.loc[known, candidate]
+
+        return pd.DataFrame({
+            'Baseline Seconds': pivot[('Seconds', baseline)],
+            'Candidate Seconds': pivot[('Seconds', candidate)],
+            'Time Ratio': (pivot[('Seconds', candidate)] / pivot[('Seconds', baseline)]).round(3),
+            'Baseline Peak MB': pivot[('Peak MB', baseline)],
+            'Candidate Peak MB': pivot[('Peak MB', candidate)],
+            'Memory Ratio': (pivot[('Peak MB', candidate)] / pivot[('Peak MB', baseline)]).round(3),
+            'Same Result': same
+        }).dropna(subset = ['Baseline Seconds', 'Candidate Seconds'])
+
+    @classmethod
+    def digest(cls, result: Any) -> str:
+        '''
+        Digest a result by its content, so the equal answers of different versions match: a library by its frame, a merge result and a diff by their parts, and a frame by its columns and values in order, regardless of the index and the dtypes. The sets are compared as sorted, the missing values as one, and the floats to 10 significant digits.
+        '''
+
+        h = hashlib.sha256()
+        for part in cls._parts(result):
+            if isinstance(part, pd.Series):
+                part = part.to_frame()
+            if isinstance(part, pd.DataFrame):
+                h.update(json.dumps(['frame', [str(col) for col in part.columns], len(part)]).encode('utf-8'))
+                for col in range(part.shape[1]):
+                    values = [cls._canonical(x) for x in part.iloc[:, col].to_numpy(dtype = 'object')]
+                    h.update(json.dumps(values, ensure_ascii = False).encode('utf-8'))
+            else:
+                h.update(json.dumps(cls._canonical(part), ensure_ascii = False).encode('utf-8'))
+        return h.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, path: str | os.PathLike[str]) -> pd.DataFrame:
+        '''
+        Read the saved results.
+        '''
+        return pd.read_json(path, lines = True, dtype = {'Label': str, 'Commit': str})
+
+    @classmethod
+    def save(cls, results: pd.DataFrame, path: str | os.PathLike[str]) -> None:
+        '''
+        Append the results to a JSON Lines file, so the runs of different versions accumulate.
+        '''
+
+        with open(path, 'a', encoding = 'utf-8') as f:
+            f.write(results.to_json(orient = 'records', lines = True, force_ascii = False))
+
+    def prepare(self: 'Benchmark', size: int, formats: list[str]) -> dict[str, str]:
+        '''
+        Write the synthetic files of a size in the given formats, unless they were written before with the same parameters. Return their paths.
+        '''
+
+        directory = os.path.join(self.directory, f'{size}-{self.seed}')
+        manifest_path = os.path.join(directory, 'manifest.json')
+        manifest: dict[str, Any] = {'tracks': size, 'seed': self.seed, 'version': SyntheticLibrary.version, 'paths': {}, 'formats': []}
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r', encoding = 'utf-8') as f:
+                saved = json.load(f)
+            if saved.get('tracks') == size and saved.get('seed') == self.seed and saved.get('version') == SyntheticLibrary.version and all(os.path.isfile(p) for p in saved['paths'].values()):
+                manifest = saved
+
+        missing = [fmt for fmt in formats if fmt not in manifest['formats']]
+        if missing:
+            manifest['paths'].update(SyntheticLibrary(size, self.seed).write(directory, missing))
+            manifest['formats'].extend(missing)
+            with open(manifest_path, 'w', encoding = 'utf-8') as f:
+                json.dump(manifest, f, ensure_ascii = False, indent = 2)
+
+        return manifest['paths']
+
+    def run(self: 'Benchmark', cases: Iterable[str] | None = None) -> pd.DataFrame:
+        '''
+        Run the cases (all by default) on each size. Return a row per size and case, with the best seconds, the peak traced memory in MB, the rows, and the digest of the result. A case of `found_cases` finding nothing raises an error.
+        '''
+
+        selected = list(self.cases if cases is None else cases)
+        for case in selected:
+            if case not in self.cases:
+                raise ValueError(f'Unknown case: {case}')
+
+        formats = ['xml', 'msgpack', 'prev', 'tmm', 'playlist', 'yaml']
+        if any(case in self.excel_cases for case in selected):
+            formats.append('excel')
+
+        records = []
+        for size in self.sizes:
+            paths = self.prepare(size, formats)
+            synthetic = SyntheticLibrary(size, self.seed)
+
+            with tempfile.TemporaryDirectory(dir = self.directory) as out:
+                calls = self._calls(paths, synthetic, out)
+                for case in selected:
+                    call, outcome = calls[case] if isinstance(calls[case], tuple) else (calls[case], None)
+                    seconds, peak, rows, digest = self._measure(call, outcome)
+                    if case in self.found_cases and not rows:
+                        raise ValueError(f'The `{case}` case found nothing for {size} tracks.')
+                    records.append({
+                        'Label': self.label,
+                        'Commit': self.commit,
+                        'Date': pd.Timestamp.now().isoformat(timespec = 'seconds'),
+                        'Size': size,
+                        'Case': case,
+                        'Seconds': round(seconds, 4),
+                        'Peak MB': None if peak is None else round(peak / 2 ** 20, 2),
+                        'Rows': rows,
+                        'Digest': digest
+                    })
+
+        return pd.DataFrame(records).astype({'Rows': 'Int64'})
+
+    @classmethod
+    def _canonical(cls, value: Any) -> Any:
+        if value is None or value is pd.NaT or value is pd.NA:
+            return None
+        if isinstance(value, (bool, np.bool_)):
+            return bool(value)
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        if isinstance(value, (float, np.floating)):
+            if np.isnan(value):
+                return None
+            return int(value) if float(value).is_integer() else float(f'{value:.10g}')
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (set, frozenset)):
+            return sorted((cls._canonical(x) for x in value), key = repr)
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [cls._canonical(x) for x in value]
+        if isinstance(value, dict):
+            return sorted(([str(k), cls._canonical(v)] for k, v in value.items()), key = repr)
+        if isinstance(value, (pd.Timestamp, datetime.datetime, np.datetime64)):
+            return pd.Timestamp(value).isoformat()
+        if isinstance(value, (pd.Timedelta, datetime.timedelta, np.timedelta64)):
+            return pd.Timedelta(value).isoformat()
+        return str(value)
+
+    @staticmethod
+    def _parts(result: Any) -> list[Any]:
+        # The parts of the merge results, where the proposals only count when made, as the earlier versions have none
+        if isinstance(result, Library):
+            return [result.__df__]
+        if isinstance(result, LibraryMerger):
+            parts = [result.matched, result.next_only, result.prev_only]
+            proposed = getattr(result, 'proposed', None)
+            return parts + ([proposed] if proposed is not None and len(proposed) > 0 else [])
+        if isinstance(result, LibraryDiff):
+            return [result.added, result.removed, result.changed]
+        if isinstance(result, tuple):
+            return [part for x in result for part in Benchmark._parts(x)]
+        return [result]
+
+    def _calls(self: 'Benchmark', paths: dict[str, str], synthetic: SyntheticLibrary, out: str) -> dict[str, Callable[[], Any] | tuple[Callable[[], Any], Callable[[], Any]]]:
+        '''
+        The calls of the cases, sharing the data loaded once. Each call starts from a fresh library, so no cached index is reused across runs. The exporters come with the reading of their outputs, which is digested instead of their results.
+        '''
+
+        frame = Library.from_msgpack(paths['msgpack']).__df__
+        prev = Library.from_msgpack(paths['prev']).__df__
+        artist_map = Utils.read_yaml(paths['artist_map'])
+        name_map = Utils.read_yaml(paths['name_map'])
+        escape = synthetic.artists_with_comma
+        nested = Library(frame).nested_artists(artist_map, escape).__df__
+        # The exporters write the tagged library, as cleaned by the demos
+        cleaned = Library(synthetic.data).nested_artists(artist_map, escape).__df__
+        tagged = synthetic.tagged
+        index = TMMIndex.from_csv(paths['tmm'], escape, cache = False)
+        _, unmatched = Utils.match_tmm_data(index, tagged, escape)
+
+        # The renamed tracks are left unmatched without the name map, for the proposals to pair the misspelled ones
+        unnamed = Library.merge(Library(prev), Library(frame), artist_map, escape)
+        queries = prev['Name'].iloc[::max(1, len(prev) // 1000)].tolist()
+
+        def refresh() -> Library:
+            lib = Library(prev)
+            lib.refresh(paths['xml'])
+            return lib
+
+        def output(name: str) -> str:
+            return os.path.join(out, name)
+
+        return {
+            'Library.from_xml': lambda: Library.from_xml(paths['xml']),
+            'Library.from_msgpack': lambda: Library.from_msgpack(paths['msgpack']),
+            'Library.from_excel': lambda: Library.from_excel(paths['excel'], 0, cache = False),
+            'Utils.clean_tagged_excel': lambda: Utils.clean_tagged_excel(paths['excel'], cache = False),
+            'Library.nested_artists': lambda: Library(frame).nested_artists(artist_map, escape),
+            'Library.merge': lambda: Library.merge(Library(prev), Library(frame), artist_map, escape, name_map),
+            'Library.merge_many': lambda: Library.merge_many([Library(prev), Library(frame)], artist_map, escape, name_map),
+            'LibraryMerger.propose': lambda: LibraryMerger(unnamed.matched, unnamed.next_only, unnamed.prev_only).propose(),
+            'Library.diff': lambda: Library(prev).diff(Library(frame)),
+            'Library.refresh': refresh,
+            'Library.search': lambda: Library(frame).search(synthetic.words[0], limit = 100),
+            'Library.fuzzy_match': lambda: Library(frame).fuzzy_match(queries, limit = 3),
+            'Library.artist_chart': lambda: Library(nested).artist_chart(),
+            'TMMIndex.from_csv': lambda: TMMIndex.from_csv(paths['tmm'], escape, cache = False),
+            'Utils.match_tmm_data': lambda: Utils.match_tmm_data(index, tagged, escape),
+            'Utils.apply_map': lambda: Utils.apply_map(unmatched, paths['tmm_map'], index),
+            'PlaylistAccessor.to_dataframe': lambda: PlaylistAccessor(paths['playlist']).to_dataframe(),
+            'Library.to_csv': (
+                lambda: Library(cleaned).to_csv(output('lib.csv')),
+                lambda: pd.read_csv(output('lib.csv'), dtype = str, keep_default_na = False)
+            ),
+            'Library.to_dataframe': lambda: Library(cleaned).to_dataframe(),
+            'Library.to_excel': (
+                lambda: Library(cleaned).to_excel(output('lib.xlsx')),
+                lambda: pd.read_excel(output('lib.xlsx'), dtype = object)
+            ),
+            'Library.to_msgpack': (
+                lambda: Library(cleaned).to_msgpack(output('lib.msgpack')),
+                lambda: Library.from_msgpack(output('lib.msgpack'))
+            )
+        }
+
+    @staticmethod
+    def _commit() -> str | None:
+        try:
+            done = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, timeout = 10)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return done.stdout.strip() or None
+
+    def _measure(self: 'Benchmark', call: Callable[[], Any], outcome: Callable[[], Any] | None = None) -> tuple[float, int | None, int | None, str | None]:
+        '''
+        The best seconds of the runs, the peak traced memory of one more run, the rows of the result, and the digest of the result (or of the `outcome`, e.g. the file written) if checked.
+        '''
+
+        best = float('inf')
+        result = None
+        for _ in range(self.repeat):
+            result = None
+            gc.collect()
+            start = time.perf_counter()
+            result = call()
+            best = min(best, time.perf_counter() - start)
+
+        rows = self._rows(result)
+        digest = None
+        if self.check:
+            digest = self.digest(result if outcome is None else outcome())
+
+        peak = None
+        if self.memory:
+            result = None
+            gc.collect()
+            tracemalloc.start()
+            try:
+                call()
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+        return best, peak, rows, digest
+
+    @staticmethod
+    def _rows(result: Any) -> int | None:
+        if isinstance(result, tuple):
+            return sum(len(x) for x in result if hasattr(x, '__len__'))
+        if isinstance(result, Library):
+            return len(result.__df__)
+        if hasattr(result, 'matched'):
+            return len(result.matched)
+        if hasattr(result, '__len__'):
+            return len(result)
+        return None
+
+def report(comparison: pd.DataFrame) -> None:
+    '''
+    Print a comparison, and exit with an error if any case answers differently.
+    '''
+
+    print(comparison)
+    differ = comparison.index[comparison['Same Result'].eq(False).fillna(False).to_numpy(dtype = 'bool')]
+    if len(differ) > 0:
+        print(f'{len(differ)} case(s) give different results: ' + ', '.join(f'{case} ({size})' for size, case in differ), file = sys.stderr)
+        sys.exit(1)
+
+def main(argv: list[str] | None = None) -> None:
+    '''
+    Run the benchmark from the command line.
+    '''
+
+    parser = argparse.ArgumentParser(prog = 'python -m iTunes.benchmark', description = 'Benchmark the iTunes package on synthetic libraries.')
+    parser.add_argument('--dir', default = 'bench', help = 'the directory of the synthetic files and the results (default: bench)')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [10000], help = 'the numbers of tracks (default: 10000)')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--repeat', type = int, default = 3, help = 'the runs per case, of which the best is kept (default: 3)')
+    parser.add_argument('--cases', nargs = '+', choices = Benchmark.cases, metavar = 'CASE', help = 'the cases to run, e.g. Library.merge (default: all)')
+    parser.add_argument('--no-memory', action = 'store_true', help = 'skip the memory tracing run')
+    parser.add_argument('--no-check', action = 'store_true', help = 'skip the digests of the results')
+    parser.add_argument('--label', help = 'the label of the results (default: the current commit)')
+    parser.add_argument('--out', help = 'the JSON Lines file the results are appended to (default: <dir>/results.jsonl)')
+    parser.add_argument('--compare', nargs = 2, metavar = ('BASELINE', 'CANDIDATE'), help = 'compare two labeled runs in the results instead')
+    parser.add_argument('--against', metavar = 'BASELINE', help = 'compare the run with a labeled run in the results')
+    args = parser.parse_args(argv)
+
+    out = args.out or os.path.join(args.dir, 'results.jsonl')
+    with pd.option_context('display.max_rows', None, 'display.max_columns', None, 'display.width', 200):
+        if args.compare:
+            report(Benchmark.compare(Benchmark.load(out), *args.compare))
+            return
+
+        os.makedirs(args.dir, exist_ok = True)
+        bench = Benchmark(args.dir, args.sizes, args.seed, args.repeat, not args.no_memory, args.label, not args.no_check)
+        results = bench.run(args.cases)
+        Benchmark.save(results, out)
+        print(results[['Size', 'Case', 'Seconds', 'Peak MB', 'Rows', 'Digest']].to_string(index = False))
+
+        if args.against:
+            report(Benchmark.compare(Benchmark.load(out), args.against, bench.label))
+
+if __name__ == '__main__':
+    main()
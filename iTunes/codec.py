@@ -0,0 +1,439 @@
+from __future__ import annotations
+
+from itertools import chain
+import mmap
+import msgpack
+from numpy import nan
+import numpy as np
+import os
+import pandas as pd
+import struct
+from typing import Any, BinaryIO, Callable, Iterable
+
+class Codec:
+    '''
+    The codec of the message pack file.
+    '''
+
+    format = 'iTunes.Library'
+    magic = b'iTunesLB'
+    version = 2
+
+    raw_buffers = {'data', 'codes', 'lengths', 'items'}
+    packed_buffers = {'vocab', 'values'}
+
+    @classmethod
+    def decode(cls, obj: dict[str, Any]) -> pd.DataFrame:
+        '''
+        Decode a version 1 columnar message pack object into a DataFrame.
+        '''
+
+        if obj.get('format') != cls.format:
+            raise ValueError('The message pack file is not an iTunes library.')
+
+        if obj.get('version') != 1:
+            raise ValueError(f'The message pack object is version {obj.get("version")}, while only version 1 is stored as a single object.')
+
+        columns = [cls.decode_column(col) for col in obj['columns']]
+        if len(columns) == 0:
+            return pd.DataFrame(index = pd.RangeIndex(obj['length']))
+
+        return pd.concat(columns, axis = 1)
+
+    @classmethod
+    def decode_column(cls, col: dict[str, Any], rows: np.ndarray | None = None) -> pd.Series:
+        '''
+        Decode a column, optionally only the positions in `rows`.
+        '''
+
+        def take(values: np.ndarray) -> np.ndarray:
+            return values if rows is None else values[rows]
+
+        name = col['name']
+
+        match col['kind']:
+            case 'array':
+                values = np.frombuffer(col['data'], dtype = np.dtype(col['dtype']))
+                return pd.Series(values.copy() if rows is None else values[rows], name = name)
+
+            case 'str':
+                table = cls._table(col['vocab'])
+                return pd.Series(table[take(cls._codes(col['codes']))], name = name, dtype = 'object')
+
+            case 'list' | 'set' | 'tuple':
+                constructor = {'list': list, 'set': set, 'tuple': tuple}[col['kind']]
+                items = cls._table(col['vocab'])[cls._codes(col['items'])].tolist()
+                offsets = np.concatenate([[0], np.cumsum(cls._codes(col['lengths']))]).tolist()
+
+                uniques = np.empty(len(offsets) + 1, dtype = 'object')
+                for i in range(len(offsets) - 1):
+                    uniques[i] = constructor(items[offsets[i]:offsets[i + 1]])
+                uniques[-2] = None
+                uniques[-1] = nan
+
+                # Each row gets its own copy of the mutable sequences
+                values = uniques[take(cls._codes(col['codes']))]
+                if constructor is not tuple:
+                    values = [x.copy() if isinstance(x, (list, set)) else x for x in values]
+                return pd.Series(values, name = name, dtype = 'object')
+
+            case 'object':
+                values = col['values'] if rows is None else [col['values'][i] for i in rows]
+                return pd.Series([cls.unpack_value(v) for v in values], name = name, dtype = 'object')
+
+            case _:
+                raise ValueError(f'Unknown column kind `{col["kind"]}` in the message pack file.')
+
+    @classmethod
+    def decode_records(cls, records: list[dict[str, Any]]) -> pd.DataFrame:
+        '''
+        Decode a legacy, row-oriented message pack object into a DataFrame.
+        '''
+
+        df = pd.DataFrame([cls.unpack_value(row) for row in records])
+
+        type_dict = {
+            'Track ID': 'int64',
+            'Year': 'int64',
+            'Date Modified': 'datetime64',
+            'Date Added': 'datetime64',
+            'Play Count': 'int64',
+            'Size': 'int64',
+            'Total Time': 'timedelta64'
+        }
+
+        for col in df.columns:
+            match type_dict.get(col):
+                case 'int64':
+                    df[col] = pd.to_numeric(df[col])
+
+                case 'datetime64':
+                    df[col] = pd.to_datetime(df[col])
+
+                case 'timedelta64':
+                    df[col] = pd.to_timedelta(df[col])
+
+                case _:
+                    pass
+
+        return df
+
+    @classmethod
+    def dump(cls, df: pd.DataFrame, fp: BinaryIO, meta: dict[str, Any] | None = None) -> None:
+        '''
+        Write a DataFrame as a columnar file: the aligned column buffers, then the footer indexing them along with the `meta` data.
+        '''
+
+        fp.write(cls.magic)
+        offset = len(cls.magic)
+        columns = []
+
+        for i, name in enumerate(df.columns):
+            col = cls.encode_column(df.iloc[:, i], str(name))
+            entry: dict[str, Any] = {'buffers': {}}
+
+            for key, value in col.items():
+                if key in cls.raw_buffers:
+                    payload = value
+                elif key in cls.packed_buffers:
+                    payload = msgpack.packb(value, use_bin_type = True)
+                else:
+                    entry[key] = value
+                    continue
+
+                # Keep the raw arrays aligned, so they can be viewed in place
+                padding = -offset % 8
+                fp.write(b'\0' * padding)
+                offset += padding
+
+                fp.write(payload)
+                entry['buffers'][key] = [offset, len(payload)]
+                offset += len(payload)
+
+            columns.append(entry)
+
+        footer = msgpack.packb({
+            'format': cls.format,
+            'version': cls.version,
+            'length': len(df),
+            'columns': columns,
+            'meta': meta or {}
+        }, use_bin_type = True)
+        fp.write(footer)
+        fp.write(struct.pack('<Q', len(footer)) + cls.magic)
+
+    @classmethod
+    def encode_column(cls, s: pd.Series, name: str) -> dict[str, Any]:
+        '''
+        Encode a column. Numeric and temporal columns are stored as raw arrays, and the strings, lists, sets, and tuples are dictionary-encoded.
+        '''
+
+        if isinstance(s.dtype, np.dtype) and s.dtype.kind in 'biufcmM':
+            values = np.ascontiguousarray(s.to_numpy())
+            return {'name': name, 'kind': 'array', 'dtype': values.dtype.str, 'data': values.tobytes()}
+
+        values = s.to_numpy(dtype = 'object')
+        na = pd.isna(values)
+        none = np.equal(values, None)
+        types = set(map(type, values[~na]))
+
+        if types <= {str}:
+            codes, uniques = pd.factorize(values)
+            return {'name': name, 'kind': 'str', 'codes': cls._null_codes(codes, none), 'vocab': uniques.tolist()}
+
+        for kind, sequence, key in [('list', list, tuple), ('set', set, frozenset), ('tuple', tuple, tuple)]:
+            if types != {sequence}:
+                continue
+
+            # Rows sharing one object are keyed once
+            object_codes, _ = pd.factorize(np.fromiter(map(id, values), dtype = 'uint64', count = len(values)))
+            _, first = np.unique(object_codes, return_index = True)
+            keys = np.fromiter((key(x) if not n else x for x, n in zip(values[first], na[first])), dtype = 'object', count = len(first))
+            key_codes, uniques = pd.factorize(keys)
+            codes = key_codes[object_codes]
+            lengths = np.fromiter(map(len, uniques), dtype = 'int64', count = len(uniques))
+            items = np.fromiter(chain.from_iterable(uniques), dtype = 'object', count = int(lengths.sum()))
+
+            items_na = pd.isna(items)
+            if not set(map(type, items[~items_na])) <= {str} or np.equal(items, None).any():
+                break
+
+            item_codes, vocab = pd.factorize(items)
+            return {
+                'name': name,
+                'kind': kind,
+                'codes': cls._null_codes(codes, none),
+                'lengths': lengths.astype('int32').tobytes(),
+                'items': item_codes.astype('int32').tobytes(),
+                'vocab': vocab.tolist()
+            }
+
+        return {'name': name, 'kind': 'object', 'values': [cls.pack_value(v) for v in values]}
+
+    @classmethod
+    def filter(cls,
+               df: pd.DataFrame,
+               columns: Iterable[str] | None = None,
+               where: dict[str, Callable[[pd.Series], Any]] | None = None) -> pd.DataFrame:
+        '''
+        Project the columns and keep the rows satisfying every predicate in `where`.
+        '''
+
+        for col in list(columns or []) + list(where or {}):
+            if col not in df.columns:
+                raise ValueError(f'The `{col}` column doesn\'t exist.')
+
+        if where:
+            df = df[cls.mask(len(df), {col: df[col] for col in where}, where)].reset_index(drop = True)
+
+        if columns is not None:
+            df = df[list(columns)]
+
+        return df
+
+    @classmethod
+    def mask(cls,
+             length: int,
+             data: dict[str, pd.Series],
+             where: dict[str, Callable[[pd.Series], Any]]) -> np.ndarray:
+        '''
+        Evaluate the row predicates into a boolean mask.
+        '''
+
+        mask = np.ones(length, dtype = 'bool')
+        for col, predicate in where.items():
+            mask &= np.asarray(predicate(data[col]), dtype = 'bool')
+        return mask
+
+    @classmethod
+    def pack_value(cls, obj: Any) -> Any:
+        '''
+        Convert a value into a message pack compatible object.
+        '''
+
+        if isinstance(obj, dict):
+            return {k: cls.pack_value(v) for k, v in obj.items()}
+
+        if isinstance(obj, list):
+            return [cls.pack_value(v) for v in obj]
+
+        if isinstance(obj, type(pd.NA)) or isinstance(obj, type(pd.NaT)):
+            return None
+
+        if isinstance(obj, pd.Timestamp):
+            return obj.isoformat()
+
+        if isinstance(obj, pd.Timedelta):
+            return str(obj)
+
+        if isinstance(obj, set):
+            return {'__set__': list(obj)}
+
+        if isinstance(obj, np.generic):
+            return obj.item()
+
+        return obj
+
+    @classmethod
+    def unpack_value(cls, obj: Any) -> Any:
+        '''
+        Restore a value from a message pack compatible object.
+        '''
+
+        if isinstance(obj, dict):
+            if '__set__' in obj:
+                return {cls.unpack_value(v) for v in obj['__set__']}
+
+            return {k: cls.unpack_value(v) for k, v in obj.items()}
+
+        if isinstance(obj, list):
+            return [cls.unpack_value(v) for v in obj]
+
+        return obj
+
+    @staticmethod
+    def _codes(data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype = 'int32')
+
+    @staticmethod
+    def _null_codes(codes: np.ndarray, none: np.ndarray) -> bytes:
+        # -1 marks the missing values, and -2 marks `None` specifically
+        codes = codes.astype('int32')
+        codes[none] = -2
+        return codes.tobytes()
+
+    @staticmethod
+    def _table(vocab: list[Any]) -> np.ndarray:
+        # The trailing slots resolve the codes -2 and -1
+        table = np.empty(len(vocab) + 2, dtype = 'object')
+        table[:len(vocab)] = vocab
+        table[-2] = None
+        table[-1] = nan
+        return table
+
+class ColumnarFile:
+    '''
+    The memory-mapped columnar message pack file. Only the footer is read on opening, and each column is decoded on demand.
+    '''
+
+    def __init__(self: 'ColumnarFile', path: str | bytes | os.PathLike[str]) -> None:
+        '''
+        Open a columnar file.
+        '''
+
+        self.__file__ = open(path, 'rb')
+
+        try:
+            size = os.fstat(self.__file__.fileno()).st_size
+            trailer = len(Codec.magic) + 8
+            if size < len(Codec.magic) + trailer:
+                raise ValueError('The file is not a columnar message pack file.')
+
+            self.__mmap__ = mmap.mmap(self.__file__.fileno(), 0, access = mmap.ACCESS_READ)
+            if self.__mmap__[:len(Codec.magic)] != Codec.magic or self.__mmap__[-len(Codec.magic):] != Codec.magic:
+                raise ValueError('The file is not a columnar message pack file.')
+
+            footer_size = struct.unpack('<Q', self.__mmap__[-trailer:-len(Codec.magic)])[0]
+            footer = msgpack.unpackb(self.__mmap__[-trailer - footer_size:-trailer], raw = False)
+
+        except Exception:
+            self.close()
+            raise
+
+        if footer.get('format') != Codec.format:
+            self.close()
+            raise ValueError('The message pack file is not an iTunes library.')
+
+        if footer.get('version', 0) > Codec.version:
+            self.close()
+            raise ValueError(f'The message pack file is version {footer.get("version")}, while the supported version is up to {Codec.version}.')
+
+        self.length: int = footer['length']
+        self.meta: dict[str, Any] = footer.get('meta', {})
+        self.__columns__: dict[str, dict[str, Any]] = {col['name']: col for col in footer['columns']}
+
+    def __enter__(self: 'ColumnarFile') -> 'ColumnarFile':
+        return self
+
+    def __exit__(self: 'ColumnarFile', *args) -> None:
+        self.close()
+
+    def __len__(self: 'ColumnarFile') -> int:
+        return self.length
+
+    def __repr__(self: 'ColumnarFile') -> str:
+        return f'iTunes Columnar File <{self.length} tracks, {len(self.__columns__)} columns>'
+
+    __name__ = 'ColumnarFile'
+
+    @property
+    def columns(self: 'ColumnarFile') -> list[str]:
+        '''
+        The stored columns.
+        '''
+        return list(self.__columns__)
+
+    @classmethod
+    def is_columnar(cls, path: str | bytes | os.PathLike[str]) -> bool:
+        '''
+        Verify whether the file starts as a columnar message pack file.
+        '''
+
+        with open(path, 'rb') as f:
+            return f.read(len(Codec.magic)) == Codec.magic
+
+    def close(self: 'ColumnarFile') -> None:
+        '''
+        Close the file.
+        '''
+
+        if getattr(self, '__mmap__', None) is not None:
+            self.__mmap__.close()
+            self.__mmap__ = None
+        self.__file__.close()
+
+    def read(self: 'ColumnarFile',
+             columns: Iterable[str] | None = None,
+             where: dict[str, Callable[[pd.Series], Any]] | None = None) -> pd.DataFrame:
+        '''
+        Decode the columns, keeping the rows satisfying every predicate in `where`. Other columns are never touched.
+        '''
+
+        names = self.columns if columns is None else list(columns)
+        where = where or {}
+
+        for col in names + list(where):
+            if col not in self.__columns__:
+                raise ValueError(f'The `{col}` column doesn\'t exist.')
+
+        rows = None
+        decoded: dict[str, pd.Series] = {}
+        if where:
+            decoded = {col: Codec.decode_column(self._resolve(col)) for col in where}
+            rows = np.flatnonzero(Codec.mask(self.length, decoded, where))
+
+        result = []
+        for col in names:
+            if col in decoded:
+                assert rows is not None
+                result.append(decoded[col].iloc[rows].reset_index(drop = True))
+            else:
+                result.append(Codec.decode_column(self._resolve(col), rows))
+
+        if len(result) == 0:
+            return pd.DataFrame(index = pd.RangeIndex(self.length if rows is None else len(rows)))
+
+        return pd.concat(result, axis = 1)
+
+    def _resolve(self: 'ColumnarFile', name: str) -> dict[str, Any]:
+        if self.__mmap__ is None:
+            raise ValueError('The file is closed.')
+
+        meta = self.__columns__[name]
+        col = {k: v for k, v in meta.items() if k != 'buffers'}
+        for key, (offset, size) in meta['buffers'].items():
+            if key in Codec.raw_buffers:
+                col[key] = memoryview(self.__mmap__)[offset:offset + size]
+            else:
+                col[key] = msgpack.unpackb(self.__mmap__[offset:offset + size], raw = False)
+        return col
@@ -1,17 +1,26 @@
 from __future__ import annotations
 
+from .artists import ArtistIndex, ArtistParser
+from .codec import Codec, ColumnarFile
+from .profiler import Profiler
+from .reader import XMLReader
+from .search import ColumnIndex, SearchIndex
+from .tags import TagIndex
 from .utils import Utils
-from collections import abc, defaultdict
-from datetime import timedelta
+from collections import abc
+import gzip
 import msgpack
 from numpy import nan
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
 import os
 import pandas as pd
-import plistlib
-from rapidfuzz import fuzz
-import re
-from typing import Any, Iterable
+from rapidfuzz import fuzz, process
+from typing import IO, Any, Callable, Hashable, Iterable
 
+@Profiler.instrument(exclude = ['is_valid'])
 class Library:
     '''
     The iTunes library.
@@ -19,6 +28,8 @@ class Library:
 
     def __init__(self: 'Library', df: pd.DataFrame) -> None:
         self.__df__ = df
+        self.__cache__: dict[str, tuple[list[np.ndarray], Any]] = {}
+        self.__search__: SearchIndex | None = None
 
     def __repr__(self: 'Library') -> str:
         if self.is_valid():
@@ -28,187 +39,90 @@ class Library:
     
     __name__ = 'Library'
 
+    # The columns every library has
+    obligated_cols = ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number']
+
     @property
-    def artists(self: 'Library') -> pd.Series[str]:
+    def artist_index(self: 'Library') -> ArtistIndex:
         '''
-        The series of track artists.
+        The long-format table of the artists and their tracks, cached until the `Artist` column is replaced.
         '''
-        artists: pd.Series = self.__df__['Artist']
+        return self._cached('artist_index', ['Artist'], lambda: ArtistIndex.from_series(self.__df__['Artist']))
 
-        if Utils.get_type(artists) == '<class \'list\'>':
-            artists = pd.Series(artists.explode().unique(), name = 'Artist').astype(str)
-
-        else:
-            artists = pd.Series(artists.unique(), name = 'Artist').astype(str)
-
-        return Utils.custom_sort_values(artists)
+    @property
+    def artists(self: 'Library') -> pd.Series[str]:
+        '''
+        The series of track artists, sorted once until the `Artist` column is replaced.
+        '''
+        return self._cached('artists', ['Artist'], lambda: Utils.custom_sort_values(self.artist_index.to_series())).copy()
 
     @property
     def data(self: 'Library') -> pd.DataFrame:
         '''
         The iTunes library data.
         '''
-        return self.__df__.copy()
+        return Utils.copy_frame(self.__df__)
 
-    @classmethod
-    def from_excel(cls, path: str | bytes | os.PathLike[str], sheet: str | int) -> 'Library':
+    @property
+    def schema(self: 'Library') -> dict[str, str]:
         '''
-        Read a library from a Microsoft Excel file.
+        The element type of each column as given by `Utils.get_type`, detected once until the column is replaced.
         '''
+        return {col: self._kind(col) for col in self.__df__.columns}
 
-        def to_tuple(row: pd.Series) -> tuple:
-            return row['Sub Tag 1'], row['Sub Tag 2'], row['Sub Tag 3']
-        
-        legacy_columns = ['Top Level', 'Second Level', 'Third Level']
-        column_sets = ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number', 'Tags', 'Vocal', 'Language', 'Sub Genres', 'Sub Tags', 'ISRC', 'Apple ID']
-        data = pd.read_excel(path, sheet_name = sheet, header = 0)
-
-        if len(set(legacy_columns) & set(data.columns)) > 0:
-            template = pd.DataFrame(columns = column_sets).astype({
-                'Track ID': 'int64',
-                'Year': 'int64',
-                'Date Modified': 'datetime64[ns]',
-                'Date Added': 'datetime64[ns]',
-                'Play Count': 'int64',
-                'Size': 'int64',
-                'Total Time': 'timedelta64[ns]',
-                'Disc Number': 'int64',
-                'Track Number': 'int64',
-                'ISRC': 'object',
-                'Apple ID': 'float64'
-            })
-
-            data.rename(columns = {'Artists': 'Artist'}, errors = 'ignore', inplace = True)
-            data.drop(columns = ['Rating'], errors = 'ignore', inplace = True)
-            data = pd.concat([template, data], ignore_index = True)
-
-            data['Vocal'] = data.get('Top Level', data['Vocal'])
-            data['Language'] = data.get('Second Level', data['Language'])
-            data['Sub Genres'] = data.get('Third Level', data['Sub Genres'])
-        
-        missing_cols = set(column_sets) - set(data.columns)
-        if len(missing_cols) > 0:
-            for column in missing_cols:
-                data[column] = pd.Series()
-                if column in ['Track ID', 'Year', 'Play Count', 'Size', 'Disc Number', 'Track Number', 'Apple ID']:
-                    try:
-                        data[column].astype('int64')
-                    except:
-                        data[column].astype('float64')
-                if column in ['Date Modified', 'Date Added']:
-                    data[column].astype('datetime64[ns]')
-                if column in ['Total Time']:
-                    data[column].astype('timedelta64[ns]')
-
-        data['Sub Tags'] = data.apply(to_tuple, axis = 1)
-        data['Total Time'] = pd.to_timedelta(data['Total Time'])
+    @property
+    def tags(self: 'Library') -> TagIndex:
+        '''
+        The tag dictionary and the tag combination of each track.
+        '''
+        return TagIndex.from_series(self.__df__['Tags'])
 
-        excessive_columns = set(data.columns) - set(column_sets)
-        if 'ISRC' in excessive_columns:
-            column_sets.append('ISRC')
-        if 'Apple ID' in excessive_columns:
-            column_sets.append('Apple ID')
+    @classmethod
+    def from_excel(cls, path: str | bytes | os.PathLike[str], sheet: str | int, cache: bool | str | os.PathLike[str] = False) -> 'Library':
+        '''
+        Read a library from a Microsoft Excel file. The parsed library is cached if `cache` is set, next to the file if it is `True`, or in the directory it names (see `Utils.cached_frame`).
+        '''
 
-        return Library(data[column_sets].copy())
+        if not cache:
+            return Library(cls._read_excel(path, sheet))
+        return Library(Utils.cached_frame(path, f'library-{sheet}', lambda: cls._read_excel(path, sheet), None if cache is True else cache))
 
     @classmethod
-    def from_msgpack(cls, path: str | bytes | os.PathLike[str]) -> 'Library':
+    def from_msgpack(cls,
+                     path: str | bytes | os.PathLike[str],
+                     columns: Iterable[str] | None = None,
+                     where: dict[str, Callable[[pd.Series], Any]] | None = None) -> 'Library':
         '''
-        Read a library from a message pack file.
+        Read a library from a message pack file. Only the `columns` are decoded, along with the obligated columns (see `Library.obligated_cols`) a library can't do without, and only the rows satisfying every predicate in `where`, e.g. `{'Date Added': lambda s: s >= '2024-01-01'}`, are kept.
         '''
 
-        def denormalize(obj: Any) -> Any:
-            if isinstance(obj, dict) and '__set__' in obj:
-                return set(obj['__set__'])
-            else:
-                return obj
+        if columns is not None:
+            columns = list(dict.fromkeys([*columns, *cls.obligated_cols]))
 
-        def traverse(obj: Any) -> Any:
-            if isinstance(obj, dict):
-                if any(isinstance(v, str) for v in obj.values()):
-                    pass
+        if ColumnarFile.is_columnar(path):
+            with ColumnarFile(path) as f:
+                return Library(f.read(columns, where))
 
-                denormalized_obj = denormalize(obj)
-                
-                if isinstance(denormalized_obj, set):
-                    return {traverse(v) for v in denormalized_obj}
-
-                return {k: traverse(v) for k, v in obj.items()}
-            
-            elif isinstance(obj, list):
-                return [traverse(v) for v in obj]
-            
-            else:
-                return denormalize(obj)
-            
+        # The earlier single-object and row-oriented files have to be decoded as a whole
         with open(path, 'rb') as f:
             data = msgpack.unpackb(f.read(), raw = False)
 
-        denormalized = [traverse(row) for row in data]
-        df = pd.DataFrame(denormalized)
-
-        type_dict = {
-            'Track ID': 'int64',
-            'Year': 'int64',
-            'Date Modified': 'datetime64',
-            'Date Added': 'datetime64',
-            'Play Count': 'int64',
-            'Size': 'int64',
-            'Total Time': 'timedelta64'
-        }
-
-        for col in df.columns:
-            match type_dict.get(col):
-                case 'int64':
-                    df[col] = pd.to_numeric(df[col])
-                
-                case 'datetime64':
-                    df[col] = pd.to_datetime(df[col])
-
-                case 'timedelta64':
-                    df[col] = pd.to_timedelta(df[col])
+        if isinstance(data, list):
+            df = Codec.decode_records(data)
+        else:
+            df = Codec.decode(data)
 
-                case _:
-                    pass
-        
-        return Library(df)
+        return Library(Codec.filter(df, columns, where))
     
     @classmethod
-    def from_xml(cls, path: str | bytes | os.PathLike[str]) -> 'Library':
+    def from_xml(cls, path: str | bytes | os.PathLike[str], tags: bool = True, chunksize: int = 10000) -> 'Library':
         '''
-        Read a library from a XML file.
+        Read a library from a XML file. The file is parsed incrementally, `chunksize` tracks at a time; set `tags` to `False` to skip the playlists.
         '''
 
         if isinstance(path, (str, bytes, os.PathLike)) and os.path.isfile(path):
-            with open(path, 'rb') as fp:
-                library = plistlib.load(fp)
-
-            tracks = library['Tracks']
-            track_list = []
-            for track_id, track_info in tracks.items():
-                track_list.append(track_info)
-            df = pd.DataFrame(track_list).loc[:, ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number']]
-            df['Play Count'] = df['Play Count'].fillna(0).astype(int)
-            df['Total Time'] = pd.to_timedelta(df['Total Time'], unit='ms')
-            df['Disc Number'] = df['Disc Number'].apply(lambda x: str(int(x)) if pd.notnull(x) else None)
-            df['Track Number'] = df['Track Number'].apply(lambda x: str(int(x)) if pd.notnull(x) else None)
-
-            playlist_dict = {}
-            for playlist in library['Playlists']:
-                playlist_list = playlist.get('Playlist Items', list())
-                if len(playlist_list) > 0:
-                    track_set = set()
-                    for track in playlist_list:
-                        track_set.add(track['Track ID'])
-                    playlist_dict[playlist['Name']] = track_set
-
-            track_to_playlists = defaultdict(set)
-            for playlist_name, track_ids in playlist_dict.items():
-                for track_id in track_ids:
-                    track_to_playlists[track_id].add(playlist_name)
-            df['Tags'] = df['Track ID'].map(lambda tid: track_to_playlists.get(tid, set()))
-            return Library(df)
-        
+            return Library(XMLReader(path, chunksize, playlists = tags).read())
+
         else:
             raise ValueError('Invalid path.')
 
@@ -216,18 +130,13 @@ class Library:
     def merge(cls, prev: 'Library', next: 'Library | None' = None,
               artist_map: dict[str, str | list[str]] = {},
               artists_with_comma: list[str] = [],
-              name_map: dict[str, dict[str, str] | list[dict[str, str | list[str]]]] = {}) -> 'LibraryMerger':
+              name_map: dict[str, dict[str, str] | list[dict[str, str | list[str]]]] = {},
+              fuzzy_cutoff: float | None = None,
+              workers: int = -1) -> 'LibraryMerger':
         '''
-        Try to merge two iTunes libraries.
+        Try to merge two iTunes libraries. If `fuzzy_cutoff` is specified, the unmatched tracks are then paired by their titles (see `LibraryMerger.propose`).
         '''
 
-        def create_key_column(df: pd.DataFrame, source: str, key: str) -> pd.DataFrame:
-            df = df.copy()
-            df[key] = df[source].apply(
-                lambda x: ','.join(sorted(x)) if isinstance(x, list) else str(x)
-            )
-            return df
-
         def drop_key_column(key: str, dfs: list[pd.DataFrame]) -> None:
             for df in dfs:
                 df.drop(columns = [key], errors = 'ignore', inplace = True)
@@ -242,52 +151,6 @@ class Library:
                 x_series[f'{col}_x'] = col
             return n_series, p_series, x_series
 
-        def handle_artists(lib: 'Library') -> pd.DataFrame:
-            def flatten_replace(arr: list[str]) -> list[str]:
-                result = []
-                for x in arr:
-                    val = artist_map.get(x, x)
-                    if isinstance(val, list):
-                        result.extend(val)
-                    else:
-                        result.append(val)
-                return result
-            
-            artists = lib.__df__['Artist']
-            artists_type = Utils.get_type(artists)
-            if artists_type == '<class \'list\'>':
-                lib.__df__['Artist'] = artists.apply(flatten_replace)
-            if artists_type == '<class \'str\'>':
-                lib = lib.nested_artists(artist_map, artists_with_comma)
-
-            return lib.__df__
-        
-        def handle_names(df: pd.DataFrame) -> pd.DataFrame:
-            def is_equal(source: str | list, target: str | list) -> bool:
-                return set(to_list(source)) == set(to_list(target))
-            
-            def row_replace(row: pd.Series) -> str:
-                replacers = name_map.get('complex', [])
-                assert isinstance(replacers, list)
-                for r in replacers:
-                    r_artist = r.get('artist', [])
-                    r_alias = to_list(r.get('alias', []))
-                    if is_equal(row['Artist'], r_artist):
-                        if row['Name'] in r_alias:
-                            return str(r.get('title', row['Name']))
-                return row['Name']
-
-            def to_list(x: Any) -> list:
-                if isinstance(x, str):
-                    return [x]
-                if isinstance(x, abc.Iterable):
-                    return list(x)
-                return []
-            
-            df = df.copy()
-            df['Name'] = df.apply(row_replace, axis = 1)
-            return df
-
         indices = ['Name', 'ArtistKey']
         col_from_new = ['Composer', 'Date Added', 'Date Modified', 'Disc Number', 'Play Count', 'Size', 'Tags', 'Total Time', 'Track ID', 'Track Number']
         combined_indices = indices.copy()
@@ -313,34 +176,29 @@ class Library:
             })
             next = Library(empty_df)
 
-        next_df: pd.DataFrame = create_key_column(handle_artists(next.copy()), 'Artist', 'ArtistKey')
-        prev_df: pd.DataFrame = create_key_column(handle_artists(prev.copy()), 'Artist', 'ArtistKey')
-
-        if name_map.get('complex'):
-            next_df = handle_names(next_df)
-            prev_df = handle_names(prev_df)
-        
-        if name_map.get('simple'):
-            replacer = name_map['simple']
-            assert isinstance(replacer, dict)
-            next_df.replace({'Name': replacer}, inplace = True)
-            prev_df.replace({'Name': replacer}, inplace = True)
-
-        if multiple_libs:
-            merged = prev_df.merge(
-                next_df[combined_indices],
-                on = indices,
-                how = 'outer',
-                indicator = True,
-                suffixes = ('_p', '_n')
-            )
-        else:
-            next_df = next_df.loc[:, ~next_df.columns.duplicated()]
-            next_df = next_df.reindex(columns=prev_df.columns)
-            merged = pd.concat([prev_df, next_df], ignore_index = True)
-            merged['_merge'] = pd.Series(['both'] * len(merged))
+        name_lookup = cls._compile_names(name_map)
+        with Profiler.stage('normalize next', len(next.__df__)):
+            next_df = cls._merge_frame(next, artist_map, artists_with_comma, name_map, name_lookup)
+        with Profiler.stage('normalize prev', len(prev.__df__)):
+            prev_df = cls._merge_frame(prev, artist_map, artists_with_comma, name_map, name_lookup)
+
+        with Profiler.stage('join', len(prev_df) + len(next_df)) as span:
+            if multiple_libs:
+                merged = prev_df.merge(
+                    next_df[combined_indices],
+                    on = indices,
+                    how = 'outer',
+                    indicator = True,
+                    suffixes = ('_p', '_n')
+                )
+            else:
+                next_df = next_df.loc[:, ~next_df.columns.duplicated()]
+                next_df = next_df.reindex(columns=prev_df.columns)
+                merged = pd.concat([prev_df, next_df], ignore_index = True)
+                merged['_merge'] = pd.Series(['both'] * len(merged))
+            span.rows_out = len(merged)
 
-        matched = merged.loc[merged['_merge'] == 'both'].copy().rename(columns = n_renamer)
+        matched = merged.loc[merged['_merge'] == 'both'].rename(columns = n_renamer)
         matched = matched[prev_df.columns]
         matched = matched.drop(columns = [f'{col}_p' for col in col_from_new], errors = 'ignore')
 
@@ -358,56 +216,437 @@ class Library:
             next_only = merged.loc[merged['_merge'] == 'right_only', indices].merge(
                 next_df, on = indices, how = 'left'
             )
-            prev_only = merged.loc[merged['_merge'] == 'left_only'].copy().rename(columns = p_renamer)[prev_df.columns]
+            prev_only = merged.loc[merged['_merge'] == 'left_only'].rename(columns = p_renamer)[prev_df.columns]
         else:
             next_only = merged.loc[merged['_merge'] == 'right_only', indices]
             prev_only = merged.loc[merged['_merge'] == 'left_only'][prev_df.columns]
 
         drop_key_column('ArtistKey', [matched, next_only, prev_only])
-        return LibraryMerger(matched, next_only, prev_only)
+        merger = LibraryMerger(matched, next_only, prev_only)
+        if fuzzy_cutoff is not None and multiple_libs:
+            merger.propose(fuzzy_cutoff, workers = workers)
+        return merger
+
+    @classmethod
+    def merge_many(cls, libs: list['Library'],
+                   artist_map: dict[str, str | list[str]] = {},
+                   artists_with_comma: list[str] = [],
+                   name_map: dict[str, dict[str, str] | list[dict[str, str | list[str]]]] = {},
+                   labels: list[Hashable] | None = None) -> pd.DataFrame:
+        '''
+        Match the tracks across many library snapshots at once. Return the identity table, where each canonical track holds its `Name` and `Artist` in the latest snapshot having it, and its row position in each snapshot (labeled by `labels`, or the snapshot order by default). The tracks of a snapshot sharing the same name and artists are kept as distinct tracks, the n-th of them matching the n-th in the other snapshots.
+        '''
+
+        labels = list(range(len(libs))) if labels is None else list(labels)
+        if len(labels) != len(libs):
+            raise ValueError('The labels should be as many as the libraries.')
+
+        if not all(lib.is_valid() for lib in libs):
+            raise ValueError('At least one of the libraries is corrupted.')
+
+        # Each snapshot is normalized once, then all of them share one key space
+        name_lookup = cls._compile_names(name_map)
+        keys = pd.concat([
+            cls._merge_frame(lib, artist_map, artists_with_comma, name_map, name_lookup)[['Name', 'Artist', 'ArtistKey']].assign(Snapshot = i, Row = np.arange(len(lib.__df__)))
+            for i, lib in enumerate(libs)
+        ], ignore_index = True)
+        keys['Occurrence'] = keys.groupby(['Snapshot', 'Name', 'ArtistKey'], dropna = False, sort = False).cumcount()
+        keys['Track'] = keys.groupby(['Name', 'ArtistKey', 'Occurrence'], dropna = False, sort = False).ngroup()
+
+        rows = keys.pivot(index = 'Track', columns = 'Snapshot', values = 'Row').reindex(columns = range(len(libs))).astype('Int64')
+        rows.columns = pd.Index(labels)
+        latest = keys.drop_duplicates('Track', keep = 'last').set_index('Track')[['Name', 'Artist']]
+        return pd.concat([latest, rows], axis = 1).sort_index().rename_axis(None)
+
+    @classmethod
+    def _compile_names(cls, name_map: dict[str, dict[str, str] | list[dict[str, str | list[str]]]]) -> dict[tuple[frozenset, Any], str]:
+        '''
+        Compile the complex name rules into a lookup of (artists, alias) → title, where the first rule matching a track wins.
+        '''
+
+        lookup: dict[tuple[frozenset, Any], str] = {}
+        replacers = name_map.get('complex', [])
+        assert isinstance(replacers, list)
+        for r in replacers:
+            r_artist = frozenset(cls._to_list(r.get('artist', [])))
+            for alias in cls._to_list(r.get('alias', [])):
+                lookup.setdefault((r_artist, alias), str(r.get('title', alias)))
+        return lookup
+
+    @staticmethod
+    def _format_durations(s: pd.Series) -> pd.Series:
+        '''
+        Format the durations as `HH:MM:SS`, with the microseconds if any. The hours go beyond 24 for the durations of a day or more, and the missing ones are left empty.
+        '''
+
+        ns = pd.to_timedelta(s).to_numpy(dtype = 'timedelta64[ns]')
+        missing = np.isnat(ns)
+        us = np.where(missing, 0, ns.view('int64') // 1000)
+        seconds, fraction = np.divmod(us, 1000000)
+        minutes, seconds = np.divmod(seconds, 60)
+        hours, minutes = np.divmod(minutes, 60)
+
+        def pad(values: np.ndarray, width: int) -> pd.Series:
+            return pd.Series(values, index = s.index).astype(str).str.zfill(width)
+
+        text = pad(hours, 2) + ':' + pad(minutes, 2) + ':' + pad(seconds, 2)
+        text = text.where(fraction == 0, text + '.' + pad(fraction, 6))
+        return text.where(~missing, '')
+
+    @staticmethod
+    def _format_shared(values: np.ndarray, format: Callable[[Any], Any]) -> np.ndarray:
+        '''
+        Format the values, where the equal values, e.g. the tag sets of the same playlists, are formatted once.
+        '''
+
+        def key(value: Any) -> Hashable:
+            if isinstance(value, (set, frozenset)):
+                return (set, frozenset(value))
+            if isinstance(value, (list, tuple)):
+                return (type(value), tuple(value))
+            return (type(value), value)
+
+        try:
+            keys = np.empty(len(values), dtype = 'object')
+            keys[:] = list(map(key, values))
+            codes, _ = pd.factorize(keys)
+        except TypeError:
+            # The unhashable values are only told apart by identity
+            codes, _ = pd.factorize(np.fromiter(map(id, values), dtype = 'uint64', count = len(values)))
+        _, first = np.unique(codes, return_index = True)
+        formatted = np.fromiter(map(format, values[first]), dtype = 'object', count = len(first))
+        return formatted[codes]
+
+    @classmethod
+    def _merge_frame(cls, lib: 'Library',
+                     artist_map: dict[str, str | list[str]],
+                     artists_with_comma: list[str],
+                     name_map: dict[str, dict[str, str] | list[dict[str, str | list[str]]]],
+                     name_lookup: dict[tuple[frozenset, Any], str]) -> pd.DataFrame:
+        '''
+        Normalize the artists and the names of a library for merging, and derive the `ArtistKey` column.
+        '''
+
+        def flatten_replace(arr: list[str]) -> list[str]:
+            result = []
+            for x in arr:
+                val = artist_map.get(x, x)
+                if isinstance(val, list):
+                    result.extend(val)
+                else:
+                    result.append(val)
+            return result
+
+        # The frame shares the untouched columns with the library, so the columns are only ever replaced
+        artists_type = lib._kind('Artist')
+        if artists_type == str(str):
+            lib = lib.nested_artists(artist_map, artists_with_comma)
+        else:
+            lib = lib.copy(deep = False)
+            if artists_type == str(list):
+                lib.__df__['Artist'] = lib.__df__['Artist'].apply(flatten_replace)
+                lib._set_kind('Artist', artists_type)
+
+        df = lib.__df__
+        df['ArtistKey'] = df['Artist'].apply(
+            lambda x: ','.join(sorted(x)) if isinstance(x, list) else str(x)
+        )
+
+        with Profiler.stage('handle names', len(df)):
+            if name_lookup:
+                aliases = {alias for _, alias in name_lookup}
+                df['Name'] = pd.Series([
+                    name_lookup.get((frozenset(cls._to_list(artist)), name), name) if name in aliases else name
+                    for artist, name in zip(df['Artist'], df['Name'])
+                ], index = df.index, dtype = 'object')
+
+            if name_map.get('simple'):
+                replacer = name_map['simple']
+                assert isinstance(replacer, dict)
+                df['Name'] = df['Name'].replace(replacer)
+
+        return df
+
+    @classmethod
+    def _read_excel(cls, path: str | bytes | os.PathLike[str], sheet: str | int) -> pd.DataFrame:
+        '''
+        Parse a library sheet of a Microsoft Excel file.
+        '''
+
+        legacy_columns = ['Top Level', 'Second Level', 'Third Level']
+        column_sets = ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number', 'Tags', 'Vocal', 'Language', 'Sub Genres', 'Sub Tags', 'ISRC', 'Apple ID']
+        data = pd.read_excel(path, sheet_name = sheet, header = 0)
+
+        if len(set(legacy_columns) & set(data.columns)) > 0:
+            template = pd.DataFrame(columns = column_sets).astype({
+                'Track ID': 'int64',
+                'Year': 'int64',
+                'Date Modified': 'datetime64[ns]',
+                'Date Added': 'datetime64[ns]',
+                'Play Count': 'int64',
+                'Size': 'int64',
+                'Total Time': 'timedelta64[ns]',
+                'Disc Number': 'int64',
+                'Track Number': 'int64',
+                'ISRC': 'object',
+                'Apple ID': 'float64'
+            })
+
+            data.rename(columns = {'Artists': 'Artist'}, errors = 'ignore', inplace = True)
+            data.drop(columns = ['Rating'], errors = 'ignore', inplace = True)
+            data = pd.concat([template, data], ignore_index = True)
+
+            data['Vocal'] = data.get('Top Level', data['Vocal'])
+            data['Language'] = data.get('Second Level', data['Language'])
+            data['Sub Genres'] = data.get('Third Level', data['Sub Genres'])
+        
+        missing_cols = set(column_sets) - set(data.columns)
+        if len(missing_cols) > 0:
+            for column in missing_cols:
+                data[column] = pd.Series()
+                if column in ['Track ID', 'Year', 'Play Count', 'Size', 'Disc Number', 'Track Number', 'Apple ID']:
+                    try:
+                        data[column].astype('int64')
+                    except:
+                        data[column].astype('float64')
+                if column in ['Date Modified', 'Date Added']:
+                    data[column].astype('datetime64[ns]')
+                if column in ['Total Time']:
+                    data[column].astype('timedelta64[ns]')
+
+        data['Sub Tags'] = Utils.zip_columns(data, ['Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3'])
+        data['Total Time'] = pd.to_timedelta(data['Total Time'])
+
+        excessive_columns = set(data.columns) - set(column_sets)
+        if 'ISRC' in excessive_columns:
+            column_sets.append('ISRC')
+        if 'Apple ID' in excessive_columns:
+            column_sets.append('Apple ID')
+
+        return data[column_sets].copy()
+
+    @staticmethod
+    def _to_list(x: Any) -> list:
+        if isinstance(x, str):
+            return [x]
+        if isinstance(x, abc.Iterable):
+            return list(x)
+        return []
 
     def artist_chart(self: 'Library') -> pd.DataFrame:
         '''
         Retrieve the chart of artists, where the score is weighted by play counts and duration.
         '''
 
-        chart_df = self.__df__['Artist'].explode().value_counts().reset_index()
-        chart_df.columns = pd.Index(['Artist', 'Occurance'])
-        artist_score: dict[str, float] = {}
+        return self.artist_index.chart(self.__df__['Play Count'], self.__df__['Total Time'])
 
-        for _, row in self.__df__.iterrows():
-            artists: list[str] | str = row['Artist']
-            play_count: int = row['Play Count']
-            total_time: timedelta = row['Total Time']
+    def _cached(self: 'Library', name: str, columns: list[str], build: Callable[[], Any]) -> Any:
+        '''
+        Retrieve a structure derived from the columns, rebuilding it once any of the columns is replaced.
+        '''
 
-            if not artists or pd.isna(play_count) or pd.isna(total_time):
-                continue
+        # The cached arrays are kept alive, so an unchanged address means an unchanged column
+        arrays = [self.__df__[col].to_numpy() for col in columns]
+        cached = self.__cache__.get(name)
+        if cached is not None and self._same_arrays(arrays, cached[0]):
+            return cached[1]
+
+        value = build()
+        self.__cache__[name] = (arrays, value)
+        return value
+
+    def _kind(self: 'Library', col: str) -> str:
+        '''
+        Retrieve the element type of the column, detecting it once until the column is replaced.
+        '''
+
+        return self._cached(f'kind:{col}', [col], lambda: Utils.get_type(self.__df__[col]))
+
+    def _map(self: 'Library', column: str, tables: list[dict]) -> 'Library':
+        '''
+        Map values of the library column based on the tables in turn. The tags are renamed before decoding once, and the other columns map each distinct value once.
+        '''
+
+        new_lib = self.copy(deep = False)
+
+        if column == 'Tags':
+            tags = self.tags
+            for table in tables:
+                tags = tags.rename(table)
+            new_lib.__df__[column] = tags.to_series(new_lib.__df__.index)
+            if len(new_lib.__df__) > 0:
+                new_lib._set_kind(column, str(set))
+
+        elif column in self.__df__.columns:
+            s = self.__df__[column]
+            fused = len(tables) > 1 and not s.isna().any()
+            if fused:
+                try:
+                    codes, uniques = pd.factorize(s)
+                except TypeError:
+                    fused = False
+
+            if fused:
+                mapped = pd.Series(uniques, name = s.name)
+                for table in tables:
+                    mapped = mapped.map(table)
+                s = mapped.take(codes).set_axis(s.index)
+            else:
+                # The missing and the unhashable values are mapped row by row
+                for table in tables:
+                    s = s.map(table)
+            new_lib.__df__[column] = s
+
+        else:
+            raise ValueError('The specified column doesn\'t exist.')
+
+        if self.__search__ is not None:
+            new_lib.__search__ = self.__search__.derive(new_lib.__df__, replaced = [column])
+        return new_lib
+
+    @staticmethod
+    def _same_arrays(arrays: list[np.ndarray], cached: list[np.ndarray]) -> bool:
+        return all(
+            a.__array_interface__['data'][0] == b.__array_interface__['data'][0] and a.shape == b.shape
+            for a, b in zip(arrays, cached)
+        )
+
+    def _set_kind(self: 'Library', col: str, kind: str) -> None:
+        '''
+        Record the known element type of the column, sparing the detection.
+        '''
+
+        self.__cache__[f'kind:{col}'] = ([self.__df__[col].to_numpy()], kind)
+
+    def _column_index(self: 'Library', col: str) -> ColumnIndex:
+        '''
+        Retrieve the search index of the column, or build a transient one (without n-grams) if the column isn't indexed.
+        '''
+
+        index = None if self.__search__ is None else self.__search__.column(self.__df__, col)
+        if index is None:
+            index = ColumnIndex.from_series(self.__df__[col], grams = False)
+        return index
+
+    def _search_columns(self: 'Library', columns: str | list[str] | None) -> list[str]:
+        '''
+        Resolve the columns to search, falling back to the object columns.
+        '''
+
+        if isinstance(columns, str) and columns in self.__df__.columns:
+            return [columns]
+
+        if isinstance(columns, list):
+            cols = list(set(columns) & set(self.__df__.columns))
+            if cols:
+                return cols
+
+        return self.__df__.select_dtypes(include=['object']).columns.tolist()
+
+    def _search_rows(self: 'Library', q: str, columns: str | list[str] | None, contains: bool, score_cutoff: float, limit: int | None, workers: int) -> pd.Index:
+        '''
+        The row labels of the search results, best first.
+        '''
 
-            # Weighted score = Σ_i^n (ArtistOccurance_i (=1 if present, =0 if not present) *  PlayCount_i * TotalTime_i / NumberOfArtists_i)
-            #                  where i is the index of the song in the dataframe, n is the number of songs.
+        cols = self._search_columns(columns)
+        q_norm = Utils.normalize_value(q)
+        score_df = pd.DataFrame(index = self.__df__.index)
 
-            if isinstance(artists, list):
-                num_artists = len(artists)
-                score = play_count * total_time.total_seconds() / num_artists
-                for artist in artists:
-                    artist_score[artist] = artist_score.get(artist, 0) + score
-            
+        for col in cols:
+            index = self._column_index(col)
+            if contains:
+                score_df[col + '_score'] = np.where(index.contains(q_norm), 100, 0)
             else:
-                score = play_count * total_time.total_seconds()
-                artist_score[artists] = artist_score.get(artists, 0) + score
+                score_df[col + '_score'] = index.cdist([q_norm], score_cutoff = score_cutoff, workers = workers)[0][index.codes]
+
+        score_df['FinalScore'] = score_df.max(axis=1)
+        
+        if contains:
+            score_df = score_df[score_df['FinalScore'] > 0]
+        else:
+            score_df = score_df[score_df['FinalScore'] >= score_cutoff]
+        
+        score_df = score_df.sort_values(by='FinalScore', ascending = False)
+        if limit is not None:
+            score_df = score_df.head(limit)
+        return score_df.index
+
+    def build_search_index(self: 'Library', columns: list[str] | None = None) -> SearchIndex:
+        '''
+        Build the search index of the columns (the object columns by default), which `search` then uses. The index is carried over to the libraries derived from this one.
+        '''
+
+        if not self.is_valid():
+            raise ValueError('The library is corrupted.')
+
+        if columns is None:
+            columns = self.__df__.select_dtypes(include = ['object']).columns.tolist()
+
+        for col in columns:
+            if col not in self.__df__.columns:
+                raise ValueError(f'The `{col}` column doesn\'t exist.')
+
+        self.__search__ = SearchIndex.from_dataframe(self.__df__, columns)
+        return self.__search__
+
+    def copy(self: 'Library', deep: bool | None = None) -> 'Library':
+        '''
+        Copy the library object. The copy is deep unless `deep` is `False` or the copy-on-write mode of pandas (`mode.copy_on_write`) is on, where the columns are shared until either side writes them.
+        '''
+
+        if deep is None:
+            deep = not Utils.copy_on_write()
 
-        weighted_df = pd.DataFrame([
-            {'Artist': artist, 'Score': round(score, 2)} for artist, score in artist_score.items()
-        ])
+        new_lib = Library(self.__df__.copy(deep = deep))
+        if self.__search__ is not None:
+            new_lib.__search__ = self.__search__.derive(new_lib.__df__)
 
-        chart_df = weighted_df.join(chart_df.set_index('Artist'), on='Artist').sort_values(['Score', 'Occurance'], ascending=False).reset_index(drop=True)
-        return chart_df
+        if not deep:
+            # The shared arrays keep their derived structures valid
+            new_lib.__cache__ = dict(self.__cache__)
+            return new_lib
 
-    def copy(self: 'Library') -> 'Library':
+        # The elements are shared, so are their types
+        for col in new_lib.__df__.columns:
+            cached = self.__cache__.get(f'kind:{col}')
+            if cached is not None and self._same_arrays([self.__df__[col].to_numpy()], cached[0]):
+                new_lib._set_kind(col, cached[1])
+        return new_lib
+
+    def diff(self: 'Library',
+             new: 'Library | str | bytes | os.PathLike[str]',
+             fingerprint: list[str] = ['Date Modified', 'Play Count', 'Size']) -> 'LibraryDiff':
         '''
-        Deep copy the library object.
+        Compare a newer library (or iTunes XML file) with this one by `Track ID`. A track present on both sides is changed if any of the `fingerprint` columns differs, or its `Tags` do when both sides have them, as adding a track to a playlist leaves the other columns alone.
         '''
-        return Library(self.__df__.copy(deep = True))
+        if not isinstance(new, Library):
+            new = Library.from_xml(new)
+
+        if not (self.is_valid() and new.is_valid()):
+            raise ValueError('At least one of the libraries is corrupted.')
+
+        old_ids = pd.Index(self.__df__['Track ID'])
+        new_ids = pd.Index(new.__df__['Track ID'])
+        if not (old_ids.is_unique and new_ids.is_unique):
+            raise ValueError('The track IDs should be unique.')
+
+        positions = old_ids.get_indexer(new_ids)
+        common = positions >= 0
+        columns = list(fingerprint)
+        if 'Tags' in self.__df__.columns and 'Tags' in new.__df__.columns and 'Tags' not in columns:
+            columns.append('Tags')
+
+        changed = np.zeros(int(common.sum()), dtype = 'bool')
+        for col in columns:
+            old_values = self.__df__[col].to_numpy()[positions[common]]
+            new_values = new.__df__[col].to_numpy()[common]
+            changed |= ~((old_values == new_values) | (pd.isna(old_values) & pd.isna(new_values)))
+
+        return LibraryDiff(
+            new.__df__[~common].reset_index(drop = True),
+            self.__df__[~old_ids.isin(new_ids)].reset_index(drop = True),
+            new.__df__[common][changed].reset_index(drop = True)
+        )
 
     def filter(self: 'Library', column: str, whitelist: Iterable | None = None, blacklist: Iterable | None = None) -> 'Library':
         '''
@@ -415,17 +654,36 @@ class Library:
         '''
 
         if self.is_valid():
-            new_lib = self.copy()
+            # The rows change, so nothing cached carries over
+            new_lib = self.copy(deep = False)
+            new_lib.__cache__ = {}
 
             if column == 'Tags':
                 blackset = set() if blacklist is None else set(blacklist)
                 whiteset = set() if whitelist is None else set(whitelist)
-                new_lib.__df__ = new_lib.__df__[new_lib.__df__[column].apply(lambda tags: not bool(tags & blackset))]
+                tags = self.tags
+                keep = ~tags.any(blackset)
                 if len(whiteset) > 0:
-                    new_lib.__df__ = new_lib.__df__[new_lib.__df__[column].apply(lambda tags: bool(tags & whiteset))]
-                    new_lib.__df__[column] = new_lib.__df__[column].apply(lambda tags: tags & whiteset)
-                
-                new_lib.__df__ = new_lib.__df__.reset_index(drop = True)
+                    keep &= tags.any(whiteset)
+
+                new_lib.__df__ = new_lib.__df__[keep].reset_index(drop = True)
+                if len(whiteset) > 0:
+                    new_lib.__df__[column] = tags.take(keep).intersect(whiteset).to_series()
+
+                if self.__search__ is not None:
+                    new_lib.__search__ = self.__search__.derive(new_lib.__df__, keep, [column] if len(whiteset) > 0 else [])
+                return new_lib
+
+            elif column == 'Artist':
+                blackset = set() if blacklist is None else set(blacklist)
+                whiteset = set() if whitelist is None else set(whitelist)
+                keep = ~self.artist_index.mask(blackset)
+                if len(whiteset) > 0:
+                    keep &= self.artist_index.mask(whiteset)
+
+                new_lib.__df__ = new_lib.__df__[keep].reset_index(drop = True)
+                if self.__search__ is not None:
+                    new_lib.__search__ = self.__search__.derive(new_lib.__df__, keep)
                 return new_lib
 
             elif column in self.__df__.columns:
@@ -434,6 +692,8 @@ class Library:
                     new_lib.__df__ = new_lib.__df__[new_lib.__df__.isin(whitelist)]
                 
                 new_lib.__df__ = new_lib.__df__.reset_index(drop = True)
+                if self.__search__ is not None:
+                    new_lib.__search__ = self.__search__.derive(new_lib.__df__, replaced = new_lib.__df__.columns)
                 return new_lib
 
             else:
@@ -442,6 +702,64 @@ class Library:
         else:
             raise ValueError('The library is corrupted.')
 
+    def fuzzy_match(self: 'Library',
+                    queries: Iterable[str],
+                    column: str = 'Name',
+                    limit: int = 1,
+                    score_cutoff: float = 50,
+                    scorer: Callable[..., float] = fuzz.ratio,
+                    workers: int = -1,
+                    matrix: bool = False) -> pd.DataFrame | np.ndarray:
+        '''
+        Match many queries against a column in one batch, on `workers` threads (all cores by default). Return the best `limit` tracks of each query scoring at least `score_cutoff` (an empty row if none), or the query × track score matrix if `matrix` is set.
+        '''
+        if not self.is_valid():
+            raise ValueError('The library is corrupted.')
+
+        if column not in self.__df__.columns:
+            raise ValueError(f'The `{column}` column doesn\'t exist.')
+
+        if limit < 1:
+            raise ValueError('The limit should be positive.')
+
+        queries = list(queries)
+        index = self._column_index(column)
+        scores = index.cdist([Utils.normalize_value(q) for q in queries], scorer = scorer, score_cutoff = score_cutoff, workers = workers)
+
+        if matrix:
+            return scores[:, index.codes]
+
+        # The rows of each distinct value, in order
+        order = np.argsort(index.codes, kind = 'stable')
+        bounds = np.searchsorted(index.codes[order], np.arange(len(index.vocab) + 1))
+
+        query_ids, ranks, values, rows = [], [], [], []
+        for i, row in enumerate(scores):
+            # Each distinct value holds at least one row, so the best `limit` values (and their ties) are enough
+            threshold = score_cutoff
+            if limit < len(row):
+                threshold = max(threshold, np.partition(row, len(row) - limit)[len(row) - limit])
+            top = np.flatnonzero(row >= threshold)
+            top = top[np.argsort(-row[top], kind = 'stable')]
+
+            matched = [(row[v], r) for v in top for r in order[bounds[v]:bounds[v + 1]]][:limit]
+            if not matched:
+                matched = [(nan, -1)]
+
+            for rank, (score, r) in enumerate(matched, start = 1):
+                query_ids.append(i)
+                ranks.append(rank if r >= 0 else pd.NA)
+                values.append(score)
+                rows.append(r)
+
+        match_df = pd.DataFrame({
+            'Query': [queries[i] for i in query_ids],
+            'Rank': pd.array(ranks, dtype = 'Int64'),
+            'Score': values
+        })
+        tracks = self.__df__.reset_index(drop = True).reindex(rows).reset_index(drop = True)
+        return pd.concat([match_df, tracks.drop(columns = match_df.columns, errors = 'ignore')], axis = 1)
+
     def is_valid(self: 'Library') -> bool:
         '''
         Verify the library integrity.
@@ -452,153 +770,157 @@ class Library:
         if not isinstance(self.__df__, pd.DataFrame):
             return False
         
-        obligated_cols = ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number']
-        
-        if sum([(col in obligated_cols) for col in self.__df__.columns.to_list()]) != len(obligated_cols):
+        if sum([(col in self.obligated_cols) for col in self.__df__.columns.to_list()]) != len(self.obligated_cols):
             return False
         else:
             return True
 
+    def lazy(self: 'Library') -> 'LazyLibrary':
+        '''
+        Start a lazy query on the library, where the operations are only planned until `collect`.
+        '''
+
+        return LazyLibrary(self)
+
     def map(self: 'Library', column: str, table: dict) -> 'Library':
         '''
         Map values of the library column based on the table.
         '''
 
         if self.is_valid():
-            new_lib = self.copy()
-
-            if column == 'Tags':
-                new_lib.__df__[column] = new_lib.__df__[column].apply(lambda tag_set: {table.get(tag, tag) for tag in tag_set})
-                return new_lib
-
-            elif column in self.__df__.columns:
-                new_lib.__df__[column] = new_lib.__df__[column].map(table)
-                return new_lib
-
-            else:
-                raise ValueError('The specified column doesn\'t exist.')
+            return self._map(column, [table])
 
         else:
             raise ValueError('The library is corrupted.')
 
-    def nested_artists(self: 'Library', table: dict[str, str | list[str]] = {}, artists_with_comma: list[str] = [], detect_feat: bool = True) -> 'Library':
+    def nested_artists(self: 'Library',
+                       table: dict[str, str | list[str]] = {},
+                       artists_with_comma: list[str] = [],
+                       detect_feat: bool = True,
+                       processes: int | None = None) -> 'Library':
+        '''
+        Split the artist fields into artist lists, including the featured artists in the titles. Very large libraries can be parsed in `processes` worker processes.
+        '''
         if not self.is_valid():
             raise ValueError('The library is corrupted.')
-        
-        def extract_artists(row: pd.Series) -> list[str]:
-            artist_field = row.get('Artist', '')
-            title_field = row.get('Name', '')
-
-            if isinstance(artist_field, str) and isinstance(title_field, str):
-                main = split_artist(artist_field)
-                feat = extract_feat_artist(title_field) if detect_feat else []
-                mapped = []
-                for artist in main + feat:
-                    mapped_artist = table.get(artist, artist)
-                    if isinstance(mapped_artist, list):
-                        mapped.extend(mapped_artist)
-                    else:
-                        mapped.append(mapped_artist)
-                seen = set()
-                unique = []
-                for artist in mapped:
-                    if artist not in seen:
-                        seen.add(artist)
-                        unique.append(artist)
-                
-                return unique
-            
-            elif isinstance(artist_field, list):
-                return artist_field
-            
-            else:
-                raise ValueError('The artist field must be strings or list of strings.')
-
-        def extract_feat_artist(title: str) -> list[str]:
-            non_artist = {'vip mix', 'vip remix', 'house remix', 'dance remix', 'night beat remix', 'remix', 'mix'}
-            matches = re.compile(r'[\[\(](.*?)[\]\)]').finditer(title)
-            feats = []
-
-            for match in matches:
-                content = match.group(1)
-                check = content.lower().strip()
-                if 'feat' in check or 'with' in check:
-                    cleaned = re.sub(r'^(feat\.?|with)\s+', '', content, flags=re.IGNORECASE)
-                    parts = re.split(r',|&', cleaned)
-                    feats.extend([p.strip() for p in parts if p.strip()])
-                elif any(word in check for word in non_artist):
-                    remix_match = re.match(r'(.*?)\s+(?:' + '|'.join(non_artist) + r')', content, flags=re.IGNORECASE)
-                    if remix_match:
-                        remix_artist = remix_match.group(1).strip()
-                        if remix_artist:
-                            feats.append(remix_artist)
-
-            return feats or []
-
-        def protect_comma(artist: str) -> str:
-            for case in artists_with_comma:
-                artist = artist.replace(case, case.replace('&', '<AMPERSAND>'))
-                artist = artist.replace(case, case.replace(',', '<COMMA>'))
-            return artist
-
-        def split_artist(artist: str) -> list[str]:
-            artist_str = protect_comma(artist).replace(' & ', ', ')
-            return [name.strip().replace('<AMPERSAND>', '&').replace('<COMMA>', ',') for name in artist_str.split(',')]
-
-        new_lib = self.copy()
-        new_lib.__df__['Artist'] = new_lib.__df__.apply(extract_artists, axis = 1)
+
+        parser = ArtistParser(table, artists_with_comma, detect_feat)
+        empty = pd.Series('', index = self.__df__.index, dtype = 'object')
+
+        new_lib = self.copy(deep = False)
+        new_lib.__df__['Artist'] = parser.parse_series(self.__df__.get('Artist', empty), self.__df__.get('Name', empty), processes)
+        if len(new_lib.__df__) > 0:
+            new_lib._set_kind('Artist', str(list))
+        if self.__search__ is not None:
+            new_lib.__search__ = self.__search__.derive(new_lib.__df__, replaced = ['Artist'])
         return new_lib
 
-    def search(self: 'Library', q: str, columns: str | list[str] | None = None, contains: bool = True) -> pd.DataFrame:
+    def patch(self: 'Library', diff: 'LibraryDiff') -> None:
         '''
-        Search in the iTunes library.
+        Apply the changes in place: drop the removed tracks, update the columns of the changed tracks where they stand, and append the added tracks.
         '''
         if not self.is_valid():
             raise ValueError('The library is corrupted.')
-        
-        if isinstance(columns, str) and columns in self.__df__.columns:
-            cols = [columns]
 
-        elif isinstance(columns, list):
-            cols = list(set(columns) & set(self.__df__.columns))
-            if not cols:
-                cols = self.__df__.select_dtypes(include=['object']).columns.tolist()
-        
-        else:
-            cols = self.__df__.select_dtypes(include=['object']).columns.tolist()
+        df = self.__df__
+        positions = pd.Index(df['Track ID']).get_indexer(diff.__cdf__['Track ID'])
+        if (positions < 0).any():
+            raise ValueError('The changed tracks should be in the library.')
 
-        q_norm = Utils.normalize_value(q)
-        score_df = pd.DataFrame(index = self.__df__.index)
+        changed = df.iloc[positions].copy()
+        for col in df.columns.intersection(diff.__cdf__.columns):
+            changed[col] = diff.__cdf__[col].to_numpy()
 
-        for col in cols:
-            normalized_col = self.__df__[col].map(lambda x: Utils.normalize_value(x))
+        added = diff.__adf__.reindex(columns = df.columns)
+        added.index = pd.RangeIndex(len(df), len(df) + len(added))
 
-            if contains:
-                score_df[col + '_score'] = normalized_col.map(lambda x: 100 if q_norm in x else 0)
+        kept = df[~df['Track ID'].isin(diff.__rdf__['Track ID']) & ~df['Track ID'].isin(diff.__cdf__['Track ID'])]
+        self.__df__ = pd.concat([kept, changed, added]).sort_index(kind = 'stable').reset_index(drop = True)
 
-            else:
-                score_df[col + '_score'] = normalized_col.map(lambda x: fuzz.ratio(q_norm, Utils.normalize_value(x)))
+        # Every column array is replaced, so the derived structures are rebuilt on demand
+        self.__cache__ = {}
+        if self.__search__ is not None:
+            self.__search__ = self.__search__.derive(self.__df__, replaced = self.__df__.columns)
 
-        score_df['FinalScore'] = score_df.max(axis=1)
-        
-        if contains:
-            score_df = score_df[score_df['FinalScore'] > 0]
-        else:
-            score_df = score_df[score_df['FinalScore'] >= 50]
-        
-        score_df = score_df.sort_values(by='FinalScore', ascending = False)
-        return self.__df__.copy().loc[score_df.index].reset_index(drop = True)
+    def refresh(self: 'Library', path: str | bytes | os.PathLike[str], fingerprint: list[str] = ['Date Modified', 'Play Count', 'Size']) -> 'LibraryDiff':
+        '''
+        Patch the library in place with a newer iTunes XML file, and return the changes. The library should be comparable with the file, e.g. loaded by `from_xml`.
+        '''
+
+        diff = self.diff(path, fingerprint)
+        if len(diff) > 0:
+            self.patch(diff)
+        return diff
+
+    def search(self: 'Library',
+               q: str,
+               columns: str | list[str] | None = None,
+               contains: bool = True,
+               score_cutoff: float = 50,
+               limit: int | None = None,
+               workers: int = 1) -> pd.DataFrame:
+        '''
+        Search in the iTunes library. The fuzzy search (`contains = False`) keeps the tracks scoring at least `score_cutoff`, and scores each distinct value once on `workers` threads (`-1` for all cores). Only the best `limit` tracks are returned if specified.
+        '''
+        if not self.is_valid():
+            raise ValueError('The library is corrupted.')
+
+        rows = self._search_rows(q, columns, contains, score_cutoff, limit, workers)
+        return self.__df__.loc[rows].reset_index(drop = True)
 
     def to_csv(self: 'Library',
-               path: str | bytes | os.PathLike[str]) -> None:
+               path: str | bytes | os.PathLike[str] | IO[str],
+               compression: str | None = 'infer',
+               delimiter: str = '; ',
+               chunksize: int = 10000) -> None:
         '''
-        Export the library to a CSV file.
+        Export the library to a CSV file, `chunksize` rows at a time. The durations are written as `HH:MM:SS`, and the items of the lists, sets (sorted) and tuples are joined by `delimiter`. The `compression` (`gzip` or `zstd`, which needs the `zstandard` package) is inferred from the `.gz` or `.zst` extension by default. An opened text file is written as is.
         '''
 
-        if self.is_valid():
-            csv = self.__df__.copy(deep=True)
-            csv['Total Time'] = csv['Total Time'].astype(str).apply(lambda x:x.split(' ')[2])
-            csv.to_csv(path, index = False) # type: ignore
+        def item(x: Any) -> str:
+            return '' if x is None or (isinstance(x, float) and np.isnan(x)) else str(x)
+
+        def join_items(value: Any) -> Any:
+            if isinstance(value, (list, tuple)):
+                return delimiter.join(map(item, value))
+            if isinstance(value, (set, frozenset)):
+                return delimiter.join(sorted(map(item, value)))
+            return value
+
+        if not self.is_valid():
+            return
+
+        df = self.__df__
+        nested = [col for col in df.columns if df[col].dtype == 'object' and self._kind(col) != str(str)]
+
+        def write(f: IO[str]) -> None:
+            for start in range(0, max(len(df), 1), chunksize):
+                chunk = df.iloc[start:start + chunksize]
+                columns = {col: chunk[col] for col in chunk.columns}
+                columns['Total Time'] = self._format_durations(chunk['Total Time'])
+                for col in nested:
+                    columns[col] = pd.Series(self._format_shared(chunk[col].to_numpy(dtype = 'object'), join_items), index = chunk.index)
+                pd.DataFrame(columns, index = chunk.index).to_csv(f, index = False, header = start == 0)
+
+        if hasattr(path, 'write'):
+            write(path) # type: ignore
+            return
+
+        if compression == 'infer':
+            compression = {'.gz': 'gzip', '.zst': 'zstd'}.get(os.path.splitext(os.fsdecode(path))[1].lower()) # type: ignore
+
+        if compression is None:
+            with open(path, 'w', encoding = 'utf-8', newline = '') as f: # type: ignore
+                write(f)
+        elif compression == 'gzip':
+            with gzip.open(path, 'wt', encoding = 'utf-8', newline = '') as f: # type: ignore
+                write(f)
+        elif compression == 'zstd':
+            import zstandard
+            with zstandard.open(path, 'wt', encoding = 'utf-8', newline = '') as f:
+                write(f)
+        else:
+            raise ValueError('The `compression` should be `gzip`, `zstd`, or `None`.')
 
     def to_dataframe(self: 'Library') -> pd.DataFrame:
         '''
@@ -606,106 +928,145 @@ class Library:
         '''
 
         if self.is_valid():
-            return self.__df__.copy()
+            return Utils.copy_frame(self.__df__)
         else:
             raise ValueError('The library is corrupted.')
     
     def to_excel(self: 'Library',
                  path: str | bytes | os.PathLike[str],
                  sheet: int | str = 0,
-                 sort: bool = True) -> None:
+                 sort: bool = True,
+                 rows_per_sheet: int | None = None,
+                 split_files: bool = False,
+                 chunksize: int = 10000) -> None:
         '''
-        Export the library to a Microsoft Excel file.
+        Export the library to a Microsoft Excel file. The rows are formatted and streamed into a write-only workbook `chunksize` at a time. Libraries over `rows_per_sheet` rows (the Excel limit by default) continue on the sheets `<sheet>-2`, `<sheet>-3`, ..., or on the files `<path>-2.xlsx`, ... if `split_files` is set.
         '''
 
         if not self.is_valid():
             raise ValueError('The library is corrupted.')
-        
+
         def apply_tags(value) -> str:
             if isinstance(value, abc.Iterable):
                 return ', '.join(sorted(value))
             else:
                 return str(value)
 
-        excel = self.__df__.copy()
-        excel['Artist'] = excel['Artist'].apply(lambda x: ', '.join(x))
-        excel['Play Count'] = excel['Play Count'].astype(int)
-        excel['Tags'] = excel['Tags'].apply(lambda x: apply_tags(x))
-        excel['Total Time'] = excel['Total Time'].astype(str)
-        excel['Year'] = excel['Year'].astype(int)
-
-        if 'Sub Tags' not in excel.columns:
-            empty = pd.Series([nan] * len(excel))
-            excel['Sub Tag 1'] = excel['Sub Tag 1'] if ('Sub Tag 1' in excel.columns) else empty
-            excel['Sub Tag 2'] = excel['Sub Tag 2'] if ('Sub Tag 2' in excel.columns) else empty
-            excel['Sub Tag 3'] = excel['Sub Tag 3'] if ('Sub Tag 3' in excel.columns) else empty
-        
-        else:
-            excel['Sub Tag 1'] = excel['Sub Tags'].apply(lambda x: x[0] if isinstance(x, list) or isinstance(x, tuple) else nan)
-            excel['Sub Tag 2'] = excel['Sub Tags'].apply(lambda x: x[1] if isinstance(x, list) or isinstance(x, tuple) else nan)
-            excel['Sub Tag 3'] = excel['Sub Tags'].apply(lambda x: x[2] if isinstance(x, list) or isinstance(x, tuple) else nan)
-        
+        def join_artists(value) -> str:
+            return value if isinstance(value, str) else ', '.join(value)
+
+        def cells(s: pd.Series | np.ndarray) -> list:
+            values = np.asarray(s, dtype = 'object')
+            values[pd.isna(values)] = None
+            return values.tolist()
+
+        df = self.__df__
         fin_cols = ['Track ID', 'Vocal', 'Language', 'Sub Genres', 'Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Play Count', 'Disc Number', 'Track Number', 'Tags', 'Date Added', 'Date Modified', 'Size', 'Total Time']
-        if 'ISRC' in excel.columns:
+        if 'ISRC' in df.columns:
             fin_cols.append('ISRC')
-        if 'Apple ID' in excel.columns:
+        if 'Apple ID' in df.columns:
             fin_cols.append('Apple ID')
-        excel = excel.loc[:, fin_cols]
+
+        for col in fin_cols:
+            if col not in df.columns and not col.startswith('Sub Tag '):
+                raise ValueError(f'The `{col}` column should present in the library.')
+
+        artists = self._format_shared(df['Artist'].to_numpy(dtype = 'object'), join_artists)
+        play_count = df['Play Count'].astype(int).to_numpy()
+        year = df['Year'].astype(int).to_numpy()
+
+        order = np.arange(len(df))
         if sort:
-            excel = excel.sort_values(['Play Count', 'Artist', 'Name'], ascending = [False, True, True], ignore_index = True)
-        excel.to_excel(path, sheet_name = str(sheet), index = False)
+            with Profiler.stage('sort', len(df)):
+                keys = pd.DataFrame({'Play Count': play_count, 'Artist': artists, 'Name': df['Name'].to_numpy()})
+                order = keys.sort_values(['Play Count', 'Artist', 'Name'], ascending = [False, True, True]).index.to_numpy()
+
+        def format_rows(rows: np.ndarray) -> list[list]:
+            chunk = df.iloc[rows]
+            columns: dict[str, list] = {
+                'Artist': artists[rows].tolist(),
+                'Play Count': play_count[rows].tolist(),
+                'Year': year[rows].tolist(),
+                'Tags': self._format_shared(chunk['Tags'].to_numpy(dtype = 'object'), apply_tags).tolist(),
+                'Total Time': chunk['Total Time'].astype(str).tolist()
+            }
+
+            if 'Sub Tags' in chunk.columns:
+                sub_tags = [x if isinstance(x, (list, tuple)) else (nan, nan, nan) for x in chunk['Sub Tags']]
+                for i in range(3):
+                    columns[f'Sub Tag {i + 1}'] = cells([x[i] for x in sub_tags])
+
+            for col in fin_cols:
+                if col not in columns:
+                    columns[col] = cells(chunk[col]) if col in chunk.columns else [None] * len(chunk)
+
+            return [list(row) for row in zip(*(columns[col] for col in fin_cols))]
+
+        # The parts of the rows, each on its own sheet or file
+        limit = 1048575
+        rows_per_sheet = limit if rows_per_sheet is None else min(rows_per_sheet, limit)
+        parts = [order[i:i + rows_per_sheet] for i in range(0, len(order), rows_per_sheet)] or [order]
+        root, ext = os.path.splitext(os.fsdecode(path))
+
+        header_font = Font(bold = True)
+        header_border = Border(left = Side(style = 'thin'), right = Side(style = 'thin'), top = Side(style = 'thin'), bottom = Side(style = 'thin'))
+        header_alignment = Alignment(horizontal = 'center', vertical = 'top')
+
+        workbook: Workbook | None = None
+        for i, part in enumerate(parts):
+            if workbook is None:
+                workbook = Workbook(write_only = True)
+
+            worksheet = workbook.create_sheet(str(sheet) if i == 0 or split_files else f'{sheet}-{i + 1}')
+            header = []
+            for col in fin_cols:
+                cell = WriteOnlyCell(worksheet, value = col)
+                cell.font, cell.border, cell.alignment = header_font, header_border, header_alignment
+                header.append(cell)
+            worksheet.append(header)
+
+            with Profiler.stage('format', len(part)):
+                for start in range(0, len(part), chunksize):
+                    for row in format_rows(part[start:start + chunksize]):
+                        worksheet.append(row)
+
+            if split_files:
+                with Profiler.stage('save', len(part)):
+                    workbook.save(root + ext if i == 0 else f'{root}-{i + 1}{ext}')
+                workbook = None
+
+        if workbook is not None:
+            with Profiler.stage('save', len(df)):
+                workbook.save(root + ext)
 
     def to_msgpack(self: 'Library',
                    path: str | bytes | os.PathLike[str]) -> None:
         '''
-        Export the library to a message pack file.
+        Export the library to a columnar message pack file.
         '''
         
-        def normalize(obj: Any) -> Any:
-            if isinstance(obj, type(pd.NA)) or isinstance(obj, type(pd.NaT)):
-                return None
-
-            if isinstance(obj, pd.Timestamp):
-                return obj.isoformat()
-
-            if isinstance(obj, pd.Timedelta):
-                return str(obj)
-
-            if isinstance(obj, set):
-                return {'__set__': list(obj)}
-
-            return obj
-        
-        def traverse(obj: Any) -> Any:
-            if isinstance(obj, dict):
-                return {k: traverse(v) for k, v in obj.items()}
-            
-            elif isinstance(obj, list):
-                return [traverse(v) for v in obj]
-            
-            else:
-                return normalize(obj)
-        
         if self.is_valid():
-            records = self.__df__.to_dict(orient='records')
-            normalized = [traverse(row) for row in records]
             with open(path, 'wb') as f:
-                f.write(msgpack.packb(normalized, use_bin_type = True)) # type: ignore
+                Codec.dump(self.__df__, f)
 
         else:
             raise ValueError('The library is corrupted.')
 
+@Profiler.instrument()
 class LibraryMerger:
     '''
     The container of the iTunes library merge result.
     '''
     
-    def __init__(self: 'LibraryMerger', matched: pd.DataFrame, next_only: pd.DataFrame, prev_only: pd.DataFrame) -> None:
+    def __init__(self: 'LibraryMerger', matched: pd.DataFrame, next_only: pd.DataFrame, prev_only: pd.DataFrame, proposed: pd.DataFrame | None = None) -> None:
         self.__mdf__ = matched
         self.__ndf__ = next_only
         self.__pdf__ = prev_only
+        self.__xdf__ = pd.DataFrame(columns = ['Score']) if proposed is None else proposed
 
     def __repr__(self: 'LibraryMerger') -> str:
+        if len(self.__xdf__) > 0:
+            return f'iTunes Library Merge Result <Matched/Left Only/Right Only/Proposed: {len(self.__mdf__)}/{len(self.__pdf__)}/{len(self.__ndf__)}/{len(self.__xdf__)}>'
         return f'iTunes Library Merge Result <Matched/Left Only/Right Only: {len(self.__mdf__)}/{len(self.__pdf__)}/{len(self.__ndf__)}>'
 
     __name__ = 'LibraryMerger'
@@ -715,7 +1076,7 @@ class LibraryMerger:
         '''
         Matched tracks.
         '''
-        return self.__mdf__.copy(deep = True)
+        return Utils.copy_frame(self.__mdf__)
     
     @matched.setter
     def matched(self: 'LibraryMerger', input: pd.DataFrame) -> None:
@@ -726,7 +1087,7 @@ class LibraryMerger:
         '''
         The tracks that only appear on the next library.
         '''
-        return self.__ndf__.copy(deep = True)
+        return Utils.copy_frame(self.__ndf__)
     
     @next_only.setter
     def next_only(self: 'LibraryMerger', input: pd.DataFrame) -> None:
@@ -737,18 +1098,29 @@ class LibraryMerger:
         '''
         The tracks that only appear on the previous library.
         '''
-        return self.__pdf__.copy(deep = True)
+        return Utils.copy_frame(self.__pdf__)
     
     @prev_only.setter
     def prev_only(self: 'LibraryMerger', input: pd.DataFrame) -> None:
-        self.__npf__ = input
+        self.__pdf__ = input
+    
+    @property
+    def proposed(self: 'LibraryMerger') -> pd.DataFrame:
+        '''
+        The proposed pairs of the unmatched tracks, with the previous columns suffixed by `_p` and the next ones by `_n`.
+        '''
+        return Utils.copy_frame(self.__xdf__)
+
+    @proposed.setter
+    def proposed(self: 'LibraryMerger', input: pd.DataFrame) -> None:
+        self.__xdf__ = input
     
     def as_lib(self: 'LibraryMerger', include_next: bool = True, include_prev: bool = False) -> 'Library':
         '''
         Retrieve the matched result as a library.
         '''
 
-        data = self.__mdf__.copy()
+        data = self.__mdf__
         if include_next:
             data = pd.concat([data, self.__ndf__])
 
@@ -756,4 +1128,327 @@ class LibraryMerger:
             data = pd.concat([data, self.__pdf__])
 
         data = data.sort_values('Track ID', ignore_index = True)
-        return Library(data)
\ No newline at end of file
+        return Library(data)
+
+    def propose(self: 'LibraryMerger', score_cutoff: float = 85, duration_bucket: float = 1, max_block: int = 500, workers: int = -1) -> pd.DataFrame:
+        '''
+        Pair the unmatched tracks whose titles are alike, and store the pairs as `proposed`. Only the tracks sharing an artist or a duration bucket (in seconds) are compared, and the blocks holding over `max_block` tracks on either side are left out. Each track is proposed at most once, to its best partner scoring at least `score_cutoff`.
+        '''
+
+        def block_keys(df: pd.DataFrame, shifts: tuple[int, ...]) -> pd.DataFrame:
+            # Each distinct artist is normalized once
+            artists = df['Artist'].map(Library._to_list).explode()
+            codes, uniques = pd.factorize(artists)
+            tokens = np.array([Utils.normalize_value(x) for x in uniques] + [''], dtype = 'object')[codes]
+            kept = tokens != ''
+            parts = [pd.DataFrame({'key': 'artist:' + tokens[kept], 'row': artists.index.to_numpy(dtype = 'int64')[kept]})]
+
+            if 'Total Time' in df.columns:
+                seconds = pd.to_timedelta(df['Total Time']).dt.total_seconds().to_numpy(dtype = 'float64', na_value = np.nan)
+                timed = np.flatnonzero(~np.isnan(seconds))
+                buckets = np.floor(seconds[timed] / duration_bucket).astype('int64')
+                for shift in shifts:
+                    parts.append(pd.DataFrame({'key': 'time:' + (buckets + shift).astype(str).astype('object'), 'row': timed}))
+
+            return pd.concat(parts, ignore_index = True).astype({'row': 'int64'})
+
+        prev_df = self.__pdf__.reset_index(drop = True)
+        next_df = self.__ndf__.reset_index(drop = True)
+        if not {'Name', 'Artist'} <= set(prev_df.columns) & set(next_df.columns):
+            raise ValueError('The unmatched tracks should have the `Name` and `Artist` columns.')
+
+        prev_names = np.array([Utils.normalize_value(x) for x in prev_df['Name']], dtype = 'object')
+        next_names = np.array([Utils.normalize_value(x) for x in next_df['Name']], dtype = 'object')
+
+        # The next tracks also join the adjacent buckets, so the pairs across a bucket boundary meet
+        prev_keys = block_keys(prev_df, (0,))
+        next_keys = block_keys(next_df, (-1, 0, 1))
+        codes, _ = pd.factorize(pd.concat([prev_keys['key'], next_keys['key']], ignore_index = True))
+        prev_blocks = pd.Series(prev_keys['row'].to_numpy()).groupby(codes[:len(prev_keys)]).agg(list)
+        next_blocks = pd.Series(next_keys['row'].to_numpy()).groupby(codes[len(prev_keys):]).agg(list)
+
+        # Each block is scored on its own, so the memory is bound by the largest block
+        found: list[pd.DataFrame] = []
+        for code in prev_blocks.index.intersection(next_blocks.index):
+            rows_p = np.array(prev_blocks[code], dtype = 'int64')
+            rows_n = np.array(next_blocks[code], dtype = 'int64')
+            if len(rows_p) > max_block or len(rows_n) > max_block:
+                continue
+
+            scores = process.cdist(prev_names[rows_p], next_names[rows_n], scorer = fuzz.ratio, score_cutoff = score_cutoff, dtype = np.float64, workers = workers)
+            i, j = np.nonzero(scores >= score_cutoff)
+            found.append(pd.DataFrame({'row_p': rows_p[i], 'row_n': rows_n[j], 'Score': scores[i, j]}))
+
+        pairs = pd.concat(found, ignore_index = True) if found else pd.DataFrame({'row_p': [], 'row_n': [], 'Score': []}).astype({'row_p': 'int64', 'row_n': 'int64'})
+        pairs = pairs.drop_duplicates(['row_p', 'row_n']).sort_values(['Score', 'row_p', 'row_n'], ascending = [False, True, True])
+
+        # Greedy one-to-one assignment, best scores first
+        taken_p: set[int] = set()
+        taken_n: set[int] = set()
+        chosen: list[int] = []
+        for i, (p, n) in enumerate(zip(pairs['row_p'].tolist(), pairs['row_n'].tolist())):
+            if p not in taken_p and n not in taken_n:
+                taken_p.add(p)
+                taken_n.add(n)
+                chosen.append(i)
+
+        pairs = pairs.iloc[chosen]
+        self.__xdf__ = pd.concat([
+            pd.DataFrame({'Score': pairs['Score'].to_numpy()}),
+            prev_df.iloc[pairs['row_p'].to_numpy()].reset_index(drop = True).add_suffix('_p'),
+            next_df.iloc[pairs['row_n'].to_numpy()].reset_index(drop = True).add_suffix('_n')
+        ], axis = 1)
+        return self.proposed
+
+class LibraryDiff:
+    '''
+    The container of the changes between two iTunes libraries.
+    '''
+
+    def __init__(self: 'LibraryDiff', added: pd.DataFrame, removed: pd.DataFrame, changed: pd.DataFrame) -> None:
+        self.__adf__ = added
+        self.__rdf__ = removed
+        self.__cdf__ = changed
+
+    def __len__(self: 'LibraryDiff') -> int:
+        return len(self.__adf__) + len(self.__rdf__) + len(self.__cdf__)
+
+    def __repr__(self: 'LibraryDiff') -> str:
+        return f'iTunes Library Diff <Added/Removed/Changed: {len(self.__adf__)}/{len(self.__rdf__)}/{len(self.__cdf__)}>'
+
+    __name__ = 'LibraryDiff'
+
+    @property
+    def added(self: 'LibraryDiff') -> pd.DataFrame:
+        '''
+        The tracks that only appear on the newer library.
+        '''
+        return Utils.copy_frame(self.__adf__)
+
+    @property
+    def changed(self: 'LibraryDiff') -> pd.DataFrame:
+        '''
+        The changed tracks, as in the newer library.
+        '''
+        return Utils.copy_frame(self.__cdf__)
+
+    @property
+    def removed(self: 'LibraryDiff') -> pd.DataFrame:
+        '''
+        The tracks that only appear on the older library.
+        '''
+        return Utils.copy_frame(self.__rdf__)
+
+class LazyLibrary:
+    '''
+    The lazy query on an iTunes library. The operations are only recorded, and `collect` runs the optimized plan: the row filters on `Tags` and `Artist` run ahead of the transforms they don't depend on, consecutive row filters are evaluated as one mask, and consecutive maps of a column are fused.
+    '''
+
+    def __init__(self: 'LazyLibrary', lib: Library, steps: list[tuple[str, dict[str, Any]]] | None = None) -> None:
+        self.__lib__ = lib
+        self.__steps__ = [] if steps is None else steps
+
+    def __len__(self: 'LazyLibrary') -> int:
+        return len(self.__steps__)
+
+    def __repr__(self: 'LazyLibrary') -> str:
+        return f'iTunes Lazy Library <{len(self.__lib__.__df__)} tracks, {len(self.__steps__)} operations>'
+
+    __name__ = 'LazyLibrary'
+
+    @classmethod
+    def _commutes(cls, node: tuple[str, dict[str, Any]], column: str) -> bool:
+        '''
+        Whether a row filter on the column can run ahead of the node.
+        '''
+
+        op, args = node
+        if op == 'nested_artists':
+            return column != 'Artist'
+        if op == 'map':
+            return column != args['column']
+        return False
+
+    @classmethod
+    def _describe(cls, op: str, args: dict[str, Any]) -> str:
+        def describe_filter(f: dict[str, Any]) -> str:
+            blacklist = [] if f['blacklist'] is None else list(f['blacklist'])
+            whitelist = [] if f['whitelist'] is None else list(f['whitelist'])
+            return f'`{f["column"]}` ({len(blacklist)} blacklisted, {len(whitelist)} whitelisted)'
+
+        match op:
+            case 'select':
+                return 'Select the rows by ' + ', '.join(describe_filter(f) for f in args['filters']) + ' in one pass'
+            case 'filter':
+                return 'Filter ' + describe_filter(args)
+            case 'map' if 'tables' in args:
+                fused = f', {len(args["tables"])} tables fused' if len(args['tables']) > 1 else ''
+                return f'Map `{args["column"]}` ({sum(len(t) for t in args["tables"])} entries{fused})'
+            case 'map':
+                return f'Map `{args["column"]}` ({len(args["table"])} entries)'
+            case _:
+                feat = ', featured artists detected' if args['detect_feat'] else ''
+                return f'Split the artists ({len(args["table"])} mappings, {len(args["artists_with_comma"])} protected artists{feat})'
+
+    @classmethod
+    def _execute(cls, lib: Library, nodes: list[tuple[str, dict[str, Any]]]) -> Library:
+        if not lib.is_valid():
+            raise ValueError('The library is corrupted.')
+
+        lib = lib.copy(deep = False)
+        for op, args in nodes:
+            match op:
+                case 'select':
+                    lib = cls._select(lib, args['filters'])
+                case 'filter':
+                    lib = lib.filter(**args)
+                case 'map':
+                    lib = lib._map(args['column'], args['tables'])
+                case _:
+                    lib = lib.nested_artists(**args)
+        return lib
+
+    @classmethod
+    def _select(cls, lib: Library, filters: list[dict[str, Any]]) -> Library:
+        '''
+        Apply the row filters on `Tags` and `Artist` in one pass, as `Library.filter` would one by one.
+        '''
+
+        df = lib.__df__
+        keep = np.ones(len(df), dtype = 'bool')
+        tags: TagIndex | None = None
+        narrowed: set | None = None
+
+        for f in filters:
+            blackset = set() if f['blacklist'] is None else set(f['blacklist'])
+            whiteset = set() if f['whitelist'] is None else set(f['whitelist'])
+
+            if f['column'] == 'Tags':
+                if tags is None:
+                    tags = lib.tags
+
+                # The earlier whitelists have narrowed the tags down
+                if narrowed is not None:
+                    blackset &= narrowed
+                keep &= ~tags.any(blackset)
+                if len(whiteset) > 0:
+                    narrowed = whiteset if narrowed is None else whiteset & narrowed
+                    keep &= tags.any(narrowed)
+
+            else:
+                keep &= ~lib.artist_index.mask(blackset)
+                if len(whiteset) > 0:
+                    keep &= lib.artist_index.mask(whiteset)
+
+        # The rows change, so nothing cached carries over
+        new_lib = lib.copy(deep = False)
+        new_lib.__cache__ = {}
+        new_lib.__df__ = df[keep].reset_index(drop = True)
+        if narrowed is not None:
+            assert tags is not None
+            new_lib.__df__['Tags'] = tags.take(keep).intersect(narrowed).to_series()
+
+        if lib.__search__ is not None:
+            new_lib.__search__ = lib.__search__.derive(new_lib.__df__, keep, ['Tags'] if narrowed is not None else [])
+        return new_lib
+
+    def collect(self: 'LazyLibrary') -> Library:
+        '''
+        Run the optimized plan into a library.
+        '''
+
+        return self._execute(self.__lib__, self.plan())
+
+    def explain(self: 'LazyLibrary', optimized: bool = True) -> str:
+        '''
+        Describe the plan to run, or the operations as recorded if `optimized` is `False`.
+        '''
+
+        nodes = self.plan() if optimized else self.__steps__
+        lines = [f'iTunes Lazy Library Plan <{len(self.__lib__.__df__)} tracks, {len(nodes)} steps>']
+        lines.extend(f'  {i}. {self._describe(op, args)}' for i, (op, args) in enumerate(nodes, 1))
+        return '\n'.join(lines)
+
+    def filter(self: 'LazyLibrary', column: str, whitelist: Iterable | None = None, blacklist: Iterable | None = None) -> 'LazyLibrary':
+        '''
+        Record a `Library.filter`.
+        '''
+
+        return LazyLibrary(self.__lib__, self.__steps__ + [('filter', {'column': column, 'whitelist': whitelist, 'blacklist': blacklist})])
+
+    def map(self: 'LazyLibrary', column: str, table: dict) -> 'LazyLibrary':
+        '''
+        Record a `Library.map`.
+        '''
+
+        return LazyLibrary(self.__lib__, self.__steps__ + [('map', {'column': column, 'table': table})])
+
+    def nested_artists(self: 'LazyLibrary',
+                       table: dict[str, str | list[str]] = {},
+                       artists_with_comma: list[str] = [],
+                       detect_feat: bool = True,
+                       processes: int | None = None) -> 'LazyLibrary':
+        '''
+        Record a `Library.nested_artists`.
+        '''
+
+        args = {'table': table, 'artists_with_comma': artists_with_comma, 'detect_feat': detect_feat, 'processes': processes}
+        return LazyLibrary(self.__lib__, self.__steps__ + [('nested_artists', args)])
+
+    def plan(self: 'LazyLibrary') -> list[tuple[str, dict[str, Any]]]:
+        '''
+        Optimize the recorded operations into the steps to run.
+        '''
+
+        nodes: list[tuple[str, dict[str, Any]]] = []
+        for op, args in self.__steps__:
+            if op == 'filter' and args['column'] in ('Tags', 'Artist'):
+                # Move ahead of the transforms the filter doesn't depend on, joining the row filters there
+                i = len(nodes)
+                while i > 0 and self._commutes(nodes[i - 1], args['column']):
+                    i -= 1
+                if i > 0 and nodes[i - 1][0] == 'select':
+                    nodes[i - 1][1]['filters'].append(args)
+                else:
+                    nodes.insert(i, ('select', {'filters': [args]}))
+
+            elif op == 'map':
+                # Maps of other columns are independent, so an earlier map of the same column takes the table
+                i = len(nodes)
+                while i > 0 and nodes[i - 1][0] == 'map' and nodes[i - 1][1]['column'] != args['column']:
+                    i -= 1
+                if i > 0 and nodes[i - 1][0] == 'map':
+                    nodes[i - 1][1]['tables'].append(args['table'])
+                else:
+                    nodes.append(('map', {'column': args['column'], 'tables': [args['table']]}))
+
+            else:
+                nodes.append((op, args))
+
+        return nodes
+
+    def search(self: 'LazyLibrary',
+               q: str,
+               columns: str | list[str] | None = None,
+               contains: bool = True,
+               score_cutoff: float = 50,
+               limit: int | None = None,
+               workers: int = 1) -> pd.DataFrame:
+        '''
+        Run the plan and search in the result (see `Library.search`). When the `columns` are given, the search runs ahead of the trailing transforms that don't write them, which then only transform the results.
+        '''
+
+        nodes = self.plan()
+        searched = {columns} if isinstance(columns, str) else set(columns or [])
+        searched &= set(self.__lib__.__df__.columns)
+
+        split = len(nodes)
+        while searched and split > 0 and nodes[split - 1][0] in ('map', 'nested_artists'):
+            op, args = nodes[split - 1]
+            if (args['column'] if op == 'map' else 'Artist') in searched:
+                break
+            split -= 1
+
+        lib = self._execute(self.__lib__, nodes[:split])
+        rows = lib._search_rows(q, columns, contains, score_cutoff, limit, workers)
+        return self._execute(Library(lib.__df__.loc[rows].reset_index(drop = True)), nodes[split:]).__df__
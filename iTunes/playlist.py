@@ -1,50 +1,112 @@
 from __future__ import annotations
 
+from .profiler import Profiler
 import csv
+from itertools import islice
+import numpy as np
 import os
 import pandas as pd
+from typing import Any, Iterator
 
+@Profiler.instrument()
 class PlaylistAccessor():
     '''
     Access the exported iTunes playlist file.
     '''
 
+    # The columns holding whole numbers, converted when the data is typed
+    numeric = ['Size', 'Time', 'Disc Number', 'Disc Count', 'Track Number', 'Track Count', 'Year', 'Bit Rate', 'Sample Rate', 'Plays', 'Skips', 'My Rating']
+
     def __init__(self: PlaylistAccessor,
-                 path: str | bytes | os.PathLike) -> None:
+                 path: str | bytes | os.PathLike,
+                 chunksize: int = 10000) -> None:
         '''
-        Initiate an accessor.
+        Initiate an accessor. The file is only read on demand, `chunksize` rows at a time when iterated.
         '''
 
-        self._buffer = []
-
         if isinstance(path, (str, bytes, os.PathLike)):
             if os.path.isfile(path):
-                self._buffer = list(csv.reader(open(path, 'r', encoding='utf-16'), delimiter='\t'))
+                self.path = path
+                self.chunksize = chunksize
             else:
                 raise FileNotFoundError(f'The file doesn\'t exist in the path: {path}')
         else:
             raise TypeError('The path should be a `str`, `bytes`, or `os.PathLike` object.')
-        
+
+    def __iter__(self: PlaylistAccessor) -> Iterator[pd.DataFrame]:
+        return self.chunks()
+
     __name__ = 'PlaylistAccessor'
-        
-    def to_dataframe(self: PlaylistAccessor) -> pd.DataFrame:
+
+    @property
+    def header(self: PlaylistAccessor) -> list[str]:
+        '''
+        The column names in the file.
+        '''
+        with open(self.path, 'r', encoding = 'utf-16') as f:
+            return [h.strip() for h in next(csv.reader(f, delimiter = '\t'), [])]
+
+    def chunks(self: PlaylistAccessor, chunksize: int | None = None, typed: bool = False) -> Iterator[pd.DataFrame]:
+        '''
+        Read the file lazily into DataFrames of `chunksize` rows (the accessor's by default). Rows wider than the header get the `Extra_` columns, as wide as the widest row of their chunk. See `to_dataframe` for `typed`.
+        '''
+
+        header = self.header
+        for chunk in self._batches(chunksize or self.chunksize):
+            yield self._frame(chunk, header, typed)
+
+    def to_dataframe(self: PlaylistAccessor, typed: bool = False) -> pd.DataFrame:
+        '''
+        Read the file into a pandas DataFrame. The cells are stripped strings, unless `typed` is set, where the numeric columns become nullable integers.
+        '''
+
+        header = self.header
+        if not header:
+            raise ValueError('No data in the file to export.')
+
+        with Profiler.stage('read') as span:
+            chunk = next(self._batches(None), pd.DataFrame())
+            span.rows_out = len(chunk)
+        with Profiler.stage('frame', len(chunk)):
+            return self._frame(chunk, header, typed)
+
+    def _batches(self: PlaylistAccessor, chunksize: int | None) -> Iterator[pd.DataFrame]:
         '''
-        Convert the buffer into a pandas DataFrame.
+        Split the rows below the header by the csv module, `chunksize` rows (all if `None`) at a time. The cells are left raw, and the shorter rows are padded with `None`.
         '''
-        if not self._buffer:
-            raise ValueError('No data in buffer to export.')
-        
-        header = [h.strip() for h in self._buffer[0]]
-        data = [[cell.strip() for cell in row] for row in self._buffer[1:]]
 
-        # Find the maximum row width
-        max_width = max(len(row) for row in data)
+        # The fields are counted by the csv module, as `pandas.read_csv` drops the extra cells of a wide row opening a chunk
+        with open(self.path, 'r', encoding = 'utf-16') as f:
+            rows = islice(csv.reader(f, delimiter = '\t'), 1, None)
+            done = 0
+            while batch := list(islice(rows, chunksize)):
+                yield pd.DataFrame(batch, index = pd.RangeIndex(done, done + len(batch)))
+                done += len(batch)
 
-        # Expand header if needed
-        while len(header) < max_width:
-            header.append(f'Extra_{len(header) + 1}')
+    def _frame(self: PlaylistAccessor, chunk: pd.DataFrame, header: list[str], typed: bool) -> pd.DataFrame:
+        '''
+        Name, pad, and strip the raw cells of a chunk.
+        '''
+
+        width = max(chunk.shape[1], len(header))
+        columns = header + [f'Extra_{i + 1}' for i in range(len(header), width)]
+
+        # The cells missing in the shorter rows are empty
+        cells: dict[int, Any] = {}
+        for i in range(width):
+            if i in chunk.columns:
+                values = chunk[i].to_numpy(dtype = 'object', na_value = '')
+                cells[i] = np.fromiter(map(str.strip, values), dtype = 'object', count = len(values))
+            else:
+                cells[i] = ''
 
-        # Pad shorter rows (optional for safety)
-        padded_data = [row + [''] * (len(header) - len(row)) for row in data]
+        df = pd.DataFrame(cells, index = chunk.index)
+        df.columns = columns
 
-        return pd.DataFrame(padded_data, columns=header)
\ No newline at end of file
+        if typed:
+            for i, col in enumerate(columns):
+                if col in self.numeric:
+                    s = df.iloc[:, i]
+                    numbers = pd.to_numeric(s.where(s != ''), errors = 'coerce', dtype_backend = 'numpy_nullable')
+                    df.isetitem(i, numbers.astype('Int64') if (numbers.dropna() % 1 == 0).all() else numbers)
+        return df
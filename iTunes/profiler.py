@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+from functools import wraps
+import inspect
+import json
+import os
+import pandas as pd
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Iterable
+
+class Span:
+    '''
+    A timed call or stage. The rows out can be set inside the stage.
+    '''
+
+    __slots__ = ('profiler', 'name', 'parent', 'depth', 'start', 'end', 'rows_in', 'rows_out', 'base', 'peak', 'thread')
+
+    def __init__(self: 'Span', profiler: 'Profiler', name: str, parent: 'Span | None', rows_in: int | None) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.rows_in = rows_in
+        self.rows_out: int | None = None
+        self.start = 0.0
+        self.end = 0.0
+        self.base = 0
+        self.peak = 0
+        self.thread = threading.get_ident()
+
+    def __repr__(self: 'Span') -> str:
+        return f'iTunes Span <{self.name}, {self.end - self.start:.4f}s>'
+
+    __name__ = 'Span'
+
+    def __enter__(self: 'Span') -> 'Span':
+        self.profiler._open(self)
+        return self
+
+    def __exit__(self: 'Span', *args: Any) -> None:
+        self.profiler._close(self)
+
+class NullSpan(Span):
+    '''
+    The span of the stages while no profiler is running, which records nothing.
+    '''
+
+    def __init__(self: 'NullSpan') -> None:
+        pass
+
+    def __enter__(self: 'NullSpan') -> 'NullSpan':
+        return self
+
+    def __exit__(self: 'NullSpan', *args: Any) -> None:
+        pass
+
+    def __setattr__(self: 'NullSpan', name: str, value: Any) -> None:
+        pass
+
+class Profiler:
+    '''
+    The opt-in instrumentation of the public methods of the registered classes (see `instrument`) and the stages within them, recording the wall time, the rows in and out, and the peak traced memory of each. The methods are only wrapped while a profiler runs, so nothing is paid otherwise.
+    '''
+
+    # The registered classes and the public methods not to trace, and the profiler running now
+    __classes__: dict[type, set[str]] = {}
+    __active__: 'Profiler | None' = None
+    __null__ = NullSpan()
+
+    def __init__(self: 'Profiler', memory: bool = True) -> None:
+        '''
+        Initiate a profiler. The peak memory is traced by `tracemalloc` if `memory` is set, which slows the profiled code down.
+        '''
+
+        self.memory = memory
+        self.records: list[dict[str, Any]] = []
+        self._origin = 0.0
+        self._local = threading.local()
+        self._patched: list[tuple[type, str, Any]] = []
+        self._tracing = False
+
+    def __enter__(self: 'Profiler') -> 'Profiler':
+        self.start()
+        return self
+
+    def __exit__(self: 'Profiler', *args: Any) -> None:
+        self.stop()
+
+    def __repr__(self: 'Profiler') -> str:
+        return f'iTunes Profiler <{len(self.records)} spans>'
+
+    __name__ = 'Profiler'
+
+    @classmethod
+    def instrument(cls, exclude: Iterable[str] = ()) -> Callable[[type], type]:
+        '''
+        Register a class, whose public methods and properties (except `exclude`) are traced while a profiler runs.
+        '''
+
+        def register(target: type) -> type:
+            cls.__classes__[target] = set(exclude)
+            return target
+
+        return register
+
+    @classmethod
+    def stage(cls, name: str, rows: int | None = None) -> Span:
+        '''
+        Trace a stage within a method as a `with` block, along with its rows in. Nothing is recorded unless a profiler runs.
+        '''
+
+        profiler = cls.__active__
+        if profiler is None:
+            return cls.__null__
+        return profiler._span(name, rows)
+
+    @classmethod
+    def rows(cls, obj: Any) -> int | None:
+        '''
+        The rows of a library, a merge result, a DataFrame or a Series, or the total of a tuple of them.
+        '''
+
+        if isinstance(obj, (pd.DataFrame, pd.Series)):
+            return len(obj)
+        if isinstance(obj, tuple):
+            counts = [n for n in map(cls.rows, obj) if n is not None]
+            return sum(counts) if counts else None
+
+        # Duck-typed, as the library module depends on this one
+        df = getattr(obj, '__df__', None)
+        if isinstance(df, pd.DataFrame):
+            return len(df)
+        if isinstance(getattr(obj, '__mdf__', None), pd.DataFrame):
+            return len(obj.__mdf__) + len(obj.__ndf__) + len(obj.__pdf__)
+        return None
+
+    def start(self: 'Profiler') -> None:
+        '''
+        Start recording, discarding the previous records.
+        '''
+
+        if Profiler.__active__ is not None:
+            raise ValueError('Another profiler is running.')
+
+        self.records = []
+        self._local = threading.local()
+        self._tracing = self.memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+
+        self._patch()
+        Profiler.__active__ = self
+        self._origin = time.perf_counter()
+
+    def stop(self: 'Profiler') -> None:
+        '''
+        Stop recording.
+        '''
+
+        if Profiler.__active__ is not self:
+            return
+
+        Profiler.__active__ = None
+        for target, name, attr in reversed(self._patched):
+            setattr(target, name, attr)
+        self._patched = []
+
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def summary(self: 'Profiler') -> pd.DataFrame:
+        '''
+        Summarize the records by name: the calls, the total and the longest seconds, and the highest peak memory.
+        '''
+
+        df = self.to_dataframe()
+        return df.groupby('Name', sort = False).agg(
+            Calls = ('Seconds', 'size'),
+            Seconds = ('Seconds', 'sum'),
+            Longest = ('Seconds', 'max'),
+            Peak_MB = ('Peak MB', 'max')
+        ).rename(columns = {'Peak_MB': 'Peak MB'}).sort_values('Seconds', ascending = False)
+
+    def to_dataframe(self: 'Profiler') -> pd.DataFrame:
+        '''
+        Export the records to a pandas DataFrame, a row per span in the order they started. The peak memory is over the memory as the span started, in MB.
+        '''
+
+        columns = ['Name', 'Parent', 'Depth', 'Thread', 'Start', 'Seconds', 'Rows In', 'Rows Out', 'Peak MB']
+        df = pd.DataFrame(self.records, columns = columns)
+        return df.sort_values('Start', kind = 'stable').reset_index(drop = True).astype({'Rows In': 'Int64', 'Rows Out': 'Int64'})
+
+    def to_json(self: 'Profiler', path: str | bytes | os.PathLike[str] | None = None) -> str:
+        '''
+        Export the records as a trace of the Trace Event Format, which the flame-chart viewers (e.g. Perfetto, speedscope, `chrome://tracing`) load. The trace is written to `path` if specified.
+        '''
+
+        pid = os.getpid()
+        events = []
+        for r in sorted(self.records, key = lambda r: r['Start']):
+            args = {k: r[k] for k in ('Rows In', 'Rows Out', 'Peak MB') if r[k] is not None}
+            events.append({
+                'name': r['Name'],
+                'cat': 'iTunes',
+                'ph': 'X',
+                'ts': round(r['Start'] * 1e6, 3),
+                'dur': round(r['Seconds'] * 1e6, 3),
+                'pid': pid,
+                'tid': r['Thread'],
+                'args': args
+            })
+
+        trace = json.dumps({'traceEvents': events, 'displayTimeUnit': 'ms'}, ensure_ascii = False)
+        if path is not None:
+            with open(path, 'w', encoding = 'utf-8') as f:
+                f.write(trace)
+        return trace
+
+    def _close(self: 'Profiler', span: Span) -> None:
+        span.end = time.perf_counter()
+        peak = None
+        if self._tracing:
+            # The peak since the last reset, then the parent goes on from here
+            span.peak = max(span.peak, tracemalloc.get_traced_memory()[1])
+            peak = round((span.peak - span.base) / 2 ** 20, 3)
+            if span.parent is not None:
+                span.parent.peak = max(span.parent.peak, span.peak)
+            tracemalloc.reset_peak()
+
+        self._local.stack.pop()
+        self.records.append({
+            'Name': span.name,
+            'Parent': None if span.parent is None else span.parent.name,
+            'Depth': span.depth,
+            'Thread': span.thread,
+            'Start': span.start - self._origin,
+            'Seconds': span.end - span.start,
+            'Rows In': span.rows_in,
+            'Rows Out': span.rows_out,
+            'Peak MB': peak
+        })
+
+    def _open(self: 'Profiler', span: Span) -> None:
+        stack = self._stack()
+        stack.append(span)
+        if self._tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if span.parent is not None:
+                span.parent.peak = max(span.parent.peak, peak)
+            tracemalloc.reset_peak()
+            span.base = span.peak = current
+        span.start = time.perf_counter()
+
+    def _patch(self: 'Profiler') -> None:
+        '''
+        Wrap the public methods and properties of the registered classes. The generators are left out, as they run in their callers.
+        '''
+
+        for target, exclude in Profiler.__classes__.items():
+            for name, attr in list(vars(target).items()):
+                if name.startswith('_') or name in exclude:
+                    continue
+
+                label = f'{target.__qualname__}.{name}'
+                if isinstance(attr, (classmethod, staticmethod)) and inspect.isgeneratorfunction(attr.__func__):
+                    continue
+                elif isinstance(attr, classmethod):
+                    wrapped: Any = classmethod(self._traced(label, attr.__func__, skip_first = True))
+                elif isinstance(attr, staticmethod):
+                    wrapped = staticmethod(self._traced(label, attr.__func__))
+                elif isinstance(attr, property) and attr.fget is not None:
+                    wrapped = property(self._traced(label, attr.fget), attr.fset, attr.fdel, attr.__doc__)
+                elif inspect.isfunction(attr) and not inspect.isgeneratorfunction(attr):
+                    wrapped = self._traced(label, attr)
+                else:
+                    continue
+
+                self._patched.append((target, name, attr))
+                setattr(target, name, wrapped)
+
+    def _span(self: 'Profiler', name: str, rows_in: int | None) -> Span:
+        stack = self._stack()
+        return Span(self, name, stack[-1] if stack else None, rows_in)
+
+    def _stack(self: 'Profiler') -> list[Span]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _traced(self: 'Profiler', name: str, func: Callable, skip_first: bool = False) -> Callable:
+        profiler = self
+
+        @wraps(func)
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            # The rows in are of the first argument having rows, `self` included
+            rows_in = None
+            for arg in (args[1:] if skip_first else args):
+                rows_in = Profiler.rows(arg)
+                if rows_in is not None:
+                    break
+
+            with profiler._span(name, rows_in) as span:
+                result = func(*args, **kwargs)
+                span.rows_out = Profiler.rows(result)
+            return result
+
+        return traced
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+from .profiler import Profiler
+from .tags import TagIndex
+from numpy import nan
+import os
+import pandas as pd
+from typing import Any, Iterator
+from xml.etree import ElementTree
+
+class XMLReader:
+    '''
+    The incremental reader of the iTunes XML file.
+    '''
+
+    columns = ['Track ID', 'Name', 'Artist', 'Composer', 'Album', 'Genre', 'Year', 'Date Modified', 'Date Added', 'Play Count', 'Size', 'Total Time', 'Disc Number', 'Track Number']
+
+    def __init__(self: 'XMLReader',
+                 path: str | bytes | os.PathLike[str],
+                 chunksize: int = 10000,
+                 playlists: bool = True) -> None:
+        '''
+        Initiate a reader.
+        '''
+
+        if not (isinstance(path, (str, bytes, os.PathLike)) and os.path.isfile(path)):
+            raise ValueError('Invalid path.')
+
+        if chunksize < 1:
+            raise ValueError('The `chunksize` should be a positive integer.')
+
+        self.path = path
+        self.chunksize = chunksize
+        self.playlists = playlists
+        self._playlists: dict[str, set[int]] = {}
+
+    def __repr__(self: 'XMLReader') -> str:
+        return f'iTunes XML Reader <{self.path!r}>'
+
+    __name__ = 'XMLReader'
+
+    @property
+    def playlist_map(self: 'XMLReader') -> dict[str, set[int]]:
+        '''
+        The track IDs of each non-empty playlist, available once the file is read.
+        '''
+        return self._playlists
+
+    def __iter__(self: 'XMLReader') -> Iterator[pd.DataFrame]:
+        return self.iter_tracks()
+
+    def iter_tracks(self: 'XMLReader') -> Iterator[pd.DataFrame]:
+        '''
+        Read the file in one pass, yielding the tracks as typed DataFrame chunks. The playlists are collected along the way.
+        '''
+
+        wanted = set(self.columns)
+        chunk = self._new_chunk()
+        size = 0
+
+        section = None
+        tracks_done = False
+        playlists_done = not self.playlists
+        container: ElementTree.Element | None = None
+        items: ElementTree.Element | None = None
+        item_ids: list[int] = []
+        depth = 0
+
+        self._playlists = {}
+
+        with open(self.path, 'rb') as fp:
+            for event, elem in ElementTree.iterparse(fp, events = ('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if depth == 3 and elem.tag in ('dict', 'array'):
+                        container = elem
+                    elif depth == 5 and section == 'Playlists' and elem.tag == 'array':
+                        items = elem
+                    continue
+
+                depth -= 1
+
+                # The keys of the top-level dictionary
+                if depth == 2:
+                    if elem.tag == 'key':
+                        section = elem.text
+                    elif section == 'Tracks':
+                        tracks_done = True
+                    elif section == 'Playlists':
+                        playlists_done = True
+
+                    if tracks_done and playlists_done:
+                        break
+                    continue
+
+                if section == 'Tracks' and depth == 3 and elem.tag == 'dict':
+                    for key, value in self._pairs(elem):
+                        if key in wanted:
+                            chunk[key][size] = value
+
+                    size += 1
+                    if size == self.chunksize:
+                        yield self._to_frame(chunk, size)
+                        chunk = self._new_chunk()
+                        size = 0
+
+                    assert container is not None
+                    container.clear()
+
+                elif section == 'Playlists' and self.playlists:
+                    # Track IDs are collected as the items end, so a large playlist never sits in memory as a tree
+                    if depth == 5 and elem.tag == 'dict':
+                        for key, value in self._pairs(elem):
+                            if key == 'Track ID':
+                                item_ids.append(value)
+                        assert items is not None
+                        items.clear()
+
+                    elif depth == 3 and elem.tag == 'dict':
+                        name = dict(self._pairs(elem)).get('Name')
+                        if len(item_ids) > 0:
+                            self._playlists[str(name)] = set(item_ids)
+                        item_ids = []
+                        assert container is not None
+                        container.clear()
+
+                elif section == 'Playlists' and depth == 3:
+                    assert container is not None
+                    container.clear()
+
+        if size > 0:
+            yield self._to_frame(chunk, size)
+
+    def read(self: 'XMLReader') -> pd.DataFrame:
+        '''
+        Read the whole file into a DataFrame, including the `Tags` column.
+        '''
+
+        with Profiler.stage('parse tracks') as span:
+            chunks = list(self.iter_tracks())
+            if len(chunks) > 0:
+                df = pd.concat(chunks, ignore_index = True)
+            else:
+                df = self._to_frame(self._new_chunk(), 0)
+            span.rows_out = len(df)
+
+        with Profiler.stage('build tags', len(df)):
+            df['Tags'] = TagIndex.from_membership(df['Track ID'], self._playlists).to_series()
+        return df
+
+    def _new_chunk(self: 'XMLReader') -> dict[str, list[Any]]:
+        return {col: [nan] * self.chunksize for col in self.columns}
+
+    @staticmethod
+    def _pairs(elem: ElementTree.Element) -> Iterator[tuple[str | None, Any]]:
+        key = None
+        for child in elem:
+            if child.tag == 'key':
+                key = child.text
+                continue
+
+            match child.tag:
+                case 'integer':
+                    yield key, int(child.text or 0)
+                case 'string' | 'date':
+                    yield key, child.text or ''
+                case 'real':
+                    yield key, float(child.text or 0)
+                case 'true':
+                    yield key, True
+                case 'false':
+                    yield key, False
+                case _:
+                    pass
+
+    def _to_frame(self: 'XMLReader', chunk: dict[str, list[Any]], size: int) -> pd.DataFrame:
+        def to_str_number(s: pd.Series) -> pd.Series:
+            numbers = pd.to_numeric(s)
+            result = pd.Series([None] * len(s), index = s.index, dtype = 'object')
+            notnull = numbers.notnull()
+            result[notnull] = numbers[notnull].astype('int64').astype(str)
+            return result
+
+        df = pd.DataFrame({col: pd.Series(values[:size], dtype = 'object') for col, values in chunk.items()})
+
+        for col in ['Track ID', 'Year', 'Size']:
+            df[col] = pd.to_numeric(df[col])
+        for col in ['Date Modified', 'Date Added']:
+            df[col] = pd.to_datetime(df[col], format = '%Y-%m-%dT%H:%M:%SZ')
+        df['Play Count'] = pd.to_numeric(df['Play Count']).fillna(0).astype(int)
+        df['Total Time'] = pd.to_timedelta(pd.to_numeric(df['Total Time']), unit = 'ms')
+        df['Disc Number'] = to_str_number(df['Disc Number'])
+        df['Track Number'] = to_str_number(df['Track Number'])
+        return df
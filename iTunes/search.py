@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+from .utils import Utils
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from typing import Callable, Iterable
+
+class ColumnIndex:
+    '''
+    The search index of a column. Each row holds the code of its normalized value, and the normalized values are indexed by their n-grams.
+    '''
+
+    gram = 2
+
+    def __init__(self: 'ColumnIndex', codes: np.ndarray, vocab: np.ndarray, postings: dict[str, np.ndarray] | None, source: np.ndarray) -> None:
+        '''
+        Initiate an index from the code of each row, the normalized values, the n-gram postings (if any), and the column it was built from.
+        '''
+
+        self.codes = codes
+        self.vocab = vocab
+        self.postings = postings
+        self.source = source
+        self.__choices__: list[str] | None = None
+
+    def __len__(self: 'ColumnIndex') -> int:
+        return len(self.codes)
+
+    __name__ = 'ColumnIndex'
+
+    @property
+    def choices(self: 'ColumnIndex') -> list[str]:
+        '''
+        The normalized values, as compared by the fuzzy scorers.
+        '''
+        if self.__choices__ is None:
+            self.__choices__ = [Utils.normalize_value(v) for v in self.vocab]
+        return self.__choices__
+
+    @classmethod
+    def from_series(cls, s: pd.Series, grams: bool = True) -> 'ColumnIndex':
+        '''
+        Build an index from a series, with the n-gram postings if `grams` is set. Each distinct value is normalized once.
+        '''
+
+        values = s.to_numpy(dtype = 'object')
+        try:
+            codes, uniques = pd.factorize(values, use_na_sentinel = False)
+        except TypeError:
+            # Lists and sets are distinguished by their objects instead
+            codes, _ = pd.factorize(np.fromiter(map(id, values), dtype = 'uint64', count = len(values)))
+            _, first = np.unique(codes, return_index = True)
+            uniques = values[first]
+
+        normalized = np.fromiter((Utils.normalize_value(v) for v in uniques), dtype = 'object', count = len(uniques))
+        vocab_codes, vocab = pd.factorize(normalized)
+
+        postings = None
+        if grams:
+            gram_ids: defaultdict[str, list[int]] = defaultdict(list)
+            for i, value in enumerate(vocab):
+                for gram in {value[j:j + cls.gram] for j in range(len(value) - cls.gram + 1)}:
+                    gram_ids[gram].append(i)
+            postings = {gram: np.array(ids, dtype = 'int32') for gram, ids in gram_ids.items()}
+
+        return ColumnIndex(vocab_codes[codes].astype('int32'), np.asarray(vocab, dtype = 'object'), postings, s.to_numpy())
+
+    def cdist(self: 'ColumnIndex',
+              queries: list[str],
+              scorer: Callable[..., float] = fuzz.ratio,
+              score_cutoff: float | None = None,
+              workers: int = 1) -> np.ndarray:
+        '''
+        Score the normalized queries against each distinct value in one batch, giving a query × value matrix. Scores below `score_cutoff` are set to 0, and `workers = -1` uses all cores.
+        '''
+
+        return process.cdist(queries, self.choices, scorer = scorer, score_cutoff = score_cutoff, dtype = np.float64, workers = workers)
+
+    def contains(self: 'ColumnIndex', q: str) -> np.ndarray:
+        '''
+        Whether the normalized value of each row contains the normalized query. With the postings, only the values sharing every n-gram of the query are compared.
+        '''
+
+        if self.postings is None or len(q) < self.gram:
+            candidates = np.arange(len(self.vocab))
+        else:
+            postings = []
+            for gram in {q[j:j + self.gram] for j in range(len(q) - self.gram + 1)}:
+                if gram not in self.postings:
+                    return np.zeros(len(self.codes), dtype = 'bool')
+                postings.append(self.postings[gram])
+
+            postings.sort(key = len)
+            candidates = postings[0]
+            for posting in postings[1:]:
+                candidates = np.intersect1d(candidates, posting, assume_unique = True)
+
+        selected = np.zeros(len(self.vocab), dtype = 'bool')
+        selected[[i for i in candidates if q in self.vocab[i]]] = True
+        return selected[self.codes]
+
+    def is_built_from(self: 'ColumnIndex', s: pd.Series) -> bool:
+        '''
+        Verify whether the index was built from the column, i.e. the column still holds the same array.
+        '''
+
+        values = s.to_numpy()
+        return values.__array_interface__['data'][0] == self.source.__array_interface__['data'][0] and values.shape == self.source.shape
+
+    def take(self: 'ColumnIndex', rows: np.ndarray, s: pd.Series) -> 'ColumnIndex':
+        '''
+        Select the rows by positions, a boolean mask, or a slice, binding the index to the new column.
+        '''
+
+        index = ColumnIndex(self.codes[rows], self.vocab, self.postings, s.to_numpy())
+        index.__choices__ = self.__choices__
+        return index
+
+class SearchIndex:
+    '''
+    The search index of the library.
+    '''
+
+    def __init__(self: 'SearchIndex', columns: dict[str, ColumnIndex | None]) -> None:
+        '''
+        Initiate an index from the column indices. A column mapped to `None` is rebuilt the next time it is searched.
+        '''
+
+        self.columns = columns
+
+    def __repr__(self: 'SearchIndex') -> str:
+        built = [col for col, index in self.columns.items() if index is not None]
+        return f'iTunes Search Index <{len(built)}/{len(self.columns)} columns built>'
+
+    __name__ = 'SearchIndex'
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, columns: Iterable[str]) -> 'SearchIndex':
+        '''
+        Build an index of the columns.
+        '''
+
+        return SearchIndex({col: ColumnIndex.from_series(df[col]) for col in columns})
+
+    def column(self: 'SearchIndex', df: pd.DataFrame, col: str) -> ColumnIndex | None:
+        '''
+        Retrieve the index of an indexed column, rebuilding it if the column has been replaced.
+        '''
+
+        if col not in self.columns:
+            return None
+
+        index = self.columns[col]
+        if index is None or not index.is_built_from(df[col]):
+            index = ColumnIndex.from_series(df[col])
+            self.columns[col] = index
+
+        return index
+
+    def derive(self: 'SearchIndex', df: pd.DataFrame, rows: np.ndarray | None = None, replaced: Iterable[str] = ()) -> 'SearchIndex':
+        '''
+        Patch the index for a derived library: keep the rows, and mark the replaced columns for rebuilding.
+        '''
+
+        replaced = set(replaced)
+        columns: dict[str, ColumnIndex | None] = {}
+        for col, index in self.columns.items():
+            if index is None or col in replaced or col not in df.columns:
+                columns[col] = None
+            elif rows is None:
+                columns[col] = index.take(slice(None), df[col])
+            else:
+                columns[col] = index.take(rows, df[col])
+
+        return SearchIndex(columns)
@@ -0,0 +1,594 @@
+from __future__ import annotations
+
+from .artists import ArtistParser
+from .library import Library
+import csv
+from functools import cached_property
+import numpy as np
+import os
+import pandas as pd
+from typing import Any
+from xml.sax.saxutils import escape
+import yaml
+import zlib
+
+class SyntheticLibrary:
+    '''
+    The deterministic generator of synthetic iTunes data, for benchmarks. The same `tracks` and `seed` always give the same data, as long as the `version` is the same.
+    '''
+
+    # The version of the generator, to be bumped whenever the data change
+    version = 2
+
+    # The characters and words the titles and the names are drawn from
+    hanzi = '的一是不了人我在有他這中大來上國個到說們為子和你地出道也時年得就那要下以生會自著去之過家學對可她裡後小心多天而能好都然沒日於起還發成事只作當想看文無開手十用主行方又如前所本見經頭面公同三已老從動兩長知民樣現分將外但身些與高意進把法此實回二理美點月明其種聲全工己話兒者向情部正名定女問力機給等幾很業最間新什打便位因重被走電四第門相次東海口使教西再平真聽世氣信北少關並內加化由卻代入先山五太水萬市眼體別處總才場師書比住員九笑性通目華報立馬命張活難神數件安表原車白應路期叫死常提感金何更反合放做系計或利受光王果親界及今京務制解各任至清物台象記邊共風戰接它許八特覺望直服毛林題建南度統色字請交愛讓認算論百吃義科怎元社術結六功指思非流每青管夜雨花雪夢星'
+    kana = 'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんアイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン'
+    hangul = '가나다라마바사아자차카타파하사랑우리너별빛하늘바다꿈노래시간처음마음'
+    words = ['Love', 'Night', 'Summer', 'Dream', 'Light', 'Heart', 'Fire', 'Rain', 'Sky', 'Star', 'Blue', 'Gold', 'Wild', 'Home', 'Road', 'Ocean', 'Shadow', 'Echo', 'Forever', 'Tonight', 'Alone', 'Together', 'Paradise', 'Memories', 'Wonder', 'Horizon', 'Neon', 'Midnight', 'Sunrise', 'Gravity', 'Butterfly', 'Dance', 'Heaven', 'Storm', 'Silver', 'Crystal', 'Electric', 'Broken', 'Lost', 'Golden', 'Falling', 'Runaway', 'Closer', 'Faded', 'Glow', 'Waves', 'Colors', 'Dreamer', 'Stay', 'Satellite']
+    syllables = ['ka', 'ri', 'no', 'mi', 'sa', 'to', 'ra', 'el', 'an', 've', 'lo', 'xi', 'zu', 'dy', 'ne', 'ta', 'ro', 'lu', 'mo', 'fa', 'ki', 'on', 'ja', 'be']
+
+    # The languages with their shares of the artists, genres, and playlists
+    languages = ['Mandarin', 'Japanese', 'Korean', 'English']
+    shares = [0.35, 0.2, 0.05, 0.4]
+    genres = {'Mandarin': ['Mando Pop', 'Pop'], 'Japanese': ['J-Pop', 'Anime', 'Soundtrack'], 'Korean': ['K-Pop'], 'English': ['Dance', 'Electronic', 'Pop', 'Rock', 'Hip-Hop/Rap']}
+    lists = {'Mandarin': 'List: Mandarin', 'Japanese': 'List: Japanese', 'Korean': 'List: Korean', 'English': 'List: English'}
+    categories = ['Mood', 'Genre', 'OST', 'G', 'Sub', 'Feat', 'Pure']
+
+    # The tagging values of the Microsoft Excel file
+    vocals = ['V.F', 'V.M', 'A', 'V.X']
+    sub_genres = ['Dance', 'Pop', 'Rock', 'Instrumental', 'R&B/Soul']
+    sub_tags = ['Bass.FutureBass', 'Dance.Influenced', 'Dubstep.MelodicDubstep', 'House.ProgressiveHouse', 'House.TropicalHouse', 'Soundtrack.VideoGame.Deemo', 'Pop.Ballad', 'Rock.Alternative']
+
+    def __init__(self: 'SyntheticLibrary', tracks: int = 10000, seed: int = 0, playlists: int = 40, fanout: float = 2) -> None:
+        '''
+        Initiate a generator of `tracks` tracks. Most tracks are in their language lists, and each is in about `fanout` of the other `playlists` playlists.
+        '''
+
+        if tracks < 1:
+            raise ValueError('The `tracks` should be a positive integer.')
+
+        self.tracks = tracks
+        self.seed = seed
+        self.playlists = playlists
+        self.fanout = fanout
+
+    def __len__(self: 'SyntheticLibrary') -> int:
+        return self.tracks
+
+    def __repr__(self: 'SyntheticLibrary') -> str:
+        return f'iTunes Synthetic Library <{self.tracks} tracks, seed {self.seed}>'
+
+    __name__ = 'SyntheticLibrary'
+
+    @cached_property
+    def artists(self: 'SyntheticLibrary') -> pd.DataFrame:
+        '''
+        The artist pool, with the language, the popularity, and the alias (if any) of each artist.
+        '''
+
+        rng = self._rng('artists')
+        n = max(20, self.tracks // 8)
+        language = rng.choice(len(self.languages), size = n, p = self.shares)
+        names = [self._artist_name(rng, self.languages[i]) for i in language]
+
+        # A few artists have a comma in their names, which should never be split
+        for i in rng.choice(n, size = max(1, n // 500), replace = False):
+            names[i] = f'{self._hanzi(rng, 2, 3)},{self._hanzi(rng, 2, 3)}'
+
+        names = pd.Series(names)
+        duplicated = names.duplicated()
+        names[duplicated] = [f'{name} {i}' for i, name in zip(np.flatnonzero(duplicated), names[duplicated])]
+
+        aliases = pd.Series([None] * n, dtype = 'object')
+        aliased = rng.random(n) < 0.05
+        aliases[aliased] = [self._latin_name(rng) + ' ' + self._latin_name(rng) for _ in range(int(aliased.sum()))]
+        aliases[aliases.duplicated() & aliased] = None
+
+        return pd.DataFrame({
+            'Artist': names.to_numpy(dtype = 'object'),
+            'Language': np.array(self.languages, dtype = 'object')[language],
+            'Weight': rng.permutation(1 / np.arange(1, n + 1) ** 0.8),
+            'Alias': aliases.to_numpy(dtype = 'object')
+        })
+
+    @property
+    def artist_map(self: 'SyntheticLibrary') -> dict[str, str | list[str]]:
+        '''
+        The conversion table for artists, as in `artists.yaml`. Some aliases stand for several artists.
+        '''
+
+        artists = self.artists
+        aliased = artists[artists['Alias'].notna()]
+        table: dict[str, str | list[str]] = dict(zip(aliased['Alias'], aliased['Artist']))
+        for i, alias in enumerate(list(table)[::10]):
+            table[alias] = [table[alias], str(artists['Artist'].iat[i * 7919 % len(artists)])] # type: ignore
+        return table
+
+    @property
+    def artists_with_comma(self: 'SyntheticLibrary') -> list[str]:
+        '''
+        The artists having a comma in their names.
+        '''
+        return [a for a in self.artists['Artist'] if ',' in a]
+
+    @cached_property
+    def data(self: 'SyntheticLibrary') -> pd.DataFrame:
+        '''
+        The library, as read by `Library.from_xml`, with the tagging columns (`Vocal`, `Language`, `Sub Genres`, `Sub Tags`) of the Microsoft Excel file.
+        '''
+
+        rng = self._rng('tracks')
+        n = self.tracks
+        artists = self.artists
+        pool = artists['Artist'].to_numpy(dtype = 'object')
+        weights = artists['Weight'].to_numpy()
+        main = rng.choice(len(pool), size = n, p = weights / weights.sum())
+        language = artists['Language'].to_numpy(dtype = 'object')[main]
+
+        # The aliased artists are sometimes credited by their aliases
+        credited = pool[main].copy()
+        alias = artists['Alias'].to_numpy(dtype = 'object')[main]
+        by_alias = (alias != None) & (rng.random(n) < 0.3)
+        credited[by_alias] = alias[by_alias]
+
+        # Some tracks are collaborations of two or three artists
+        others = rng.choice(len(pool), size = (n, 3), p = weights / weights.sum())
+        collabs = rng.choice([0, 1, 2], size = n, p = [0.82, 0.13, 0.05])
+        artist = [self._join_artists([a, *pool[o[:k]]]) for a, o, k in zip(credited, others, collabs)]
+
+        titles = [self._title(rng, lang) for lang in language]
+        decoration = rng.choice(['', 'feat', 'remix', 'live'], size = n, p = [0.8, 0.1, 0.07, 0.03])
+        for i in np.flatnonzero(decoration != ''):
+            match decoration[i]:
+                case 'feat':
+                    titles[i] += f' (feat. {pool[others[i, 2]]})'
+                case 'remix':
+                    titles[i] += f' ({pool[others[i, 2]]} Remix)'
+                case 'live':
+                    titles[i] += ' (Live)'
+
+        single = rng.random(n) < 0.4
+        albums = np.array([self._title(rng, lang) for lang in language], dtype = 'object')
+        albums[single] = [f'{t} - Single' for t in np.array(titles, dtype = 'object')[single]]
+
+        added = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 10 * 365 * 86400, size = n), unit = 's')
+        modified = added + pd.to_timedelta(rng.integers(0, 400 * 86400, size = n), unit = 's')
+        total_ms = np.clip(rng.normal(220000, 50000, size = n), 60000, 600000).astype('int64')
+        numbered = rng.random(n) < 0.6
+        genre_choices = {lang: np.array(g, dtype = 'object') for lang, g in self.genres.items()}
+
+        df = pd.DataFrame({
+            'Track ID': 1000 + 2 * np.arange(n, dtype = 'int64'),
+            'Name': np.array(titles, dtype = 'object'),
+            'Artist': np.array(artist, dtype = 'object'),
+            'Composer': np.where(rng.random(n) < 0.5, pool[main], np.nan),
+            'Album': albums,
+            'Genre': np.array([genre_choices[lang][i % len(genre_choices[lang])] for lang, i in zip(language, rng.integers(0, 6, size = n))], dtype = 'object'),
+            'Year': rng.integers(1990, 2026, size = n).astype('int64'),
+            'Date Modified': np.minimum(modified.to_numpy(), np.datetime64('2025-12-31')),
+            'Date Added': added,
+            'Play Count': np.minimum(rng.pareto(1.5, size = n) * 10, 5000).astype('int64'),
+            'Size': total_ms * 32 + rng.integers(0, 200000, size = n),
+            'Total Time': pd.to_timedelta(total_ms, unit = 'ms'),
+            'Disc Number': np.where(numbered, '1', None),
+            'Track Number': np.where(numbered, (rng.integers(1, 15, size = n)).astype(str), None),
+            'Tags': self._tags(rng, language)
+        })
+
+        vocal = rng.choice(self.vocals, size = n, p = [0.45, 0.29, 0.22, 0.04])
+        sub_tags = np.array(self.sub_tags, dtype = 'object')[rng.integers(0, len(self.sub_tags), size = (n, 3))]
+        sub_tags[:, 1:][rng.random((n, 2)) < 0.85] = np.nan
+        df['Vocal'] = vocal.astype('object')
+        df['Language'] = np.where(vocal == 'A', '-', language)
+        df['Sub Genres'] = rng.choice(self.sub_genres, size = n, p = [0.55, 0.25, 0.1, 0.06, 0.04]).astype('object')
+        df['Sub Tags'] = pd.Series(list(map(tuple, sub_tags)), dtype = 'object')
+        return df
+
+    @property
+    def library(self: 'SyntheticLibrary') -> Library:
+        '''
+        The library, without the tagging columns.
+        '''
+        return Library(self.data.drop(columns = ['Vocal', 'Language', 'Sub Genres', 'Sub Tags']))
+
+    @property
+    def name_map(self: 'SyntheticLibrary') -> dict[str, dict[str, str] | list[dict[str, str | list[str]]]]:
+        '''
+        The conversion table for song titles, as in `names.yaml`, from the aliases in the older snapshot.
+        '''
+
+        df = self.data
+        parser = ArtistParser(self.artist_map, self.artists_with_comma)
+        aliases = self._aliases
+        complex: list[dict[str, str | list[str]]] = []
+        simple: dict[str, str] = {}
+
+        # The aliases shared by namesake songs need the artists (as split from the older snapshot) to tell them apart
+        for i, alias in aliases.items():
+            title = df['Name'].iat[i]
+            if i % 2 == 0:
+                complex.append({'artist': parser.parse(df['Artist'].iat[i], alias), 'title': title, 'alias': alias})
+            else:
+                simple[alias] = title
+
+        return {'complex': complex, 'simple': simple}
+
+    @property
+    def tag_map(self: 'SyntheticLibrary') -> dict[str, str]:
+        '''
+        The whitelist for tags, as in `tags.yaml`. The master playlists and a few of the others are left out.
+        '''
+
+        names = [p for p in self._playlist_names() if p not in ('Library', 'Music')]
+        return {p: p.split(': ', 1)[-1] for i, p in enumerate(names) if i % 9 != 8}
+
+    @property
+    def tagged(self: 'SyntheticLibrary') -> pd.DataFrame:
+        '''
+        The tagged tracks, as returned by `Utils.clean_tagged_excel`.
+        '''
+
+        df = self.data
+        tagged = df[['Name', 'Artist', 'Year', 'Play Count', 'Total Time', 'Vocal', 'Language', 'Sub Genres', 'Sub Tags']].rename(columns = {'Sub Genres': 'Genre', 'Sub Tags': 'Tags'})
+        tagged['Artist'] = [', '.join(self._split_artists(a)) for a in tagged['Artist']]
+        return tagged
+
+    @cached_property
+    def tmm(self: 'SyntheticLibrary') -> pd.DataFrame:
+        '''
+        The tracks exported by Tune My Music, as in `tmm.csv`. Most of the tracks are there, some of them more than once, along with some unknown tracks.
+        '''
+
+        rng = self._rng('tmm')
+        df = self.data
+        rows = self._tmm_rows
+        unknown = max(1, len(df) // 50)
+
+        tmm = pd.DataFrame({
+            'Track name': np.concatenate([df['Name'].to_numpy(dtype = 'object')[rows], [self._title(rng, 'English') for _ in range(unknown)]]),
+            'Artist name': np.concatenate([df['Artist'].to_numpy(dtype = 'object')[rows], [self._latin_name(rng) for _ in range(unknown)]]),
+            'Album': np.concatenate([df['Album'].to_numpy(dtype = 'object')[rows], [f'Unknown {i}' for i in range(unknown)]]),
+            'Playlist name': 'All',
+            'Type': 'Playlist'
+        })
+        tmm['ISRC'] = [self._isrc(rng) for _ in range(len(tmm))]
+        tmm['Apple - id'] = rng.integers(1000000000, 2000000000, size = len(tmm)).astype(str)
+        return tmm
+
+    @property
+    def tmm_map(self: 'SyntheticLibrary') -> dict[str, dict[int, Any]]:
+        '''
+        The map from the tagged tracks to the Tune My Music tracks, as in `tmm.yaml`, along with the fallback ISRC and Apple Music ID.
+        '''
+
+        rng = self._rng('tmm-map')
+        rows = self._tmm_rows
+        positions = np.flatnonzero(rng.random(len(rows)) < 0.05)
+        direct = {int(rows[p]): int(p) for p in positions}
+
+        missing = np.setdiff1d(np.arange(self.tracks), rows)
+        fallback = {int(i): {'ISRC': self._isrc(rng), 'ID': int(rng.integers(1000000000, 2000000000))} for i in missing[::3]}
+        return {'direct': direct, 'fallback': fallback}
+
+    def snapshot(self: 'SyntheticLibrary', fraction: float = 0.9) -> Library:
+        '''
+        An older snapshot of the library, with the tracks added earliest, fewer plays, and the titles before the renaming in `name_map`.
+        '''
+
+        df = self.library.data
+        cutoff = df['Date Added'].quantile(fraction)
+        older = df[df['Date Added'] <= cutoff].copy()
+        older['Play Count'] = older['Play Count'] * 3 // 4
+        older['Date Modified'] = older['Date Added']
+
+        # The titles before renaming are the aliases of the name map
+        aliases = self._aliases
+        older['Name'] = [aliases.get(i, name) for i, name in zip(older.index, older['Name'])]
+        return Library(older.reset_index(drop = True))
+
+    def to_excel(self: 'SyntheticLibrary', path: str | bytes | os.PathLike[str]) -> None:
+        '''
+        Write the tagged library to a Microsoft Excel file, as read by `Library.from_excel` and `Utils.clean_tagged_excel`.
+        '''
+
+        Library(self.data).nested_artists(self.artist_map, self.artists_with_comma).to_excel(path)
+
+    def to_msgpack(self: 'SyntheticLibrary', path: str | bytes | os.PathLike[str]) -> None:
+        '''
+        Write the library to a message pack file.
+        '''
+        self.library.to_msgpack(path)
+
+    def to_playlist(self: 'SyntheticLibrary', path: str | bytes | os.PathLike[str], playlist: str | None = None) -> None:
+        '''
+        Write a playlist (the whole library by default) to a text file, as exported by iTunes.
+        '''
+
+        df = self.data
+        if playlist is not None:
+            df = df[[playlist in tags for tags in df['Tags']]]
+
+        seconds = (df['Total Time'].dt.total_seconds()).astype('int64')
+        export = pd.DataFrame({
+            'Name': df['Name'],
+            'Artist': df['Artist'],
+            'Composer': df['Composer'].fillna(''),
+            'Album': df['Album'],
+            'Grouping': '',
+            'Work': '',
+            'Movement Number': '',
+            'Movement Count': '',
+            'Movement Name': '',
+            'Genre': df['Genre'],
+            'Size': df['Size'],
+            'Time': seconds,
+            'Disc Number': df['Disc Number'].fillna(''),
+            'Disc Count': '',
+            'Track Number': df['Track Number'].fillna(''),
+            'Track Count': '',
+            'Year': df['Year'],
+            'Date Modified': df['Date Modified'].dt.strftime('%Y/%m/%d %H:%M'),
+            'Date Added': df['Date Added'].dt.strftime('%Y/%m/%d %H:%M'),
+            'Bit Rate': 256,
+            'Sample Rate': 44100,
+            'Volume Adjustment': '',
+            'Kind': 'AAC audio file',
+            'Equalizer': '',
+            'Comments': '',
+            'Plays': df['Play Count'],
+            'Last Played': '',
+            'Skips': '',
+            'Last Skipped': '',
+            'My Rating': '',
+            'Location': [f'Macintosh HD:Music:{i}.m4a' for i in df['Track ID']]
+        })
+        export.to_csv(path, sep = '\t', encoding = 'utf-16', index = False, quoting = csv.QUOTE_NONE, escapechar = '\\')
+
+    def to_tmm_csv(self: 'SyntheticLibrary', path: str | bytes | os.PathLike[str]) -> None:
+        '''
+        Write the Tune My Music tracks to a CSV file.
+        '''
+        self.tmm.to_csv(path, index = False, quoting = csv.QUOTE_ALL)
+
+    def to_xml(self: 'SyntheticLibrary', path: str | bytes | os.PathLike[str], chunksize: int = 10000) -> None:
+        '''
+        Write the library and its playlists to an iTunes XML file, `chunksize` tracks at a time.
+        '''
+
+        df = self.data
+        playlists = self._playlist_names()
+        members: dict[str, list[int]] = {p: [] for p in playlists}
+        for track_id, tags in zip(df['Track ID'], df['Tags']):
+            for tag in tags:
+                members[tag].append(track_id)
+
+        def date(values: pd.Series) -> np.ndarray:
+            return values.dt.strftime('%Y-%m-%dT%H:%M:%SZ').to_numpy(dtype = 'object')
+
+        with open(path, 'w', encoding = 'utf-8', newline = '\n') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            f.write('<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" "http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n')
+            f.write('<plist version="1.0">\n<dict>\n')
+            f.write('\t<key>Major Version</key><integer>1</integer>\n\t<key>Minor Version</key><integer>1</integer>\n')
+            f.write('\t<key>Date</key><date>2025-12-31T00:00:00Z</date>\n\t<key>Application Version</key><string>12.13.5.3</string>\n')
+            f.write('\t<key>Tracks</key>\n\t<dict>\n')
+
+            for start in range(0, len(df), chunksize):
+                chunk = df.iloc[start:start + chunksize]
+                columns = zip(
+                    chunk['Track ID'], chunk['Name'], chunk['Artist'], chunk['Composer'], chunk['Album'], chunk['Genre'],
+                    chunk['Size'], (chunk['Total Time'] // pd.Timedelta(milliseconds = 1)), chunk['Disc Number'], chunk['Track Number'],
+                    chunk['Year'], date(chunk['Date Modified']), date(chunk['Date Added']), chunk['Play Count']
+                )
+                lines = []
+                for track_id, name, artist, composer, album, genre, size, ms, disc, number, year, modified, added, plays in columns:
+                    lines.append(f'\t\t<key>{track_id}</key>\n\t\t<dict>\n'
+                                 f'\t\t\t<key>Track ID</key><integer>{track_id}</integer>\n'
+                                 f'\t\t\t<key>Name</key><string>{escape(name)}</string>\n'
+                                 f'\t\t\t<key>Artist</key><string>{escape(artist)}</string>\n')
+                    if isinstance(composer, str):
+                        lines.append(f'\t\t\t<key>Composer</key><string>{escape(composer)}</string>\n')
+                    lines.append(f'\t\t\t<key>Album</key><string>{escape(album)}</string>\n'
+                                 f'\t\t\t<key>Genre</key><string>{escape(genre)}</string>\n'
+                                 f'\t\t\t<key>Kind</key><string>AAC audio file</string>\n'
+                                 f'\t\t\t<key>Size</key><integer>{size}</integer>\n'
+                                 f'\t\t\t<key>Total Time</key><integer>{ms}</integer>\n')
+                    if disc is not None:
+                        lines.append(f'\t\t\t<key>Disc Number</key><integer>{disc}</integer>\n')
+                    if number is not None:
+                        lines.append(f'\t\t\t<key>Track Number</key><integer>{number}</integer>\n')
+                    lines.append(f'\t\t\t<key>Year</key><integer>{year}</integer>\n'
+                                 f'\t\t\t<key>Date Modified</key><date>{modified}</date>\n'
+                                 f'\t\t\t<key>Date Added</key><date>{added}</date>\n'
+                                 f'\t\t\t<key>Bit Rate</key><integer>256</integer>\n'
+                                 f'\t\t\t<key>Sample Rate</key><integer>44100</integer>\n')
+                    if plays > 0:
+                        lines.append(f'\t\t\t<key>Play Count</key><integer>{plays}</integer>\n')
+                    lines.append(f'\t\t\t<key>Persistent ID</key><string>{track_id:016X}</string>\n'
+                                 f'\t\t\t<key>Track Type</key><string>File</string>\n'
+                                 f'\t\t</dict>\n')
+                f.write(''.join(lines))
+
+            f.write('\t</dict>\n\t<key>Playlists</key>\n\t<array>\n')
+            for i, name in enumerate(playlists):
+                f.write(f'\t\t<dict>\n\t\t\t<key>Name</key><string>{escape(name)}</string>\n')
+                if name == 'Library':
+                    f.write('\t\t\t<key>Master</key><true/>\n\t\t\t<key>Visible</key><false/>\n')
+                f.write(f'\t\t\t<key>Playlist ID</key><integer>{100000 + i}</integer>\n')
+                if members[name]:
+                    f.write('\t\t\t<key>Playlist Items</key>\n\t\t\t<array>\n')
+                    f.write(''.join(f'\t\t\t\t<dict>\n\t\t\t\t\t<key>Track ID</key><integer>{t}</integer>\n\t\t\t\t</dict>\n' for t in members[name]))
+                    f.write('\t\t\t</array>\n')
+                f.write('\t\t</dict>\n')
+            f.write('\t</array>\n\t<key>Music Folder</key><string>file:///Users/synthetic/Music/iTunes/iTunes%20Media/</string>\n')
+            f.write('</dict>\n</plist>\n')
+
+    def to_yaml(self: 'SyntheticLibrary', directory: str | os.PathLike[str]) -> dict[str, str]:
+        '''
+        Write the maps (`artists.yaml`, `names.yaml`, `tags.yaml`, and `tmm.yaml`) to a directory. Return their paths, keyed by the names of the maps.
+        '''
+
+        maps = {'artists': self.artist_map, 'names': self.name_map, 'tags': self.tag_map, 'tmm': self.tmm_map}
+        paths = {}
+        for name, table in maps.items():
+            key = f'{name.rstrip("s")}_map'
+            paths[key] = os.path.join(directory, f'{name}.yaml')
+            with open(paths[key], 'w', encoding = 'utf-8') as f:
+                yaml.dump(table, f, allow_unicode = True, sort_keys = False, Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper))
+        return paths
+
+    def write(self: 'SyntheticLibrary', directory: str | os.PathLike[str], formats: list[str] | None = None) -> dict[str, str]:
+        '''
+        Write the data to a directory in the given `formats` (all of `xml`, `msgpack`, `prev`, `excel`, `tmm`, `playlist`, and `yaml` by default). Return the paths of the files.
+        '''
+
+        formats = formats or ['xml', 'msgpack', 'prev', 'excel', 'tmm', 'playlist', 'yaml']
+        os.makedirs(directory, exist_ok = True)
+        paths: dict[str, str] = {}
+
+        for fmt in formats:
+            match fmt:
+                case 'xml':
+                    paths[fmt] = os.path.join(directory, 'lib.xml')
+                    self.to_xml(paths[fmt])
+                case 'msgpack':
+                    paths[fmt] = os.path.join(directory, 'lib.msgpack')
+                    self.to_msgpack(paths[fmt])
+                case 'prev':
+                    paths[fmt] = os.path.join(directory, 'lib-prev.msgpack')
+                    self.snapshot().to_msgpack(paths[fmt])
+                case 'excel':
+                    paths[fmt] = os.path.join(directory, 'lib-tagged.xlsx')
+                    self.to_excel(paths[fmt])
+                case 'tmm':
+                    paths[fmt] = os.path.join(directory, 'tmm.csv')
+                    self.to_tmm_csv(paths[fmt])
+                case 'playlist':
+                    paths[fmt] = os.path.join(directory, 'playlist.txt')
+                    self.to_playlist(paths[fmt])
+                case 'yaml':
+                    paths.update(self.to_yaml(directory))
+                case _:
+                    raise ValueError(f'Unknown format: {fmt}')
+        return paths
+
+    @cached_property
+    def _aliases(self: 'SyntheticLibrary') -> dict[int, str]:
+        # The titles of some tracks in the older snapshot, by row, keeping the decorations such as `(feat. ...)`
+        # Every other alias drifts from the title (see `_drift`), so the fuzzy pairing has true pairs, and the others are romanized
+        rng = self._rng('names')
+        names = self.data['Name']
+        aliases = {}
+        for k, i in enumerate(np.sort(rng.choice(self.tracks, size = min(self.tracks, max(4, self.tracks // 50)), replace = False))):
+            name = names.iat[i]
+            cut = name.find(' (') if ' (' in name else len(name)
+            if k % 2 == 0:
+                alias = self._drift(rng, name[:cut])
+            else:
+                alias = f'{self._latin_name(rng)} {self._latin_name(rng)} {i}'
+            aliases[int(i)] = alias + name[cut:]
+        return aliases
+
+    def _artist_name(self: 'SyntheticLibrary', rng: np.random.Generator, language: str) -> str:
+        match language:
+            case 'Mandarin':
+                return self._hanzi(rng, 2, 3)
+            case 'Japanese':
+                return self._pick(rng, self.kana, 3, 6) if rng.random() < 0.7 else self._latin_name(rng)
+            case 'Korean':
+                return self._pick(rng, self.hangul, 2, 4)
+            case _:
+                name = self._latin_name(rng)
+                return f'{name} {self._latin_name(rng)}' if rng.random() < 0.4 else name
+
+    def _drift(self: 'SyntheticLibrary', rng: np.random.Generator, title: str) -> str:
+        # A typo, a punctuation, or another writing (accents, a middle dot) of the title
+        chars = list(title)
+        at = int(rng.integers(0, max(1, len(chars) - 1)))
+        match int(rng.integers(0, 4)):
+            case 0 if len(chars) > 1:
+                chars[at], chars[at + 1] = chars[at + 1], chars[at]
+            case 1 if len(chars) > 2:
+                del chars[at]
+            case 2:
+                chars.insert(at + 1, ',!.\'-'[int(rng.integers(0, 5))])
+            case _:
+                accents = {'a': 'á', 'e': 'é', 'i': 'í', 'o': 'ö', 'u': 'ü'}
+                spots = [j for j, c in enumerate(chars) if c in accents]
+                if spots:
+                    j = spots[at % len(spots)]
+                    chars[j] = accents[chars[j]]
+                else:
+                    chars.insert(at + 1, '・')
+
+        drifted = ''.join(chars)
+        return drifted if drifted != title else title + '!'
+
+    def _hanzi(self: 'SyntheticLibrary', rng: np.random.Generator, low: int, high: int) -> str:
+        return self._pick(rng, self.hanzi, low, high)
+
+    def _isrc(self: 'SyntheticLibrary', rng: np.random.Generator) -> str:
+        return ''.join(chr(65 + x) for x in rng.integers(0, 26, size = 5)) + f'{rng.integers(0, 10 ** 7):07d}'
+
+    def _join_artists(self: 'SyntheticLibrary', artists: list[str]) -> str:
+        if len(artists) == 1:
+            return artists[0]
+        return ', '.join(artists[:-1]) + ' & ' + artists[-1]
+
+    def _latin_name(self: 'SyntheticLibrary', rng: np.random.Generator) -> str:
+        return ''.join(self.syllables[i] for i in rng.integers(0, len(self.syllables), size = rng.integers(2, 4))).capitalize()
+
+    def _pick(self: 'SyntheticLibrary', rng: np.random.Generator, chars: str, low: int, high: int) -> str:
+        return ''.join(chars[i] for i in rng.integers(0, len(chars), size = rng.integers(low, high + 1)))
+
+    def _playlist_names(self: 'SyntheticLibrary') -> list[str]:
+        rng = self._rng('playlists')
+        names = ['Library', 'Music', *self.lists.values()]
+        while len(names) < 2 + len(self.lists) + self.playlists:
+            name = f'{self.categories[rng.integers(0, len(self.categories))]}: {self.words[rng.integers(0, len(self.words))]}'
+            if name not in names:
+                names.append(name)
+        return names
+
+    def _rng(self: 'SyntheticLibrary', stage: str) -> np.random.Generator:
+        # Each stage has its own stream, so the stages don't depend on each other's draws
+        return np.random.default_rng([self.seed, self.tracks, zlib.crc32(stage.encode())])
+
+    def _split_artists(self: 'SyntheticLibrary', artist: str) -> list[str]:
+        return [a for part in artist.split(' & ') for a in part.split(', ')]
+
+    def _tags(self: 'SyntheticLibrary', rng: np.random.Generator, language: np.ndarray) -> list[set[str]]:
+        names = self._playlist_names()[2 + len(self.lists):]
+        weights = rng.pareto(1.5, size = len(names)) + 1
+        counts = rng.poisson(self.fanout, size = len(language))
+        listed = rng.random(len(language)) < 0.9
+        picks = rng.choice(len(names), size = (len(language), max(1, int(counts.max()))), p = weights / weights.sum())
+
+        # The rows with the same picks are built once, each row getting its own set as the reader does
+        shared: dict[tuple, set[str]] = {}
+        tags = []
+        for lang, row, k, is_listed in zip(language, picks, counts, listed):
+            key = (lang if is_listed else None, *sorted(set(row[:k].tolist())))
+            if key not in shared:
+                shared[key] = {'Library', 'Music', *([self.lists[lang]] if is_listed else []), *(names[i] for i in key[1:])}
+            tags.append(set(shared[key]))
+        return tags
+
+    @cached_property
+    def _tmm_rows(self: 'SyntheticLibrary') -> np.ndarray:
+        # The tracks exported by Tune My Music, where one in twenty is listed twice
+        rng = self._rng('tmm-rows')
+        rows = np.flatnonzero(rng.random(self.tracks) < 0.85)
+        return np.sort(np.concatenate([rows, rng.choice(rows, size = len(rows) // 20)]))
+
+    def _title(self: 'SyntheticLibrary', rng: np.random.Generator, language: str) -> str:
+        match language:
+            case 'Mandarin':
+                return self._hanzi(rng, 2, 6)
+            case 'Japanese':
+                return self._pick(rng, self.kana + self.hanzi[:120], 3, 8)
+            case 'Korean':
+                return self._pick(rng, self.hangul, 2, 5)
+            case _:
+                k = rng.integers(1, 4)
+                return ' '.join(self.words[i] for i in rng.integers(0, len(self.words), size = k))
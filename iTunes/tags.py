@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from typing import Hashable, Iterable
+
+class TagIndex:
+    '''
+    The compact encoding of the tag sets. Each row holds the code of its tag combination, and each combination is a bitmap over the tag dictionary.
+    '''
+
+    def __init__(self: 'TagIndex', vocab: list[Hashable], bits: np.ndarray, codes: np.ndarray) -> None:
+        '''
+        Initiate an index from the tag dictionary, the packed bitmaps of the combinations, and the combination code of each row.
+        '''
+
+        self.vocab = vocab
+        self.bits = bits
+        self.codes = codes
+
+    def __len__(self: 'TagIndex') -> int:
+        return len(self.codes)
+
+    def __repr__(self: 'TagIndex') -> str:
+        return f'iTunes Tag Index <{len(self.codes)} rows, {len(self.vocab)} tags, {len(self.bits)} combinations>'
+
+    __name__ = 'TagIndex'
+
+    @classmethod
+    def from_membership(cls, track_ids: Iterable[int], playlists: dict[str, set[int]]) -> 'TagIndex':
+        '''
+        Build an index from the track IDs of the rows and the track IDs of each playlist.
+        '''
+
+        positions = pd.Index(track_ids)
+        vocab = list(playlists)
+        bits = np.zeros((len(positions), (len(vocab) + 7) // 8), dtype = 'uint8')
+
+        for i, name in enumerate(vocab):
+            ids = np.fromiter(playlists[name], dtype = 'int64', count = len(playlists[name]))
+            rows = positions.get_indexer(ids) if positions.is_unique else positions.get_indexer_non_unique(ids)[0]
+            rows = rows[rows >= 0]
+            bits[rows, i // 8] |= np.uint8(0x80 >> (i % 8))
+
+        return cls.from_packed(vocab, bits)
+
+    @classmethod
+    def from_packed(cls, vocab: list[Hashable], bits: np.ndarray) -> 'TagIndex':
+        '''
+        Build an index from the packed bitmap of each row, deduplicating the combinations.
+        '''
+
+        if bits.shape[1] == 0:
+            bits = np.zeros((len(bits), 1), dtype = 'uint8')
+
+        bits = np.ascontiguousarray(bits)
+        width = bits.shape[1]
+        combos, codes = np.unique(bits.view(f'V{width}').ravel(), return_inverse = True)
+        return TagIndex(vocab, combos.view('uint8').reshape(-1, width), codes.ravel().astype('int32'))
+
+    @classmethod
+    def from_series(cls, s: pd.Series) -> 'TagIndex':
+        '''
+        Build an index from a series of tag sets. Rows sharing the same set object are only inspected once.
+        '''
+
+        values = s.to_numpy(dtype = 'object')
+        object_codes, _ = pd.factorize(np.fromiter(map(id, values), dtype = 'uint64', count = len(values)))
+        _, first = np.unique(object_codes, return_index = True)
+
+        keys = np.empty(len(first), dtype = 'object')
+        for i, value in enumerate(values[first]):
+            if isinstance(value, (set, frozenset, list, tuple)):
+                keys[i] = frozenset(value)
+            elif value is None or (isinstance(value, float) and np.isnan(value)):
+                keys[i] = frozenset()
+            else:
+                raise ValueError('The tags should be sets of strings.')
+
+        combo_codes, combos = pd.factorize(keys)
+        vocab: list[Hashable] = list(dict.fromkeys(tag for combo in combos for tag in combo))
+        lookup = {tag: i for i, tag in enumerate(vocab)}
+
+        matrix = np.zeros((len(combos), len(vocab)), dtype = 'bool')
+        for i, combo in enumerate(combos):
+            matrix[i, [lookup[tag] for tag in combo]] = True
+
+        return TagIndex(vocab, np.packbits(matrix, axis = 1), combo_codes[object_codes].astype('int32')).compact()
+
+    def any(self: 'TagIndex', tags: Iterable[Hashable]) -> np.ndarray:
+        '''
+        Whether each row holds any of the tags.
+        '''
+
+        selected = self.selection(tags)
+        return np.bitwise_and(self.bits, selected).any(axis = 1)[self.codes]
+
+    def compact(self: 'TagIndex') -> 'TagIndex':
+        '''
+        Merge the duplicated combinations and drop the unused ones.
+        '''
+
+        index = TagIndex.from_packed(self.vocab, self.bits)
+        used, codes = np.unique(index.codes[self.codes], return_inverse = True)
+        return TagIndex(self.vocab, index.bits[used], codes.ravel().astype('int32'))
+
+    def intersect(self: 'TagIndex', tags: Iterable[Hashable]) -> 'TagIndex':
+        '''
+        Keep only the tags in the rows.
+        '''
+
+        return TagIndex(self.vocab, np.bitwise_and(self.bits, self.selection(tags)), self.codes).compact()
+
+    def rename(self: 'TagIndex', table: dict) -> 'TagIndex':
+        '''
+        Rename the tags based on the table. Tags renamed into the same name are merged.
+        '''
+
+        vocab: list[Hashable] = list(dict.fromkeys(table.get(tag, tag) for tag in self.vocab))
+        lookup = {tag: i for i, tag in enumerate(vocab)}
+        target = np.array([lookup[table.get(tag, tag)] for tag in self.vocab], dtype = 'int64')
+
+        old = self.unpack()
+        new = np.zeros((len(old), len(vocab)), dtype = 'bool')
+        for i in range(len(self.vocab)):
+            new[:, target[i]] |= old[:, i]
+
+        return TagIndex(vocab, np.packbits(new, axis = 1), self.codes).compact()
+
+    def selection(self: 'TagIndex', tags: Iterable[Hashable]) -> np.ndarray:
+        '''
+        The packed bitmap of the tags.
+        '''
+
+        tags = set(tags)
+        selected = np.zeros(self.bits.shape[1] * 8, dtype = 'bool')
+        selected[:len(self.vocab)] = [tag in tags for tag in self.vocab]
+        return np.packbits(selected)
+
+    def take(self: 'TagIndex', rows: np.ndarray) -> 'TagIndex':
+        '''
+        Select the rows by positions or a boolean mask.
+        '''
+
+        return TagIndex(self.vocab, self.bits, self.codes[rows])
+
+    def to_series(self: 'TagIndex', index: pd.Index | None = None, name: str = 'Tags') -> pd.Series:
+        '''
+        Decode into a series of tag sets, a set of its own per row.
+        '''
+
+        matrix = self.unpack()
+        sets = np.empty(len(self.bits), dtype = 'object')
+        for i in range(len(self.bits)):
+            sets[i] = {self.vocab[j] for j in np.flatnonzero(matrix[i])}
+
+        # Each combination is decoded once, then copied so that editing a row leaves the others alone
+        return pd.Series([set(s) for s in sets[self.codes]], index = index, name = name, dtype = 'object')
+
+    def unpack(self: 'TagIndex') -> np.ndarray:
+        '''
+        The boolean combination × tag matrix.
+        '''
+
+        return np.unpackbits(self.bits, axis = 1, count = len(self.vocab)).astype('bool')
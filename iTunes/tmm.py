@@ -0,0 +1,347 @@
+from __future__ import annotations
+
+from .codec import Codec, ColumnarFile
+import hashlib
+import io
+import numpy as np
+import os
+import pandas as pd
+from rapidfuzz import fuzz, process
+import re
+from typing import Any, Callable
+
+class TMMIndex:
+    '''
+    The match index of a Tune My Music CSV file. The titles and the artists are normalized and grouped once, and the index is saved next to the CSV file, keyed on the content hash of the file.
+    '''
+
+    format = 'iTunes.TMMIndex'
+    suffix = '.index'
+    # The version of the saved index, to be bumped whenever the normalized columns change
+    version = 1
+    columns = ['Track name', 'Artist name', 'ISRC', 'Apple - id']
+
+    # The featured artists and the remix, edit, or version notes in the titles
+    decorations = re.compile(
+        r'\s*[\(\[](?:feat\.?|ft\.?|with)\s[^\)\]]*[\)\]]'
+        r'|\s*[\(\[][^\)\]]*\b(?:remix|mix|edit|version|ver\.)[^\)\]]*[\)\]]'
+        r'|\s+-\s+[^-]*\b(?:remix|mix|edit|version)\b.*$'
+    )
+    tiers = {'exact': 100, 'stripped': 95, 'subset': 90}
+
+    def __init__(self: 'TMMIndex', df: pd.DataFrame, digest: str, escape_artists: list[str]) -> None:
+        '''
+        Initiate an index from the rows of the CSV file along with their normalized titles and artists, the content hash of the file, and the artists escaped from splitting.
+        '''
+
+        self.__df__ = df
+        self.digest = digest
+        self.escape_artists = escape_artists
+        self.__grouped__: pd.DataFrame | None = None
+        self.__stripped__: np.ndarray | None = None
+        self.__blocks__: pd.DataFrame | None = None
+
+    def __len__(self: 'TMMIndex') -> int:
+        return len(self.__df__)
+
+    def __repr__(self: 'TMMIndex') -> str:
+        return f'Tune My Music Index <{len(self.__df__)} tracks, {self.digest[:12]}>'
+
+    __name__ = 'TMMIndex'
+
+    @property
+    def data(self: 'TMMIndex') -> pd.DataFrame:
+        '''
+        The rows of the CSV file.
+        '''
+        return self.__df__.drop(columns = ['_norm_title', '_norm_artist'])
+
+    @property
+    def grouped(self: 'TMMIndex') -> pd.DataFrame:
+        '''
+        The ISRCs and the Apple IDs of each normalized (title, artists) pair.
+        '''
+        if self.__grouped__ is None:
+            title_codes, _ = pd.factorize(self.__df__['_norm_title'])
+            artist_codes, _ = pd.factorize(self.__df__['_norm_artist'])
+            group_codes, _ = pd.factorize(title_codes.astype('int64') * (int(artist_codes.max(initial = 0)) + 1) + artist_codes)
+
+            # The rows of each group, in order
+            order = np.argsort(group_codes, kind = 'stable')
+            offsets = np.searchsorted(group_codes[order], np.arange(int(group_codes.max(initial = -1)) + 2)).tolist()
+            first = order[offsets[:-1]]
+
+            grouped = {
+                '_norm_title': self.__df__['_norm_title'].to_numpy()[first],
+                '_norm_artist': self.__df__['_norm_artist'].to_numpy()[first]
+            }
+            for col in ['ISRC', 'Apple - id']:
+                values = self.__df__[col].to_numpy()[order].tolist()
+                grouped[col] = [values[offsets[i]:offsets[i + 1]] for i in range(len(first))]
+
+            self.__grouped__ = pd.DataFrame(grouped)
+        return self.__grouped__
+
+    @property
+    def stripped(self: 'TMMIndex') -> np.ndarray:
+        '''
+        The normalized titles without the featured artists and the remix notes.
+        '''
+        if self.__stripped__ is None:
+            self.__stripped__ = self.strip_titles(self.__df__['_norm_title']).to_numpy()
+        return self.__stripped__
+
+    def candidates(self: 'TMMIndex', df: pd.DataFrame, limit: int = 3, score_cutoff: float = 80, max_block: int = 1000, workers: int = -1) -> pd.DataFrame:
+        '''
+        Rank the candidate rows of the tracks in tiers: the exact match (100), the match without the featured artists and the remix notes (95), the match where one artist set contains the other (90), and, for the tracks still without candidates, the fuzzy match (up to 85). The fuzzy match only compares the rows sharing an artist or a stripped title, leaving out the blocks of over `max_block` rows, and scores them on `workers` threads.
+        '''
+
+        if ('Name' not in df.columns) or ('Artist' not in df.columns):
+            raise ValueError('The `Name` and `Artist` columns should present in the columns.')
+
+        tracks = pd.DataFrame({
+            'row': np.arange(len(df)),
+            'title': self.normalize_titles(df['Name']).to_numpy(),
+            'artist': self.normalize_artists(df['Artist'], self.escape_artists).to_numpy()
+        })
+        tracks['stripped'] = self.strip_titles(tracks['title']).to_numpy()
+        rows = pd.DataFrame({
+            'tmm': np.arange(len(self.__df__)),
+            'title': self.__df__['_norm_title'].to_numpy(),
+            'artist': self.__df__['_norm_artist'].to_numpy(),
+            'stripped': self.stripped
+        })
+
+        found = [
+            tracks.merge(rows, on = ['title', 'artist'])[['row', 'tmm']].assign(Tier = 'exact'),
+            tracks.merge(rows, on = ['stripped', 'artist'])[['row', 'tmm']].assign(Tier = 'stripped')
+        ]
+        same_title = tracks.merge(rows, on = 'stripped', suffixes = ('', '_tmm'))
+        subset = [bool(a) and bool(b) and (a <= b or b <= a) for a, b in zip(same_title['artist'], same_title['artist_tmm'])]
+        found.append(same_title.loc[np.asarray(subset, dtype = 'bool'), ['row', 'tmm']].assign(Tier = 'subset'))
+
+        pairs = pd.concat(found, ignore_index = True)
+        pairs['Confidence'] = pairs['Tier'].map(self.tiers).astype('float64')
+
+        remaining = tracks[~tracks['row'].isin(pairs['row'])]
+        if len(remaining) > 0:
+            pairs = pd.concat([pairs, self._fuzzy_candidates(remaining, score_cutoff, max_block, workers)], ignore_index = True)
+
+        # The best tier of each pair, then the best pairs of each track
+        pairs = pairs.sort_values(['row', 'Confidence', 'tmm'], ascending = [True, False, True], kind = 'stable')
+        pairs = pairs.drop_duplicates(['row', 'tmm'])
+        pairs['Rank'] = pairs.groupby('row').cumcount() + 1
+        pairs = pairs[pairs['Rank'] <= limit]
+
+        tmm = self.__df__.iloc[pairs['tmm'].to_numpy()]
+        track = df.iloc[pairs['row'].to_numpy()]
+        return pd.DataFrame({
+            'Row': track.index,
+            'Rank': pairs['Rank'].to_numpy(),
+            'Tier': pairs['Tier'].to_numpy(),
+            'Confidence': pairs['Confidence'].to_numpy().round(2),
+            'Name': track['Name'].to_numpy(),
+            'Artist': track['Artist'].to_numpy(),
+            'TMM Row': tmm.index,
+            'Track name': tmm['Track name'].to_numpy(),
+            'Artist name': tmm['Artist name'].to_numpy(),
+            'ISRC': tmm['ISRC'].to_numpy(),
+            'Apple ID': tmm['Apple - id'].to_numpy()
+        })
+
+    @classmethod
+    def from_csv(cls, path: str | os.PathLike[str], escape_artists: list[str] | None = None, cache: bool = True) -> 'TMMIndex':
+        '''
+        Build the index of a CSV file, or load the saved one if the file and the index version are unchanged. The index is saved next to the file if `cache` is set.
+        '''
+
+        if isinstance(path, str) and not path.endswith('csv'):
+            raise ValueError('The `path` should point to a CSV file.')
+
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        digest = hashlib.sha256(content).hexdigest()
+        escape_artists = list(escape_artists or [])
+        index_path = cls.index_path(path)
+
+        if cache and os.path.isfile(index_path):
+            try:
+                index = cls.load(index_path)
+                if index.digest == digest and index.escape_artists == escape_artists:
+                    return index
+            except ValueError:
+                pass
+
+        df = pd.read_csv(io.BytesIO(content))
+        for col in cls.columns:
+            if col not in df.columns:
+                raise ValueError(f'The `{col}` column should present in {path}.')
+
+        df['_norm_title'] = cls.normalize_titles(df['Track name'])
+        df['_norm_artist'] = cls.normalize_artists(df['Artist name'], escape_artists, tmm = True)
+        index = TMMIndex(df, digest, escape_artists)
+
+        if cache:
+            try:
+                index.save(index_path)
+            except OSError:
+                # The index is only a cache, e.g. the folder may be read-only
+                pass
+
+        return index
+
+    @classmethod
+    def index_path(cls, path: str | os.PathLike[str]) -> str:
+        '''
+        The path of the saved index of a CSV file.
+        '''
+
+        return os.fspath(path) + cls.suffix
+
+    @classmethod
+    def load(cls, path: str | bytes | os.PathLike[str]) -> 'TMMIndex':
+        '''
+        Load a saved index. An index of another version can't be loaded.
+        '''
+
+        with ColumnarFile(path) as f:
+            if f.meta.get('format') != cls.format:
+                raise ValueError('The file is not a Tune My Music index.')
+            if f.meta.get('version') != cls.version:
+                raise ValueError('The Tune My Music index is of another version.')
+
+            df = f.read()
+            meta = f.meta
+
+        # Each row decodes into a set of its own, which is frozen, and the equal ones are kept once
+        frozen: dict[frozenset, frozenset] = {}
+        artists = []
+        for x in df['_norm_artist']:
+            key = frozenset(x)
+            artists.append(frozen.setdefault(key, key))
+        df['_norm_artist'] = pd.Series(artists, index = df.index, dtype = 'object')
+        return TMMIndex(df, meta['digest'], list(meta['escape_artists']))
+
+    @classmethod
+    def normalize_artists(cls, s: pd.Series, escape_artists: list[str], tmm: bool = False) -> pd.Series:
+        '''
+        Normalize the artists into lowercase sets, splitting by commas (and by ampersands for Tune My Music). The escaped artists are never split.
+        '''
+
+        def normalize(text: Any) -> frozenset:
+            if pd.isna(text):
+                return frozenset()
+
+            mapping = {}
+            for i, phrase in enumerate(escape_artists):
+                key = f'__ESC_{i}__'
+                mapping[key] = phrase
+                text = text.replace(phrase, key)
+
+            if tmm:
+                text = text.replace(' & ', ',')
+
+            parts = []
+            for p in (p.strip().lower() for p in text.split(',') if p.strip()):
+                for k, v in mapping.items():
+                    p = p.replace(k, v)
+                parts.append(p)
+            return frozenset(parts)
+
+        return pd.Series(cls._map(s, normalize), index = s.index, dtype = 'object')
+
+    @classmethod
+    def normalize_titles(cls, s: pd.Series) -> pd.Series:
+        '''
+        Normalize the titles into lowercase with single spaces.
+        '''
+
+        def normalize(text: Any) -> str:
+            if pd.isna(text):
+                return ''
+            return ' '.join(text.lower().split())
+
+        return pd.Series(cls._map(s, normalize), index = s.index, dtype = 'object')
+
+    def save(self: 'TMMIndex', path: str | bytes | os.PathLike[str]) -> None:
+        '''
+        Save the index.
+        '''
+
+        df = self.__df__.copy()
+        df['_norm_artist'] = [set(x) for x in df['_norm_artist']]
+        with open(path, 'wb') as f:
+            Codec.dump(df, f, {'format': self.format, 'version': self.version, 'digest': self.digest, 'escape_artists': self.escape_artists})
+
+    @classmethod
+    def strip_titles(cls, s: pd.Series) -> pd.Series:
+        '''
+        Remove the featured artists and the remix, edit, or version notes from the normalized titles.
+        '''
+
+        return pd.Series(cls._map(s, lambda x: ' '.join(cls.decorations.sub('', x).split())), index = s.index, dtype = 'object')
+
+    def _fuzzy_candidates(self: 'TMMIndex', tracks: pd.DataFrame, score_cutoff: float, max_block: int, workers: int) -> pd.DataFrame:
+        '''
+        Score the stripped titles and the artists of the rows sharing an artist or a stripped title with the tracks.
+        '''
+
+        def block_keys(ids: np.ndarray, artists: np.ndarray, stripped: np.ndarray) -> pd.DataFrame:
+            keys: list[str] = []
+            positions: list[int] = []
+            for i, artist_set, title in zip(ids.tolist(), artists, stripped):
+                for artist in artist_set:
+                    keys.append(f'artist:{artist}')
+                    positions.append(i)
+                if title:
+                    keys.append(f'title:{title}')
+                    positions.append(i)
+            return pd.DataFrame({'key': keys, 'id': np.array(positions, dtype = 'int64')})
+
+        def joined(artists: pd.Series) -> np.ndarray:
+            return self._map(artists, lambda x: ', '.join(sorted(x)))
+
+        if self.__blocks__ is None:
+            blocks = block_keys(np.arange(len(self.__df__)), self.__df__['_norm_artist'].to_numpy(), self.stripped)
+            self.__blocks__ = blocks.assign(size = blocks.groupby('key')['id'].transform('size'))
+
+        pairs = block_keys(tracks['row'].to_numpy(), tracks['artist'].to_numpy(), tracks['stripped'].to_numpy()).merge(
+            self.__blocks__[self.__blocks__['size'] <= max_block], on = 'key', suffixes = ('_row', '_tmm')
+        )[['id_row', 'id_tmm']].drop_duplicates()
+        pairs.columns = ['row', 'tmm']
+        if len(pairs) == 0:
+            return pd.DataFrame({'row': [], 'tmm': [], 'Tier': [], 'Confidence': []}).astype({'row': 'int64', 'tmm': 'int64', 'Tier': 'object'})
+
+        lookup = pd.Index(tracks['row']).get_indexer(pairs['row'])
+        titles = process.cpdist(
+            tracks['stripped'].to_numpy()[lookup],
+            self.stripped[pairs['tmm'].to_numpy()],
+            scorer = fuzz.ratio,
+            score_cutoff = score_cutoff,
+            dtype = np.float64,
+            workers = workers
+        )
+
+        # Only the pairs with alike titles have their artists compared
+        keep = titles >= score_cutoff
+        pairs, lookup, titles = pairs[keep], lookup[keep], titles[keep]
+        artists = process.cpdist(
+            joined(tracks['artist'])[lookup],
+            joined(self.__df__['_norm_artist'])[pairs['tmm'].to_numpy()],
+            scorer = fuzz.token_set_ratio,
+            dtype = np.float64,
+            workers = workers
+        )
+
+        # Capped below the exact tiers
+        return pairs.assign(Tier = 'fuzzy', Confidence = 0.85 * (0.8 * titles + 0.2 * artists))
+
+    @staticmethod
+    def _map(values: pd.Series, func: Callable[[Any], Any]) -> np.ndarray:
+        # Each distinct value is only converted once
+        codes, uniques = pd.factorize(values.to_numpy(dtype = 'object'), use_na_sentinel = False)
+        converted = np.empty(len(uniques), dtype = 'object')
+        for i, value in enumerate(uniques):
+            converted[i] = func(value)
+        return converted[codes]
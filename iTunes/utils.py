@@ -1,19 +1,39 @@
 from __future__ import annotations
 
+from .codec import Codec, ColumnarFile
+from .profiler import Profiler
+from .tmm import TMMIndex
+from functools import partial
+import hashlib
+from numpy import nan
+import numpy as np
+from operator import is_not
 import os
 import pandas as pd
 import string
-from typing import Any
+import tempfile
+from typing import Any, Callable
 import yaml
 
+@Profiler.instrument(exclude = ['copy_frame', 'copy_on_write', 'get_type', 'normalize_value'])
 class Utils:
     '''
     The class for utilities.
     '''
+
+    # The collation codes of the ASCII characters: A, a, B, b, ... take 1 to 52, and the others follow their code points
+    __letters__ = len(string.ascii_letters)
+    __ascii__ = np.arange(128, dtype = '>u4') + __letters__ + 1
+    __ascii__[np.arange(ord('A'), ord('Z') + 1)] = np.arange(1, __letters__, 2)
+    __ascii__[np.arange(ord('a'), ord('z') + 1)] = np.arange(2, __letters__ + 1, 2)
+
+    # The version of the cached frames, to be bumped whenever the frames built by `cached_frame` callers change
+    __cache_version__ = 1
+
     @classmethod
-    def apply_map(cls, df: pd.DataFrame, map_path: str | os.PathLike[str], tmm_path: str | os.PathLike[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    def apply_map(cls, df: pd.DataFrame, map_path: str | os.PathLike[str], tmm_path: str | os.PathLike[str] | TMMIndex) -> tuple[pd.DataFrame, pd.DataFrame]:
         '''
-        Apply the map to unmatched tracks.
+        Apply the map to unmatched tracks. The Tune My Music data can be either the CSV file or its `TMMIndex`.
         '''
 
         if isinstance(map_path, str) and not map_path.endswith('yaml'):
@@ -21,6 +41,8 @@ class Utils:
         
         if isinstance(tmm_path, str) and not tmm_path.endswith('csv'):
             raise ValueError('The `tmm_path` should point to a CSV file.')
+
+        index = tmm_path if isinstance(tmm_path, TMMIndex) else TMMIndex.from_csv(tmm_path)
         
         map_dict: dict[str, object] = cls.read_yaml(map_path)
 
@@ -35,64 +57,168 @@ class Utils:
         if not isinstance(fallback_map, dict):
             fallback_map = {}
 
-        cols = ['ISRC', 'Apple - id']
-        tmm_df = pd.read_csv(tmm_path)
-        for col in cols:
-            if col not in tmm_df.columns:
-                raise ValueError(f'The `{col}` column should present in {tmm_path}.')
+        tmm_df = index.data
+
+        def assign(col: str, rows: np.ndarray, values: np.ndarray) -> None:
+            if len(rows) == 0:
+                return
+            if col not in df_copy.columns:
+                df_copy[col] = nan
+            df_copy.iloc[rows, df_copy.columns.get_loc(col)] = values
+
+        def lookup(table: dict, skip: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+            # The rows whose labels are in the table, along with their values
+            keys = pd.Index(list(table), dtype = 'object')
+            positions = keys.get_indexer(labels) if len(keys) > 0 else np.full(len(labels), -1)
+            rows = np.flatnonzero((positions >= 0) & is_int & ~skip)
+            values = pd.Series(list(table.values()), dtype = 'object').infer_objects().to_numpy()
+            return rows, values[positions[rows]]
 
         df_copy = df.copy()
         df_copy['Matched'] = None
-        for index, _ in df_copy.iterrows():
-            if not isinstance(index, int):
-                continue
-
-            direct = direct_map.get(index)
-            if isinstance(direct, int) and (direct in tmm_df.index):
-                df_copy.loc[index, 'ISRC'] = tmm_df.loc[direct, 'ISRC']
-                df_copy.loc[index, 'Apple ID'] = tmm_df.loc[direct, 'Apple - id']
-                df_copy.loc[index, 'Matched'] = tmm_df.loc[direct, 'Track name']
-                continue
-
-            fallback = fallback_map.get(index)
-            if not isinstance(fallback, dict):
-                continue
-
-            isrc = fallback.get('ISRC')
-            if isinstance(isrc, str):
-                df_copy.loc[index, 'ISRC'] = isrc
-            
-            apple_id = fallback.get('ID')
-            if isinstance(apple_id, int):
-                df_copy.loc[index, 'Apple ID'] = apple_id
-        
+
+        # Only the integer labels are mapped
+        labels = df_copy.index
+        if pd.api.types.is_integer_dtype(labels.dtype):
+            is_int = np.ones(len(labels), dtype = 'bool')
+        else:
+            is_int = np.fromiter((isinstance(x, int) for x in labels), dtype = 'bool', count = len(labels))
+
+        direct_table = {k: v for k, v in direct_map.items() if isinstance(v, int) and (v in tmm_df.index)}
+        direct_rows, direct_targets = lookup(direct_table, np.zeros(len(labels), dtype = 'bool'))
+        direct_positions = tmm_df.index.get_indexer(direct_targets)
+        assign('ISRC', direct_rows, tmm_df['ISRC'].to_numpy()[direct_positions])
+        assign('Apple ID', direct_rows, tmm_df['Apple - id'].to_numpy()[direct_positions])
+        assign('Matched', direct_rows, tmm_df['Track name'].to_numpy()[direct_positions])
+
+        # The fallback only applies to the rows without a direct match
+        direct_hit = np.zeros(len(labels), dtype = 'bool')
+        direct_hit[direct_rows] = True
+        fallbacks = {k: v for k, v in fallback_map.items() if isinstance(v, dict)}
+        assign('ISRC', *lookup({k: v['ISRC'] for k, v in fallbacks.items() if isinstance(v.get('ISRC'), str)}, direct_hit))
+        assign('Apple ID', *lookup({k: v['ID'] for k, v in fallbacks.items() if isinstance(v.get('ID'), int)}, direct_hit))
+
         not_matched = df_copy['ISRC'].isna()
         return df_copy[~not_matched], df_copy[not_matched]
 
     @classmethod
-    def clean_tagged_excel(cls, path: str | os.PathLike[str]) -> pd.DataFrame:
+    def clean_tagged_excel(cls, path: str | os.PathLike[str], cache: bool | str | os.PathLike[str] = False) -> pd.DataFrame:
         '''
-        Clean the tagged Microsoft Excel file.
+        Clean the tagged Microsoft Excel file. The result is cached if `cache` is set, next to the file if it is `True`, or in the directory it names (see `cached_frame`).
         '''
 
-        def to_tuple(row: pd.Series) -> tuple:
-            return row['Sub Tag 1'], row['Sub Tag 2'], row['Sub Tag 3']
+        def clean() -> pd.DataFrame:
+            cols = ['Name', 'Artist', 'Year', 'Play Count', 'Total Time', 'Vocal', 'Language', 'Sub Genres', 'Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3']
+            tagged_df = pd.read_excel(path)
+
+            for col in cols:
+                if col not in tagged_df.columns:
+                    raise ValueError(f'The `{col}` column should present in the Microsoft Excel file.')
+
+            tagged_df = tagged_df[cols].rename(columns = {'Sub Genres': 'Genre'})
+            tagged_df['Total Time'] = pd.to_timedelta(tagged_df['Total Time'])
+            tagged_df['Tags'] = cls.zip_columns(tagged_df, ['Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3'])
+            tagged_df.drop(columns = ['Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3'], inplace = True)
+            return tagged_df
 
         if isinstance(path, str) and not path.endswith('xlsx'):
             raise ValueError('The `path` should point to a Microsoft Excel file.')
-        
-        cols = ['Name', 'Artist', 'Year', 'Play Count', 'Total Time', 'Vocal', 'Language', 'Sub Genres', 'Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3']
-        tagged_df = pd.read_excel(path)
 
-        for col in cols:
-            if col not in tagged_df.columns:
-                raise ValueError(f'The `{col}` column should present in the Microsoft Excel file.')
+        if not cache:
+            return clean()
+        return cls.cached_frame(path, 'tagged', clean, None if cache is True else cache)
+
+    @classmethod
+    def cached_frame(cls,
+                     path: str | bytes | os.PathLike[str],
+                     key: str,
+                     build: Callable[[], pd.DataFrame],
+                     directory: str | os.PathLike[str] | None = None) -> pd.DataFrame:
+        '''
+        Build a frame from a file, or load the saved one if the file's modification time and size and the cache version are unchanged. The frame is saved next to the file (`<path>.<key>.cache`), or in `directory` if specified, when possible; a frame that can't be saved is returned all the same.
+        '''
+
+        if not isinstance(path, (str, bytes, os.PathLike)) or not os.path.isfile(path):
+            return build()
+
+        source = os.path.abspath(os.fsdecode(path))
+        stat = os.stat(source)
+        meta = {'format': 'iTunes.Cache', 'version': cls.__cache_version__, 'key': key, 'path': source, 'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+        if directory is None:
+            cache_path = f'{source}.{key}.cache'
+        else:
+            # The files of the same name in different folders are told apart by their paths
+            digest = hashlib.sha256(source.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+            cache_path = os.path.join(directory, f'{os.path.basename(source)}.{digest}.{key}.cache')
+
+        if os.path.isfile(cache_path):
+            try:
+                with ColumnarFile(cache_path) as f:
+                    if f.meta == meta:
+                        return f.read()
+            except (ValueError, OSError):
+                pass
+
+        df = build()
+        temp_path = None
+        try:
+            if directory is not None:
+                os.makedirs(directory, exist_ok = True)
+
+            # The cache only appears once complete, so a failed dump leaves nothing behind
+            with tempfile.NamedTemporaryFile('wb', dir = os.path.dirname(cache_path), suffix = '.tmp', delete = False) as f:
+                temp_path = f.name
+                Codec.dump(df, f, meta)
+            os.replace(temp_path, cache_path)
+            temp_path = None
+
+        except (OSError, OverflowError, TypeError, ValueError):
+            # The cache is optional, e.g. the folder may be read-only or the cells may not be encodable
+            pass
+
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+        return df
+
+    @classmethod
+    def collation_keys(cls, s: pd.Series) -> pd.Series:
+        '''
+        Build the bytes sort keys of the strings, where the lower and upper case variants of a letter are adjacent (A, a, B, b, ...) and precede the other characters in code point order. Other values have missing keys.
+        '''
+
+        values = s.to_numpy(dtype = 'object')
+        is_str = np.fromiter((isinstance(x, str) for x in values), dtype = 'bool', count = len(values))
+        strings = values[is_str].tolist()
+
+        # Each character becomes a 4-byte big-endian code, so the bytes compare as the codes do
+        codes = np.frombuffer(''.join(strings).encode('utf-32-be', 'surrogatepass'), dtype = '>u4')
+        ascii = codes < 128
+        collated = (codes.astype('uint32') + cls.__letters__ + 1).astype('>u4')
+        collated[ascii] = cls.__ascii__[codes[ascii]]
+
+        buffer = collated.tobytes()
+        offsets = np.concatenate([[0], np.cumsum([len(x) for x in strings], dtype = 'int64') * 4]).tolist()
+        keys = np.full(len(values), nan, dtype = 'object')
+        keys[is_str] = [buffer[offsets[i]:offsets[i + 1]] for i in range(len(strings))]
+        return pd.Series(keys, index = s.index, dtype = 'object')
 
-        tagged_df = tagged_df[cols].rename(columns = {'Sub Genres': 'Genre'})
-        tagged_df['Total Time'] = pd.to_timedelta(tagged_df['Total Time'])
-        tagged_df['Tags'] = tagged_df.apply(to_tuple, axis = 1)
-        tagged_df.drop(columns = ['Sub Tag 1', 'Sub Tag 2', 'Sub Tag 3'], inplace = True)
-        return tagged_df
+    @classmethod
+    def copy_frame(cls, df: pd.DataFrame) -> pd.DataFrame:
+        '''
+        Copy the frame. Under the copy-on-write mode of pandas the copy is lazy, i.e. the columns are only copied once either side writes them.
+        '''
+
+        return df.copy(deep = not cls.copy_on_write())
+
+    @classmethod
+    def copy_on_write(cls) -> bool:
+        '''
+        Whether the copy-on-write mode of pandas is on, e.g. by `pd.set_option('mode.copy_on_write', True)`.
+        '''
+
+        return pd.get_option('mode.copy_on_write') is True
 
     @classmethod
     def custom_sort_values(cls, s: pd.Series[str], ascending: bool = True) -> pd.Series[str]:
@@ -100,25 +226,8 @@ class Utils:
         Sort values ascending/decending-ly, but keep the lower and upper case variants adjacent to each other.
         '''
 
-        custom_order = {ch: i for i, ch in enumerate(
-            sum(([u, l] for u, l in zip(string.ascii_uppercase, string.ascii_lowercase)), [])
-        )}
-
-        def custom_sort_key(value: str | float | None):
-            if not isinstance(value, str):
-                return (float('inf'), value)
-
-            key = []
-            for ch in value:
-                if ch in custom_order:
-                    key.append((0, custom_order[ch]))
-                else:
-                    key.append((1, ord(ch)))
-            
-            return key
-        
         sorted_series = s.sort_values(
-            key = lambda x: x.map(custom_sort_key),
+            key = cls.collation_keys,
             ascending = ascending,
             ignore_index = True
         )
@@ -137,100 +246,43 @@ class Utils:
         if s.dtype != 'object':
             return str(s.dtype)
         
-        types: pd.Series[int] = s.apply(type).value_counts()    # type: ignore
-        if len(types) == 1:
-            return str(types.index[0])
+        # Stops at the first element of another type
+        values = s.to_numpy()
+        first = type(values[0])
+        if next(filter(partial(is_not, first), map(type, values)), None) is None:
+            return str(first)
         else:
             return '<class \'mixed\'>'
 
     @classmethod
     def match_tmm_data(cls,
-                       path: str | os.PathLike[str],
+                       path: str | os.PathLike[str] | TMMIndex,
                        df: pd.DataFrame,
                        escape_artists: list[str] | None = None) -> tuple[pd.DataFrame, pd.DataFrame]:
         '''
-        Matches the metadata generated by Tune My Music.
+        Matches the metadata generated by Tune My Music. The data can be either the CSV file or its `TMMIndex`, which is reused across calls.
         '''
 
         if ('Name' not in df.columns) or ('Artist' not in df.columns):
             raise ValueError('The `Name` and `Artist` columns should present in the columns.')
 
-        if isinstance(path, str) and not path.endswith('csv'):
-            raise ValueError('The `path` should point to a CSV file.')
+        index = cls._tmm_index(path, escape_artists)
 
-        if escape_artists is None:
-            escape_artists = []
-
-        def protect_phrases(text):
-            mapping = {}
-            for i, phrase in enumerate(escape_artists):
-                key = f'__ESC_{i}__'
-                mapping[key] = phrase
-                text = text.replace(phrase, key)
-            return text, mapping
-
-        def restore_phrases(parts, mapping):
-            out = []
-            for p in parts:
-                for k, v in mapping.items():
-                    p = p.replace(k, v)
-                out.append(p)
-            return out
-
-        def normalize_artists(text):
-            if pd.isna(text):
-                return frozenset()
-            text, mapping = protect_phrases(text)
-            parts = [p.strip().lower() for p in text.split(',') if p.strip()]
-            parts = restore_phrases(parts, mapping)
-            return frozenset(parts)
-
-        def normalize_artists_tmm(text):
-            if pd.isna(text):
-                return frozenset()
-            text, mapping = protect_phrases(text)
-            text = text.replace(' & ', ',')
-            parts = [p.strip().lower() for p in text.split(',') if p.strip()]
-            parts = restore_phrases(parts, mapping)
-            return frozenset(parts)
-
-        def normalize_title(text):
-            if pd.isna(text):
-                return ''
-            return ' '.join(text.lower().split())
+        with Profiler.stage('normalize', len(df)):
+            df_copy = df.copy()
+            df_copy['_norm_title'] = TMMIndex.normalize_titles(df_copy['Name'])
+            df_copy['_norm_artist'] = TMMIndex.normalize_artists(df_copy['Artist'], index.escape_artists)
 
-        df_copy = df.copy()
-        df_copy['_norm_title'] = df_copy['Name'].map(normalize_title)
-        df_copy['_norm_artist'] = df_copy['Artist'].map(normalize_artists)
-
-        tmm = pd.read_csv(path).rename(columns = {'Track name': 'Name', 'Artist name': 'Artist'}, errors = 'ignore')
-        tmm['_norm_title'] = tmm['Name'].map(normalize_title)
-        tmm['_norm_artist'] = tmm['Artist'].map(normalize_artists_tmm)
-
-        tmm_grouped = (
-            tmm
-            .groupby(['_norm_title', '_norm_artist'])
-            .agg({
-                'ISRC': list,
-                'Apple - id': list
-            })
-            .reset_index()
-        )
-
-        merged = df_copy.merge(
-            tmm_grouped,
-            how = 'left',
-            left_on = ['_norm_title', '_norm_artist'],
-            right_on = ['_norm_title', '_norm_artist']
-        )
+        with Profiler.stage('join', len(df_copy)):
+            merged = df_copy.merge(
+                index.grouped,
+                how = 'left',
+                left_on = ['_norm_title', '_norm_artist'],
+                right_on = ['_norm_title', '_norm_artist']
+            )
 
         # Avoid ambiguous matches
-        def is_valid_match(row):
-            if isinstance(row['ISRC'], list):
-                return len(row['ISRC']) == 1
-            return False
-
-        matched_mask = merged.apply(is_valid_match, axis=1)
+        matched_mask = merged['ISRC'].map(lambda x: isinstance(x, list) and len(x) == 1).astype(bool)
         merged.rename(columns = {'Apple - id': 'Apple ID'}, inplace = True)
 
         matched_df = merged[matched_mask].copy()
@@ -275,6 +327,20 @@ class Utils:
         return value
 
 
+    @classmethod
+    def rank_tmm_candidates(cls,
+                            path: str | os.PathLike[str] | TMMIndex,
+                            df: pd.DataFrame,
+                            escape_artists: list[str] | None = None,
+                            limit: int = 3,
+                            score_cutoff: float = 80,
+                            workers: int = -1) -> pd.DataFrame:
+        '''
+        Rank the Tune My Music candidates of the (unmatched) tracks, from the exact matches to the fuzzy ones, with their confidence. See `TMMIndex.candidates`.
+        '''
+
+        return cls._tmm_index(path, escape_artists).candidates(df, limit = limit, score_cutoff = score_cutoff, workers = workers)
+
     @classmethod
     def read_yaml(cls,
                   path: str | bytes | os.PathLike[str]) -> Any:
@@ -282,7 +348,31 @@ class Utils:
         Read the YAML file.
         '''
 
+        # The LibYAML loader is much faster on large maps, when available
         with open(path, 'r', encoding = 'utf-8') as f:
-            yaml_file = yaml.safe_load(f)
+            yaml_file = yaml.load(f, Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+        return yaml_file
+
+    @classmethod
+    def zip_columns(cls, df: pd.DataFrame, columns: list[str]) -> pd.Series:
+        '''
+        Combine the columns into a series of tuples.
+        '''
 
-        return yaml_file
\ No newline at end of file
+        return pd.Series(list(zip(*(df[col].tolist() for col in columns))), index = df.index, dtype = 'object')
+
+    @classmethod
+    def _tmm_index(cls, path: str | os.PathLike[str] | TMMIndex, escape_artists: list[str] | None) -> TMMIndex:
+        '''
+        Resolve the Tune My Music index of the CSV file, or verify the given index.
+        '''
+
+        if isinstance(path, TMMIndex):
+            if escape_artists is not None and list(escape_artists) != path.escape_artists:
+                raise ValueError('The index was built with other `escape_artists`.')
+            return path
+
+        if isinstance(path, str) and not path.endswith('csv'):
+            raise ValueError('The `path` should point to a CSV file.')
+        return TMMIndex.from_csv(path, escape_artists)
@@ -0,0 +1,51 @@
+import csv
+
+import pandas as pd
+import pytest
+
+from iTunes import PlaylistAccessor
+
+HEADER = ['Name', 'Artist', 'Plays', 'Year', 'Size']
+
+
+def write_export(path, rows):
+    # iTunes exports UTF-16 with CRLF line endings
+    with open(path, 'w', encoding = 'utf-16', newline = '') as f:
+        csv.writer(f, delimiter = '\t', lineterminator = '\r\n').writerows([HEADER] + rows)
+
+
+def expected_frame(path):
+    # As the csv module reads the file, with the rows padded to the widest one
+    with open(path, 'r', encoding = 'utf-16') as f:
+        rows = list(csv.reader(f, delimiter = '\t'))
+    width = max(len(row) for row in rows)
+    header = rows[0] + [f'Extra_{i + 1}' for i in range(len(rows[0]), width)]
+    return pd.DataFrame([[cell.strip() for cell in row] + [''] * (width - len(row)) for row in rows[1:]], columns = header)
+
+
+@pytest.fixture
+def export(tmp_path):
+    rows = [[f'Song {i}', f'Artist {i}', str(i), '2020', '1000'] for i in range(40)]
+    rows[5][0] = 'Line\r\nBreak'
+    rows[30] = ['x', 'y', '1', '2', '3', 'extra1', 'extra2']
+    path = tmp_path / 'playlist.txt'
+    write_export(path, rows)
+    return path
+
+
+@pytest.mark.parametrize('chunksize', [7, 10, 15, 30, 31, 10000])
+def test_wide_row_at_chunk_boundary(export, chunksize):
+    expected = expected_frame(export)
+    accessor = PlaylistAccessor(export, chunksize = chunksize)
+
+    df = accessor.to_dataframe()
+    pd.testing.assert_frame_equal(df, expected)
+
+    chunked = pd.concat(list(accessor.chunks())).fillna('')
+    assert chunked.loc[30].tolist() == ['x', 'y', '1', '2', '3', 'extra1', 'extra2']
+    pd.testing.assert_frame_equal(chunked.reset_index(drop = True), expected)
+
+
+def test_embedded_newline(export):
+    df = PlaylistAccessor(export, chunksize = 10).to_dataframe()
+    assert df.loc[5, 'Name'] == 'Line\nBreak'